@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from audit.sink import BufferedAuditSink, get_audit_sink
+
+
+class Command(BaseCommand):
+    help = "Writes audit entries spooled while the database was unavailable"
+
+    def handle(self, *args, **options):
+        sink = get_audit_sink()
+        if not isinstance(sink, BufferedAuditSink):
+            self.stdout.write("AUDIT_SINK is not 'buffered'; nothing to replay")
+            return
+
+        replayed = sink.replay_spool()
+        self.stdout.write(f"Replayed {replayed} audit entries from {sink.spool_path}")
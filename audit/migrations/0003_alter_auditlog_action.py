@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('audit', '0002_auditlog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditlog',
+            name='action',
+            field=models.CharField(choices=[('ACCESS_EHR', 'Access EHR Record'), ('ACCESS_REPORT', 'Access Medical Report'), ('ACCESS_LAB', 'Access Lab Result'), ('ACCESS_NOT_MODIFIED', 'Cached Records Revalidated'), ('EMERGENCY_TOKEN_ISSUED', 'Emergency Token Issued'), ('EMERGENCY_TOKEN_USED', 'Emergency Token Used'), ('EMERGENCY_TOKEN_EXPIRED', 'Emergency Token Expired'), ('LOGIN', 'User Login'), ('LOGOUT', 'User Logout')], max_length=50),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from authentication.models import User
 
 
@@ -8,6 +9,9 @@ class AuditLog(models.Model):
         ('ACCESS_EHR', 'Access EHR Record'),
         ('ACCESS_REPORT', 'Access Medical Report'),
         ('ACCESS_LAB', 'Access Lab Result'),
+        ('ACCESS_NOT_MODIFIED', 'Cached Records Revalidated'),
+        ('ACCESS_CHECK', 'Access Decisions Checked'),
+        ('SEARCH_RECORDS', 'Clinical Records Searched'),
         ('EMERGENCY_TOKEN_ISSUED', 'Emergency Token Issued'),
         ('EMERGENCY_TOKEN_USED', 'Emergency Token Used'),
         ('EMERGENCY_TOKEN_EXPIRED', 'Emergency Token Expired'),
@@ -27,11 +31,15 @@ class AuditLog(models.Model):
     access_granted = models.BooleanField(default=False)
     is_emergency = models.BooleanField(default=False)
     details = models.JSONField(default=dict)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens, not when a buffered sink writes it
+    timestamp = models.DateTimeField(default=timezone.now)
     ip_address = models.CharField(max_length=50, blank=True, null=True)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['-timestamp'], name='audit_timestamp_idx'),
+        ]
 
     def __str__(self):
         status = "✅ GRANTED" if self.access_granted else "❌ DENIED"
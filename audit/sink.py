@@ -0,0 +1,414 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialized
+    fcntl = None
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, transaction
+
+from engine.timing import timed
+from .models import AuditLog
+
+
+logger = logging.getLogger(__name__)
+
+# Columns persisted for every audit entry (and written to the spool)
+SPOOL_FIELDS = (
+    'user_id', 'action', 'resource_type', 'resource_id',
+    'access_granted', 'is_emergency', 'details', 'timestamp', 'ip_address',
+)
+
+
+def entry_to_row(entry: AuditLog) -> dict:
+    row = {name: getattr(entry, name) for name in SPOOL_FIELDS}
+    row['timestamp'] = entry.timestamp.isoformat()
+    return row
+
+
+def row_to_entry(row: dict) -> AuditLog:
+    row = dict(row)
+    row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+    return AuditLog(**row)
+
+
+class DirectAuditSink:
+    """
+    Writes audit entries immediately on the calling thread
+    """
+
+    def log(self, **fields):
+        self.log_many([AuditLog(**fields)])
+
+    @timed('audit')
+    def log_many(self, entries):
+        entries = list(entries)
+        if entries:
+            AuditLog.objects.bulk_create(entries)
+
+    def flush(self):
+        pass
+
+    def stats(self) -> dict:
+        return {'mode': 'direct'}
+
+
+class BufferedAuditSink:
+    """
+    Write-behind audit sink.
+
+    Entries are queued in memory and a background thread persists them
+    with bulk_create once the queue reaches batch_size entries or the
+    oldest entry is older than flush_interval seconds. If the database
+    rejects a batch it is appended to a JSON-lines spool file, which is
+    replayed before the next successful flush (including after restart).
+    With background=False nothing is written until flush() is called.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+        max_queue_size: int = 10000,
+        spool_path=None,
+        background: bool = True,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.spool_path = str(spool_path) if spool_path else None
+        self.background = background
+
+        self._queue = deque()
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._closed = False
+        self._replay_pending = True
+
+        self.counters = {
+            'enqueued': 0,
+            'flushed': 0,
+            'flushes': 0,
+            'spooled': 0,
+            'replayed': 0,
+            'rejected': 0,
+            'dropped': 0,
+        }
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    # ── Producer side ──
+
+    def log(self, **fields):
+        self.log_many([AuditLog(**fields)])
+
+    @timed('audit')
+    def log_many(self, entries):
+        entries = list(entries)
+        if not entries:
+            return
+
+        overflow = []
+        with self._lock:
+            room = self.max_queue_size - len(self._queue)
+            if room < len(entries):
+                overflow = entries[max(room, 0):]
+                entries = entries[:max(room, 0)]
+            if entries and not self._queue:
+                self._oldest = time.monotonic()
+            self._queue.extend(entries)
+            self.counters['enqueued'] += len(entries)
+            depth = len(self._queue)
+
+        if overflow:
+            # Queue is full: keep the events on disk rather than block
+            self._spool(overflow)
+
+        self._ensure_thread()
+        if depth >= self.batch_size:
+            self._wakeup.set()
+
+    # ── Consumer side ──
+
+    def _ensure_thread(self):
+        if not self.background:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='audit-sink', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush(only_if_due=True)
+            except Exception:
+                logger.exception("Audit sink flush failed")
+            finally:
+                close_old_connections()
+
+    def _take_batch(self, only_if_due: bool) -> list:
+        with self._lock:
+            if not self._queue:
+                return []
+            if only_if_due:
+                age = time.monotonic() - self._oldest
+                if len(self._queue) < self.batch_size and age < self.flush_interval:
+                    return []
+            batch = [
+                self._queue.popleft()
+                for _ in range(min(self.batch_size, len(self._queue)))
+            ]
+            self._oldest = time.monotonic() if self._queue else None
+            return batch
+
+    def flush(self, only_if_due: bool = False):
+        """
+        Persists queued entries. With only_if_due=True nothing is written
+        until the size or age threshold has been reached.
+        """
+        with self._flush_lock:
+            if self._replay_pending:
+                self.replay_spool()
+
+            while True:
+                batch = self._take_batch(only_if_due)
+                if not batch:
+                    return
+                started = time.perf_counter()
+                try:
+                    AuditLog.objects.bulk_create(batch)
+                except DatabaseError:
+                    logger.warning(
+                        "Audit database unavailable, spooling %d entries",
+                        len(batch)
+                    )
+                    self._spool(batch)
+                    self._replay_pending = True
+                    return
+
+                elapsed = time.perf_counter() - started
+                self.counters['flushed'] += len(batch)
+                self.counters['flushes'] += 1
+                self.last_flush_seconds = elapsed
+                self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+                self.total_flush_seconds += elapsed
+                only_if_due = False
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self.flush()
+
+    # ── Spool ──
+
+    def _spool(self, entries):
+        if not self.spool_path:
+            self.counters['dropped'] += len(entries)
+            logger.error("No audit spool configured, dropped %d entries", len(entries))
+            return
+        try:
+            with (
+                self._spool_lock, self._file_lock(),
+                open(self.spool_path, 'a', encoding='utf-8') as spool
+            ):
+                for entry in entries:
+                    spool.write(json.dumps(entry_to_row(entry)) + '\n')
+                spool.flush()
+                os.fsync(spool.fileno())
+            self.counters['spooled'] += len(entries)
+            self._replay_pending = True
+        except OSError:
+            self.counters['dropped'] += len(entries)
+            logger.exception("Could not write audit spool, dropped %d entries", len(entries))
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Exclusive lock shared by every process using this spool path
+        (workers and replay_audit_spool)
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(self.spool_path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def replay_spool(self) -> int:
+        """
+        Moves spooled entries into the database. Returns how many
+        entries were replayed.
+        """
+        self._replay_pending = False
+        if not self.spool_path:
+            return 0
+
+        # Held throughout, so no other process inserts the same file
+        with self._spool_lock, self._file_lock():
+            return self._replay()
+
+    def _replay(self) -> int:
+        replaying = self.spool_path + '.replaying'
+        replayed = 0
+        # A .replaying file left by an interrupted replay goes first,
+        # then the live spool
+        while True:
+            if not os.path.exists(replaying):
+                if not os.path.exists(self.spool_path):
+                    return replayed
+                os.replace(self.spool_path, replaying)
+            count = self._replay_file(replaying)
+            if count is None:
+                return replayed
+            replayed += count
+
+    def _replay_file(self, path):
+        """
+        Inserts and removes one spool file. Returns how many entries
+        were replayed, or None if the database failed and the file was
+        left for the next replay.
+        """
+        entries, rejected = [], []
+        with open(path, encoding='utf-8', errors='replace') as spool:
+            for line in spool:
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(row_to_entry(json.loads(line)))
+                except (ValueError, TypeError, KeyError):
+                    # e.g. a line torn by a crash mid-write
+                    rejected.append(line if line.endswith('\n') else line + '\n')
+
+        try:
+            refused = self._insert(entries)
+        except DatabaseError:
+            # Leave the file in place; it is picked up on the next replay
+            self._replay_pending = True
+            return None
+        rejected += [json.dumps(entry_to_row(entry)) + '\n' for entry in refused]
+
+        if rejected:
+            # Kept for inspection instead of failing every later replay
+            with open(self.spool_path + '.rejected', 'a', encoding='utf-8') as out:
+                out.writelines(rejected)
+            logger.error(
+                "Set aside %d unusable audit spool lines in %s.rejected",
+                len(rejected), self.spool_path
+            )
+            self.counters['rejected'] += len(rejected)
+
+        os.remove(path)
+        replayed = len(entries) - len(refused)
+        self.counters['replayed'] += replayed
+        return replayed
+
+    def _insert(self, entries) -> list:
+        """
+        Inserts entries all or nothing, so a retry never inserts them
+        twice. Returns the entries the database refused, which are left
+        out instead of blocking the spool.
+        """
+        # SQLite checks foreign keys only at commit, so entries of users
+        # deleted since they were spooled are found beforehand
+        user_ids = {entry.user_id for entry in entries if entry.user_id is not None}
+        users = set(
+            AuditLog._meta.get_field('user').related_model._base_manager
+            .filter(pk__in=user_ids).values_list('pk', flat=True)
+        ) if user_ids else set()
+        kept, refused = [], []
+        for entry in entries:
+            dangling = entry.user_id is not None and entry.user_id not in users
+            (refused if dangling else kept).append(entry)
+        entries = kept
+
+        try:
+            with transaction.atomic():
+                AuditLog.objects.bulk_create(entries, batch_size=self.batch_size)
+            return refused
+        except IntegrityError:
+            pass
+
+        # Row by row, each in a savepoint, to find the offending rows
+        with transaction.atomic():
+            for entry in entries:
+                try:
+                    with transaction.atomic():
+                        AuditLog.objects.bulk_create([entry])
+                except IntegrityError:
+                    refused.append(entry)
+        return refused
+
+    # ── Observability ──
+
+    def stats(self) -> dict:
+        with self._lock:
+            depth = len(self._queue)
+            oldest = self._oldest
+        flushes = self.counters['flushes']
+        return {
+            'mode': 'buffered',
+            'queue_depth': depth,
+            'oldest_entry_age_seconds': (
+                round(time.monotonic() - oldest, 3) if oldest else 0.0
+            ),
+            **self.counters,
+            'last_flush_ms': round(self.last_flush_seconds * 1000, 3),
+            'max_flush_ms': round(self.max_flush_seconds * 1000, 3),
+            'avg_flush_ms': round(
+                self.total_flush_seconds * 1000 / flushes, 3
+            ) if flushes else 0.0,
+        }
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def get_audit_sink():
+    """
+    Returns the process-wide sink selected by settings.AUDIT_SINK
+    """
+    mode = getattr(settings, 'AUDIT_SINK', 'direct')
+    sink = _sinks.get(mode)
+    if sink is not None:
+        return sink
+
+    with _sinks_lock:
+        if mode not in _sinks:
+            if mode == 'buffered':
+                sink = BufferedAuditSink(
+                    batch_size=getattr(settings, 'AUDIT_FLUSH_BATCH_SIZE', 200),
+                    flush_interval=getattr(settings, 'AUDIT_FLUSH_INTERVAL_SECONDS', 1.0),
+                    max_queue_size=getattr(settings, 'AUDIT_MAX_QUEUE_SIZE', 10000),
+                    spool_path=getattr(settings, 'AUDIT_SPOOL_PATH', None),
+                )
+                atexit.register(sink.close)
+            else:
+                sink = DirectAuditSink()
+            _sinks[mode] = sink
+        return _sinks[mode]
@@ -1,3 +1,183 @@
+import os
+import tempfile
+import threading
+from unittest import skipIf
+from unittest import mock
+
+from django.db import DatabaseError, IntegrityError
 from django.test import TestCase
 
-# Create your tests here.
+from authentication.models import User
+from .models import AuditLog
+from .sink import BufferedAuditSink, fcntl
+
+
+class BufferedAuditSinkTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('auditor')
+        self.spool_dir = tempfile.TemporaryDirectory()
+        self.spool_path = os.path.join(self.spool_dir.name, 'spool.jsonl')
+        self.sink = BufferedAuditSink(
+            batch_size=3, spool_path=self.spool_path, background=False
+        )
+
+    def tearDown(self):
+        self.spool_dir.cleanup()
+
+    def log(self, count, anonymous=False):
+        for i in range(count):
+            self.sink.log(
+                user=None if anonymous else self.user, action='ACCESS_EHR', resource_type='ehr',
+                resource_id=str(i), access_granted=True,
+            )
+
+    def test_flush_waits_for_batch_size(self):
+        self.log(2)
+        self.sink.flush(only_if_due=True)
+        self.assertEqual(AuditLog.objects.count(), 0)
+
+        self.log(1)
+        self.sink.flush(only_if_due=True)
+        self.assertEqual(AuditLog.objects.count(), 3)
+        self.assertEqual(self.sink.stats()['queue_depth'], 0)
+
+    def test_database_failure_spools_and_replays(self):
+        self.log(4)
+        with mock.patch.object(
+            AuditLog.objects, 'bulk_create', side_effect=DatabaseError
+        ):
+            self.sink.flush()
+        self.assertEqual(AuditLog.objects.count(), 0)
+        self.assertEqual(self.sink.stats()['spooled'], 3)
+
+        # A fresh sink (as after a restart) replays the spool first
+        restarted = BufferedAuditSink(
+            batch_size=3, spool_path=self.spool_path, background=False
+        )
+        restarted.flush()
+        self.sink.flush()
+        self.assertEqual(AuditLog.objects.count(), 4)
+        self.assertEqual(restarted.stats()['replayed'], 3)
+        self.assertFalse(os.path.exists(self.spool_path))
+        self.assertEqual(
+            sorted(AuditLog.objects.values_list('resource_id', flat=True)),
+            ['0', '1', '2', '3']
+        )
+
+    def test_full_queue_spools_overflow(self):
+        # Past the replay a new sink starts with
+        self.sink.flush()
+        self.sink.max_queue_size = 2
+        self.log(3)
+        stats = self.sink.stats()
+        self.assertEqual(stats['queue_depth'], 2)
+        self.assertEqual(stats['spooled'], 1)
+
+        # The overflow is replayed by the next flush, not after a restart
+        self.sink.flush()
+        self.assertEqual(AuditLog.objects.count(), 3)
+        self.assertFalse(os.path.exists(self.spool_path))
+
+    @skipIf(fcntl is None, "Spool file locking needs fcntl")
+    def test_replay_waits_for_other_replays(self):
+        # The replay thread cannot see the user of the test transaction
+        self.log(3, anonymous=True)
+        with mock.patch.object(
+            AuditLog.objects, 'bulk_create', side_effect=DatabaseError
+        ):
+            self.sink.flush()
+
+        # Another worker (a separate sink on the same path) replaying
+        other = BufferedAuditSink(spool_path=self.spool_path, background=False)
+        inserted = []
+        with mock.patch.object(
+            AuditLog.objects, 'bulk_create',
+            side_effect=lambda entries, **kwargs: inserted.append(entries)
+        ):
+            with other._file_lock():
+                replay = threading.Thread(target=self.sink.replay_spool)
+                replay.start()
+                replay.join(0.2)
+                self.assertTrue(replay.is_alive())
+                self.assertEqual(inserted, [])
+            replay.join()
+        self.assertEqual(len(inserted), 1)
+        self.assertEqual(other.replay_spool(), 0)
+
+    def spool(self, count):
+        self.log(count)
+        with mock.patch.object(
+            AuditLog.objects, 'bulk_create', side_effect=DatabaseError
+        ):
+            self.sink.flush()
+
+    def test_replay_sets_aside_torn_lines(self):
+        self.spool(3)
+        with open(self.spool_path, 'a', encoding='utf-8') as spool:
+            spool.write('{"user_id": 1, "action": "ACC')
+
+        self.assertEqual(self.sink.replay_spool(), 3)
+        self.assertEqual(AuditLog.objects.count(), 3)
+        self.assertEqual(self.sink.stats()['rejected'], 1)
+        with open(self.spool_path + '.rejected', encoding='utf-8') as rejected:
+            self.assertEqual(rejected.read(), '{"user_id": 1, "action": "ACC\n')
+        self.assertFalse(os.path.exists(self.spool_path + '.replaying'))
+
+    def test_failed_replay_inserts_nothing(self):
+        self.spool(3)
+        self.sink.batch_size = 2
+        bulk_create = AuditLog.objects.bulk_create
+
+        def fail_after_first_batch(entries, batch_size=None):
+            bulk_create(entries[:batch_size])
+            raise DatabaseError
+
+        with mock.patch.object(
+            AuditLog.objects, 'bulk_create', side_effect=fail_after_first_batch
+        ):
+            self.assertEqual(self.sink.replay_spool(), 0)
+        self.assertEqual(AuditLog.objects.count(), 0)
+
+        self.assertEqual(self.sink.replay_spool(), 3)
+        self.assertEqual(AuditLog.objects.count(), 3)
+
+    def test_leftover_replay_file_and_spool_are_both_replayed(self):
+        self.spool(2)
+        os.replace(self.spool_path, self.spool_path + '.replaying')
+        self.spool(1)
+
+        self.assertEqual(self.sink.replay_spool(), 3)
+        self.assertEqual(AuditLog.objects.count(), 3)
+        self.assertFalse(os.path.exists(self.spool_path))
+        self.assertFalse(os.path.exists(self.spool_path + '.replaying'))
+
+    def test_refused_rows_are_set_aside(self):
+        self.spool(3)
+        # Deleted since the entries were spooled
+        gone = User.objects.create_user('gone')
+        self.sink.log(user=gone, action='ACCESS_EHR', resource_id='gone')
+        self.spool(0)
+        gone.delete()
+
+        self.assertEqual(self.sink.replay_spool(), 3)
+        self.assertEqual(self.sink.stats()['rejected'], 1)
+        with open(self.spool_path + '.rejected', encoding='utf-8') as rejected:
+            self.assertIn('"resource_id": "gone"', rejected.read())
+
+        # Any other constraint violation: row by row
+        self.spool(3)
+        bulk_create = AuditLog.objects.bulk_create
+
+        def refuse_second(entries, **kwargs):
+            if len(entries) > 1 or entries[0].resource_id == '1':
+                raise IntegrityError
+            return bulk_create(entries, **kwargs)
+
+        with mock.patch.object(
+            AuditLog.objects, 'bulk_create', side_effect=refuse_second
+        ):
+            self.assertEqual(self.sink.replay_spool(), 2)
+        self.assertEqual(self.sink.stats()['rejected'], 2)
+        self.assertEqual(AuditLog.objects.count(), 5)
+        self.assertFalse(os.path.exists(self.spool_path))
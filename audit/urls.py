@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import AuditLogView
+from .views import AuditLogView, AuditSinkStatsView
 
 urlpatterns = [
     path('logs/', AuditLogView.as_view(), name='audit_logs'),
+    path('sink/', AuditSinkStatsView.as_view(), name='audit_sink_stats'),
 ]
\ No newline at end of file
@@ -2,13 +2,14 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from .models import AuditLog
+from .sink import get_audit_sink
 
 
 class AuditLogView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        logs = AuditLog.objects.all()[:50]
+        logs = AuditLog.objects.select_related('user')[:50]
         data = []
         for log in logs:
             data.append({
@@ -22,4 +23,14 @@ class AuditLogView(APIView):
                 'timestamp': log.timestamp,
                 'details': log.details,
             })
-        return Response({'logs': data})
\ No newline at end of file
+        return Response({'logs': data})
+
+
+class AuditSinkStatsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Queue depth, flush latency and spool counters of the audit sink
+        """
+        return Response(get_audit_sink().stats())
@@ -34,11 +34,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'engine.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'engine.middleware.AttributeCacheMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -87,6 +89,93 @@ SIMPLE_JWT = {
 
 EMERGENCY_TOKEN_VALIDITY_MINUTES = 10
 
+# Per-process cache of valid EATs (entries never outlive expires_at).
+# Each hit re-reads the token's status and scope by primary key so that
+# revocations by other workers apply on the next request; turn that off
+# only when a single process serves requests.
+EMERGENCY_TOKEN_CACHE_SIZE = 4096
+EMERGENCY_TOKEN_CACHE_TTL_SECONDS = 60
+EMERGENCY_TOKEN_CACHE_REVALIDATE = True
+
+# 'uuid' issues opaque token ids checked against the database, 'signed'
+# also issues HMAC-signed tokens that are checked without a query
+EMERGENCY_TOKEN_FORMAT = 'uuid'
+
+# key id -> secret; the first key signs, all of them verify. To rotate,
+# put the new key first and drop the old one once its tokens have expired.
+EMERGENCY_TOKEN_SIGNING_KEYS = {'k1': SECRET_KEY}
+
+# How often workers re-read revoked tokens for signed token checks
+EMERGENCY_TOKEN_REVOCATION_REFRESH_SECONDS = 5
+
+# Marks lapsed tokens expired from a thread in each process every this
+# many seconds; 0 leaves it to `manage.py expire_tokens` (e.g. from cron)
+EMERGENCY_TOKEN_SWEEP_INTERVAL_SECONDS = 0
+
+# 'direct' adds each token use to its row at once; 'buffered' sums uses
+# in memory and adds them every EMERGENCY_TOKEN_USAGE_FLUSH_SECONDS
+EMERGENCY_TOKEN_USAGE = 'direct'
+EMERGENCY_TOKEN_USAGE_FLUSH_SECONDS = 1.0
+
+# 'standard' evaluates rules per call, 'compiled' uses the decision table,
+# 'store' uses the active PolicySet (decision table when none is active)
+POLICY_EVALUATOR_MODE = 'store'
+
+# How often workers check for a newly activated PolicySet
+POLICY_RELOAD_INTERVAL_SECONDS = 5
+
+# Decisions memoised by attribute fingerprint (0 disables the cache)
+POLICY_DECISION_CACHE_SIZE = 4096
+
+# Cross-request cache of resolved user attributes
+USER_ATTRIBUTE_CACHE_SIZE = 1024
+USER_ATTRIBUTE_CACHE_TTL_SECONDS = 300
+
+# Keyset-paginated listings (patients and per-patient records)
+LISTING_PAGE_SIZE = 100
+LISTING_MAX_PAGE_SIZE = 1000
+
+# Serialize with generated per-serializer functions instead of DRF
+# field introspection (same output)
+FAST_SERIALIZERS = True
+
+# Rows read, evaluated and audited per chunk by ?stream= responses
+STREAM_CHUNK_SIZE = 2000
+
+# Most patients accepted by one POST /api/ehr/patients/batch/
+BATCH_MAX_PATIENTS = 50
+
+# Patient search (SQLite FTS5): most results per query, and most
+# matches ranked per query so broad terms stay cheap
+PATIENT_SEARCH_MAX_RESULTS = 100
+PATIENT_SEARCH_CANDIDATES = 500
+
+# Clinical record search: most results per page, and most matching
+# records per type and query considered for ranking
+CLINICAL_SEARCH_MAX_RESULTS = 100
+CLINICAL_SEARCH_CANDIDATES = 1000
+
+# ── Audit pipeline ──
+# 'direct' writes on the request thread. 'buffered' queues entries and
+# bulk-inserts them from a background thread; it is opt-in because
+# entries queued since the last flush (up to AUDIT_FLUSH_INTERVAL_SECONDS,
+# or AUDIT_MAX_QUEUE_SIZE entries) are lost if the process is killed
+# before it can exit cleanly
+AUDIT_SINK = 'direct'
+AUDIT_FLUSH_BATCH_SIZE = 200
+AUDIT_FLUSH_INTERVAL_SECONDS = 1.0
+AUDIT_MAX_QUEUE_SIZE = 10000
+AUDIT_SPOOL_PATH = BASE_DIR / 'audit_spool.jsonl'
+
+# ── Request instrumentation ──
+# Server-Timing header with per-phase durations and SQL statistics.
+# The sample rate is the fraction of requests timed; SERVER_TIMING_LOG
+# also emits one JSON line per timed request on the 'engine.timing' logger.
+# Off by default; turn on while profiling
+SERVER_TIMING_ENABLED = False
+SERVER_TIMING_SAMPLE_RATE = 1.0
+SERVER_TIMING_LOG = False
+
 CORS_ALLOW_ALL_ORIGINS = True
 
 LANGUAGE_CODE = 'en-us'
@@ -10,6 +10,11 @@ urlpatterns = [
     path('api/ehr/', include('ehr.urls')),
     path('api/emergency/', include('emergency.urls')),
     path('api/audit/', include('audit.urls')),
+    path('api/engine/', include('engine.urls')),
+
+    # Async variants, for ASGI deployments
+    path('api/async/ehr/', include('ehr.async_urls')),
+    path('api/async/emergency/', include('emergency.async_urls')),
 
     # Frontend URLs
     path('', views.login_view, name='login'),
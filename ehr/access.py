@@ -0,0 +1,304 @@
+from operator import attrgetter
+
+from .models import RESOURCE_MODELS
+from .fast_serializers import get_serializer
+from .listing import ListingError, keyset, page
+from .streaming import (
+    stream_response, json_document, ndjson_lines, iter_decided
+)
+from engine.query_compiler import model_access_fields
+from engine.timing import timed
+from emergency.models import EmergencyAccessToken, token_covers
+from emergency.signed_tokens import check_signed_token, is_signed
+from emergency.token_cache import token_cache, token_key
+
+
+@timed('eat')
+def check_emergency_token(user, patient_id, token_id, *resource_types):
+    """
+    Helper to check if a valid EAT exists whose scope covers every one
+    of resource_types. Signed tokens are checked without a query; valid
+    opaque tokens are kept in token_cache so that repeat requests skip
+    the query.
+    """
+    if not token_id:
+        return False
+    if is_signed(token_id):
+        return check_signed_token(token_id, user.pk, patient_id, *resource_types)
+    try:
+        key = token_key(token_id, user.pk, patient_id)
+    except ValueError:
+        key = None
+    cached = token_cache.get(key) if key is not None else None
+    if cached is not None:
+        return token_covers(cached, resource_types)
+    try:
+        token = EmergencyAccessToken.objects.get(
+            token_id=token_id,
+            requested_by=user,
+            patient_id=patient_id,
+            status='active'
+        )
+    except EmergencyAccessToken.DoesNotExist:
+        return False
+    if not token.is_valid():
+        return False
+    token_cache.put(token)
+    return token_covers(token, resource_types)
+
+
+@timed('eat')
+def check_emergency_tokens(user, token_ids: dict, *resource_types) -> set:
+    """
+    check_emergency_token for many patients with one query.
+    token_ids maps patient_id -> token_id; returns the patient_ids
+    whose token is valid and covers resource_types.
+    """
+    if not token_ids:
+        return set()
+    valid = {
+        patient_id for patient_id, token_id in token_ids.items()
+        if is_signed(token_id)
+        and check_signed_token(token_id, user.pk, patient_id, *resource_types)
+    }
+    # Raises ValueError for a malformed token id
+    wanted = {
+        patient_id: token_key(token_id, user.pk, patient_id)
+        for patient_id, token_id in token_ids.items()
+        if not is_signed(token_id)
+    }
+    cached = token_cache.get_many(list(wanted.values()))
+    valid.update(
+        patient_id for patient_id, key in wanted.items()
+        if key in cached and token_covers(cached[key], resource_types)
+    )
+    missing = {
+        patient_id: key[0] for patient_id, key in wanted.items()
+        if key not in cached
+    }
+    if not missing:
+        return valid
+    tokens = EmergencyAccessToken.objects.filter(
+        token_id__in=list(missing.values()),
+        requested_by=user,
+        patient_id__in=list(missing),
+        status='active'
+    )
+    for token in tokens:
+        if token.token_id == missing[token.patient_id] and token.is_valid():
+            token_cache.put(token)
+            if token_covers(token, resource_types):
+                valid.add(token.patient_id)
+    return valid
+
+
+def access_querysets(
+    pdp, user, resource_type, queryset, summary_fields,
+    is_emergency=False, location=None
+) -> list:
+    """
+    Splits queryset in the database with the compiled policy filter.
+    Returns [granted, denied]: granted rows are loaded in full, denied
+    rows only with summary_fields and the access-control columns, so
+    their clinical text is never read. Returns [queryset] when the
+    active policy has no query translation.
+    """
+    queryset = queryset.order_by('id')
+    access = pdp.access_filter(user, resource_type, is_emergency, location)
+    if access is None:
+        return [queryset]
+
+    # patient is needed to attach the rows when used in a Prefetch
+    denied_fields = (
+        'id', 'patient', *summary_fields, *model_access_fields(queryset.model)
+    )
+    return [
+        queryset.filter(access),
+        queryset.exclude(access).only(*denied_fields),
+    ]
+
+
+def listing_querysets(
+    pdp, user, resource_type, queryset, summary_fields, listing,
+    is_emergency=False, location=None
+) -> list:
+    """
+    access_querysets with the listing filters, ordering and cursor
+    applied. With a sparse fieldset only the requested columns of
+    granted rows are read.
+    """
+    parts = access_querysets(
+        pdp, user, resource_type, queryset, summary_fields,
+        is_emergency, location
+    )
+    if listing['fields']:
+        parts[0] = parts[0].only(
+            'id', 'patient', *summary_fields,
+            *model_access_fields(queryset.model), *listing['fields']
+        )
+    return [keyset(part, listing) for part in parts]
+
+
+@timed('load')
+def load_page_by_access(
+    pdp, user, resource_type, queryset, summary_fields, listing,
+    is_emergency=False, location=None
+) -> tuple:
+    """
+    One keyset page of queryset, split by access. Each part is read up
+    to the page size and the parts are merged on id, so any page costs
+    two index range scans. Returns (rows, next_cursor).
+    """
+    parts = listing_querysets(
+        pdp, user, resource_type, queryset, summary_fields, listing,
+        is_emergency, location
+    )
+    limit = listing['limit'] + 1
+    return merge_page([part[:limit] for part in parts], listing)
+
+
+def merge_page(part_rows, listing: dict) -> tuple:
+    """
+    Merges the rows read from each access part, up to the page size
+    plus one, on id into one page. Returns (rows, next_cursor).
+    """
+    rows = sorted(
+        (row for rows in part_rows for row in rows),
+        key=attrgetter('id'),
+        reverse=listing['descending']
+    )
+    return page(rows[:listing['limit'] + 1], listing)
+
+
+# ── Response entries ──
+
+def ehr_denied_entry(record, decision) -> dict:
+    return {
+        'record_id': record.id,
+        'record_type': record.record_type,
+        'sensitivity_level': record.sensitivity_level,
+        'access_decision': {
+            'granted': False,
+            'checks_failed': decision['checks_failed'],
+            'reasons': decision['reasons'],
+        }
+    }
+
+
+def report_denied_entry(report, decision) -> dict:
+    return {
+        'report_id': report.id,
+        'report_type': report.report_type,
+        'access_decision': {
+            'granted': False,
+            'reasons': decision['reasons'],
+        }
+    }
+
+
+def lab_denied_entry(result, decision) -> dict:
+    return {
+        'result_id': result.id,
+        'test_name': result.test_name,
+        'access_decision': {
+            'granted': False,
+            'reasons': decision['reasons'],
+        }
+    }
+
+
+def decision_entry(resource, decision, serialize, denied_entry) -> dict:
+    """
+    Response entry for one resource: serialize(resource) when granted,
+    summarised when denied
+    """
+    if decision['access_granted']:
+        data = serialize(resource)
+        data['access_decision'] = {
+            'granted': True,
+            'checks_passed': decision['checks_passed'],
+        }
+        return data
+    return denied_entry(resource, decision)
+
+
+@timed('serialize')
+def split_by_decision(
+    resources, decisions, serializer_class, denied_entry, fields=None
+) -> tuple:
+    """
+    decision_entry for every resource, serializing granted ones (all
+    fields, or only fields). Returns (accessible, denied).
+    """
+    serialize = get_serializer(serializer_class, fields)
+    accessible = []
+    denied = []
+
+    for resource, decision in zip(resources, decisions):
+        entry = decision_entry(resource, decision, serialize, denied_entry)
+        if decision['access_granted']:
+            accessible.append(entry)
+        else:
+            denied.append(entry)
+
+    return accessible, denied
+
+
+def decided_entries(
+    pdp, user, resource_type, querysets, serializer_class, denied_entry,
+    summary, fields=None, is_emergency=False, location=None
+):
+    """
+    Yields the decision_entry of every row of querysets as it is
+    evaluated, counting totals into summary
+    """
+    serialize = get_serializer(serializer_class, fields)
+    for resource, decision in iter_decided(
+        pdp, user, resource_type, querysets, is_emergency, location
+    ):
+        summary['total'] += 1
+        summary['accessible' if decision['access_granted'] else 'denied'] += 1
+        yield decision_entry(resource, decision, serialize, denied_entry)
+
+
+def stream_records(
+    fmt, pdp, user, resource_type, queryset, summary_fields,
+    serializer_class, denied_entry, listing, head,
+    is_emergency=False, location=None
+):
+    """
+    Streams every record of queryset matching the listing filters as
+    decision entries: a JSON object made of head, 'records' and a
+    trailing 'summary', or one NDJSON line per record
+    """
+    querysets = listing_querysets(
+        pdp, user, resource_type, queryset, summary_fields, listing,
+        is_emergency, location
+    )
+    summary = {'total': 0, 'accessible': 0, 'denied': 0}
+    entries = decided_entries(
+        pdp, user, resource_type, querysets, serializer_class, denied_entry,
+        summary, listing['fields'], is_emergency, location
+    )
+
+    if fmt == 'ndjson':
+        return stream_response(ndjson_lines(entries), fmt)
+    return stream_response(
+        json_document(head, [('records', entries), ('summary', lambda: summary)]),
+        fmt
+    )
+
+
+def resource_types(query_params) -> list:
+    """
+    Resource types selected by ?types=ehr,report,lab, all by default
+    """
+    requested = query_params.get('types')
+    types = (
+        list(dict.fromkeys(t.strip() for t in requested.split(',') if t.strip()))
+        if requested else list(RESOURCE_MODELS)
+    )
+    unknown = [t for t in types if t not in RESOURCE_MODELS]
+    if unknown:
+        raise ListingError(f"Unknown types: {', '.join(unknown)}")
+    return types
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class EhrConfig(AppConfig):
     name = 'ehr'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,12 @@
+from django.urls import path
+from .async_views import (
+    AsyncPatientListView, AsyncEHRAccessView,
+    AsyncMedicalReportAccessView, AsyncLabResultAccessView
+)
+
+urlpatterns = [
+    path('patients/', AsyncPatientListView.as_view(), name='async_patient_list'),
+    path('patients/<str:patient_id>/ehr/', AsyncEHRAccessView.as_view(), name='async_ehr_access'),
+    path('patients/<str:patient_id>/reports/', AsyncMedicalReportAccessView.as_view(), name='async_report_access'),
+    path('patients/<str:patient_id>/lab/', AsyncLabResultAccessView.as_view(), name='async_lab_access'),
+]
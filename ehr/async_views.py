@@ -0,0 +1,326 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .models import Patient, EHRRecord, MedicalReport, LabResult
+from .serializers import (
+    PatientSerializer, EHRRecordSerializer,
+    MedicalReportSerializer, LabResultSerializer
+)
+from .fast_serializers import get_serializer
+from .listing import ListingError, CREATED_RANGE_FILTERS, parse_listing, keyset, page
+from .conditional import records_etag, not_modified, with_etag
+from .access import (
+    listing_querysets, merge_page, split_by_decision,
+    ehr_denied_entry, report_denied_entry, lab_denied_entry
+)
+from .views import PATIENT_FILTERS
+from engine.async_api import AsyncAPIView
+from engine.decision_point import PolicyDecisionPoint
+from emergency.models import EmergencyAccessToken, token_covers
+from emergency.signed_tokens import check_signed_token, is_signed, revocation_list
+from emergency.token_cache import token_cache, token_key
+
+
+async def alist(queryset) -> list:
+    return [row async for row in queryset]
+
+
+async def acount(queryset, listing: dict):
+    """
+    total_count with the async ORM
+    """
+    if not listing['count']:
+        return None
+    return await queryset.filter(listing['filter']).acount()
+
+
+async def acheck_emergency_token(user, patient_id, token_id, *resource_types):
+    """
+    check_emergency_token with the async ORM
+    """
+    if not token_id:
+        return False
+    if is_signed(token_id):
+        if revocation_list.due():
+            await sync_to_async(revocation_list.refresh)()
+        return check_signed_token(
+            token_id, user.pk, patient_id, *resource_types, refresh=False
+        )
+    try:
+        key = token_key(token_id, user.pk, patient_id)
+    except ValueError:
+        key = None
+    # The hit is revalidated with a query
+    cached = await sync_to_async(token_cache.get)(key) if key is not None else None
+    if cached is not None:
+        return token_covers(cached, resource_types)
+    try:
+        token = await EmergencyAccessToken.objects.aget(
+            token_id=token_id,
+            requested_by=user,
+            patient_id=patient_id,
+            status='active'
+        )
+    except EmergencyAccessToken.DoesNotExist:
+        return False
+    if not token.is_valid():
+        return False
+    token_cache.put(token)
+    return token_covers(token, resource_types)
+
+
+def stream_unsupported(query_params):
+    if query_params.get('stream') is None:
+        return None
+    return (
+        {'error': 'Streaming is only available on the /api/ehr/ endpoints'},
+        status.HTTP_400_BAD_REQUEST
+    )
+
+
+class AsyncPatientListView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request):
+        """
+        List patients - basic info only, one keyset page at a time
+        """
+        try:
+            listing = parse_listing(
+                request.query_params, PatientSerializer.Meta.fields, PATIENT_FILTERS
+            )
+        except ListingError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        unsupported = stream_unsupported(request.query_params)
+        if unsupported:
+            return Response(*unsupported)
+
+        serializer = get_serializer(PatientSerializer, listing['fields'])
+        if getattr(serializer, 'supports_values', False):
+            patients = Patient.objects.values(*serializer.value_names)
+            serialize = serializer.serialize_values
+        else:
+            patients = Patient.objects.all()
+            if listing['fields']:
+                patients = patients.only(*listing['fields'])
+            serialize = serializer
+
+        rows, count = await asyncio.gather(
+            alist(keyset(patients, listing)[:listing['limit'] + 1]),
+            acount(Patient.objects.all(), listing),
+        )
+        rows, next_cursor = page(rows, listing)
+
+        return Response({
+            'count': count,
+            'next_cursor': next_cursor,
+            'patients': [serialize(row) for row in rows],
+        })
+
+
+# ── Record access ──
+
+def revalidate(
+    request, pdp, patient, resource_type, queryset,
+    is_emergency, has_valid_eat, location
+) -> tuple:
+    """
+    (etag, 304 response or None), as the sync views compute them
+    """
+    etag, count = records_etag(
+        pdp, request.user, patient, {resource_type: queryset},
+        request.query_params, is_emergency, has_valid_eat, location
+    )
+    return etag, not_modified(
+        request, etag, count, resource_type, patient, is_emergency, has_valid_eat
+    )
+
+
+def decide(
+    pdp, user, resource_type, resources, serializer_class, denied_entry,
+    fields=None, is_emergency=False, location=None
+) -> tuple:
+    """
+    Policy pass, audit hand-off and serialization of one loaded page.
+    Returns (accessible, denied).
+    """
+    decisions = pdp.make_decisions(
+        user, resource_type, resources, is_emergency, location
+    )
+    return split_by_decision(
+        resources, decisions, serializer_class, denied_entry, fields
+    )
+
+
+async def access_page(
+    request, patient_id, resource_type, model, summary_fields,
+    serializer_class, denied_entry
+):
+    """
+    What the three async record views share, with the parameters and
+    results of the sync views. Lookups that do not depend on each other
+    are awaited together and the policy pass runs in one sync_to_async
+    call; audit entries go to the audit sink as usual, which with the
+    default buffered sink keeps their INSERTs off the request path.
+    Returns a response to send as is (error, 304) or a dict with the
+    patient, emergency state, page rows, decision entries, cursor, count
+    and ETag.
+    """
+    try:
+        listing = parse_listing(
+            request.query_params, serializer_class.Meta.fields, CREATED_RANGE_FILTERS
+        )
+    except ListingError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    unsupported = stream_unsupported(request.query_params)
+    if unsupported:
+        return Response(*unsupported)
+
+    is_emergency = request.query_params.get('emergency', 'false').lower() == 'true'
+    token_id = request.query_params.get('token_id', None)
+    location = request.query_params.get('location', None)
+
+    # The patient and the EAT do not depend on each other
+    patient, has_valid_eat = await asyncio.gather(
+        aget_object_or_404(Patient, patient_id=patient_id),
+        acheck_emergency_token(request.user, patient_id, token_id, resource_type),
+    )
+    if has_valid_eat:
+        is_emergency = True
+
+    pdp = PolicyDecisionPoint()
+    queryset = model.objects.filter(patient=patient)
+    etag, cached = await sync_to_async(revalidate)(
+        request, pdp, patient, resource_type, queryset,
+        is_emergency, has_valid_eat, location
+    )
+    if cached is not None:
+        return cached
+
+    # Granted rows, denied rows and the count are independent queries
+    parts = await sync_to_async(listing_querysets)(
+        pdp, request.user, resource_type, queryset, summary_fields, listing,
+        is_emergency, location
+    )
+    limit = listing['limit'] + 1
+    *part_rows, count = await asyncio.gather(
+        *(alist(part[:limit]) for part in parts),
+        acount(queryset, listing),
+    )
+    rows, next_cursor = merge_page(part_rows, listing)
+
+    accessible, denied = await sync_to_async(decide)(
+        pdp, request.user, resource_type, rows, serializer_class, denied_entry,
+        listing['fields'], is_emergency, location
+    )
+    return {
+        'patient': get_serializer(PatientSerializer)(patient),
+        'is_emergency': is_emergency,
+        'has_emergency_token': has_valid_eat,
+        'rows': rows,
+        'accessible': accessible,
+        'denied': denied,
+        'next_cursor': next_cursor,
+        'count': count,
+        'etag': etag,
+    }
+
+
+class AsyncEHRAccessView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request, patient_id):
+        """
+        Access EHR records for a patient
+        """
+        result = await access_page(
+            request, patient_id, 'ehr', EHRRecord, ['record_type'],
+            EHRRecordSerializer, ehr_denied_entry
+        )
+        if not isinstance(result, dict):
+            return result
+
+        return with_etag(Response({
+            'patient': result['patient'],
+            'is_emergency': result['is_emergency'],
+            'has_emergency_token': result['has_emergency_token'],
+            'accessible_records': result['accessible'],
+            'denied_records': result['denied'],
+            'summary': {
+                'total_records': len(result['rows']),
+                'accessible': len(result['accessible']),
+                'denied': len(result['denied']),
+            },
+            'page': {
+                'next_cursor': result['next_cursor'],
+                'count': result['count'],
+            }
+        }), result['etag'])
+
+
+class AsyncMedicalReportAccessView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request, patient_id):
+        """
+        Access Medical Reports for a patient
+        """
+        result = await access_page(
+            request, patient_id, 'report', MedicalReport, ['report_type'],
+            MedicalReportSerializer, report_denied_entry
+        )
+        if not isinstance(result, dict):
+            return result
+
+        return with_etag(Response({
+            'patient': result['patient'],
+            'is_emergency': result['is_emergency'],
+            'accessible_reports': result['accessible'],
+            'denied_reports': result['denied'],
+            'summary': {
+                'total': len(result['rows']),
+                'accessible': len(result['accessible']),
+                'denied': len(result['denied']),
+            },
+            'page': {
+                'next_cursor': result['next_cursor'],
+                'count': result['count'],
+            }
+        }), result['etag'])
+
+
+class AsyncLabResultAccessView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request, patient_id):
+        """
+        Access Lab Results for a patient
+        """
+        result = await access_page(
+            request, patient_id, 'lab', LabResult, ['test_name'],
+            LabResultSerializer, lab_denied_entry
+        )
+        if not isinstance(result, dict):
+            return result
+
+        return with_etag(Response({
+            'patient': result['patient'],
+            'is_emergency': result['is_emergency'],
+            'accessible_results': result['accessible'],
+            'denied_results': result['denied'],
+            'summary': {
+                'total': len(result['rows']),
+                'accessible': len(result['accessible']),
+                'denied': len(result['denied']),
+            },
+            'page': {
+                'next_cursor': result['next_cursor'],
+                'count': result['count'],
+            }
+        }), result['etag'])
+
@@ -0,0 +1,359 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from rest_framework import status
+from django.conf import settings
+from django.db.models import Prefetch, prefetch_related_objects
+from django.shortcuts import get_object_or_404
+
+from .models import Patient, RESOURCE_MODELS
+from .serializers import (
+    PatientSerializer, EHRRecordSerializer,
+    MedicalReportSerializer, LabResultSerializer
+)
+from .fast_serializers import get_serializer
+from .listing import ListingError
+from .conditional import records_etag, not_modified, with_etag
+from .streaming import (
+    stream_format, stream_response, json_document, ndjson_lines
+)
+from .access import (
+    check_emergency_token, check_emergency_tokens, access_querysets,
+    split_by_decision, decided_entries,
+    ehr_denied_entry, report_denied_entry, lab_denied_entry
+)
+from engine.decision_point import PolicyDecisionPoint
+from engine.timing import phase, timed
+
+
+# Chart section -> (resource type, related name, summary fields,
+#                   serializer, denied entry)
+CHART_SECTIONS = {
+    'ehr': ('ehr', 'ehr_records', ['record_type'],
+            EHRRecordSerializer, ehr_denied_entry),
+    'reports': ('report', 'medical_reports', ['report_type'],
+                MedicalReportSerializer, report_denied_entry),
+    'lab': ('lab', 'lab_results', ['test_name'],
+            LabResultSerializer, lab_denied_entry),
+}
+
+
+class PatientChartView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, patient_id):
+        """
+        EHR records, reports and lab results of a patient in one request.
+        The patient and every section are fetched with a fixed number of
+        queries, the EAT is checked once and all records go through a
+        single policy pass. ?sections=ehr,reports,lab selects sections.
+        """
+        requested = request.query_params.get('sections')
+        sections = (
+            list(dict.fromkeys(s.strip() for s in requested.split(',') if s.strip()))
+            if requested else list(CHART_SECTIONS)
+        )
+        unknown = [s for s in sections if s not in CHART_SECTIONS]
+        if unknown:
+            return Response({
+                'error': f"Unknown sections: {', '.join(unknown)}",
+                'available_sections': list(CHART_SECTIONS),
+            }, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            fmt = stream_format(request.query_params)
+        except ListingError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        is_emergency = request.query_params.get('emergency', 'false').lower() == 'true'
+        token_id = request.query_params.get('token_id', None)
+        location = request.query_params.get('location', None)
+
+        # The EAT decides the access filter, so it is checked before loading
+        has_valid_eat = check_emergency_token(
+            request.user, patient_id, token_id,
+            *(CHART_SECTIONS[name][0] for name in sections)
+        )
+        if has_valid_eat:
+            is_emergency = True
+
+        pdp = PolicyDecisionPoint()
+        patient = get_object_or_404(Patient, patient_id=patient_id)
+        if fmt:
+            return self.stream(
+                fmt, pdp, request.user, patient, sections,
+                {
+                    'patient': get_serializer(PatientSerializer)(patient),
+                    'is_emergency': is_emergency,
+                    'has_emergency_token': has_valid_eat,
+                },
+                is_emergency, location
+            )
+
+        etag, count = records_etag(
+            pdp, request.user, patient,
+            {
+                CHART_SECTIONS[name][0]: getattr(patient, CHART_SECTIONS[name][1]).all()
+                for name in sections
+            },
+            request.query_params, is_emergency, has_valid_eat, location
+        )
+        cached = not_modified(
+            request, etag, count, 'chart', patient, is_emergency, has_valid_eat
+        )
+        if cached is not None:
+            return cached
+
+        prefetches = []
+        parts = {}
+        for name in sections:
+            resource_type, related_name, summary_fields, _, _ = CHART_SECTIONS[name]
+            querysets = access_querysets(
+                pdp, request.user, resource_type,
+                RESOURCE_MODELS[resource_type].objects.all(), summary_fields,
+                is_emergency, location
+            )
+            parts[name] = [f'chart_{name}_{i}' for i in range(len(querysets))]
+            prefetches += [
+                Prefetch(related_name, queryset=queryset, to_attr=to_attr)
+                for queryset, to_attr in zip(querysets, parts[name])
+            ]
+
+        with phase('load'):
+            prefetch_related_objects([patient], *prefetches)
+        resources = {
+            CHART_SECTIONS[name][0]: [
+                row for to_attr in parts[name] for row in getattr(patient, to_attr)
+            ]
+            for name in sections
+        }
+
+        decisions = pdp.make_grouped_decisions(
+            request.user, resources, is_emergency, location
+        )
+
+        chart = {}
+        for name in sections:
+            resource_type, _, _, serializer_class, denied_entry = CHART_SECTIONS[name]
+            accessible, denied = split_by_decision(
+                resources[resource_type], decisions[resource_type],
+                serializer_class, denied_entry
+            )
+            chart[name] = {
+                'accessible': accessible,
+                'denied': denied,
+                'summary': {
+                    'total': len(resources[resource_type]),
+                    'accessible': len(accessible),
+                    'denied': len(denied),
+                }
+            }
+
+        return with_etag(Response({
+            'patient': get_serializer(PatientSerializer)(patient),
+            'is_emergency': is_emergency,
+            'has_emergency_token': has_valid_eat,
+            'sections': chart,
+        }), etag)
+
+    def stream(
+        self, fmt, pdp, user, patient, sections, head,
+        is_emergency=False, location=None
+    ):
+        """
+        Streams the chart section by section. JSON has one array per
+        section followed by 'summary'; NDJSON tags each line with its
+        section.
+        """
+        summaries = {}
+
+        def entries(name):
+            resource_type, _, summary_fields, serializer_class, denied_entry = (
+                CHART_SECTIONS[name]
+            )
+            querysets = access_querysets(
+                pdp, user, resource_type,
+                RESOURCE_MODELS[resource_type].objects.filter(patient=patient),
+                summary_fields, is_emergency, location
+            )
+            summaries[name] = {'total': 0, 'accessible': 0, 'denied': 0}
+            yield from decided_entries(
+                pdp, user, resource_type, querysets, serializer_class,
+                denied_entry, summaries[name],
+                is_emergency=is_emergency, location=location
+            )
+
+        if fmt == 'ndjson':
+            return stream_response(ndjson_lines(
+                {'section': name, **entry}
+                for name in sections for entry in entries(name)
+            ), fmt)
+        return stream_response(json_document(
+            head,
+            [(name, entries(name)) for name in sections]
+            + [('summary', lambda: summaries)]
+        ), fmt)
+
+
+class PatientBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        """
+        Chart sections of many patients in one request, e.g. a ward round.
+        Body: {"patient_ids": [...], "sections": [...], "emergency": bool,
+        "token_ids": {patient_id: token_id}, "location": str}.
+        Patients, tokens and every section are read with a fixed number
+        of IN queries, the user is resolved once and every record goes
+        through one policy pass and one audit batch. At most
+        BATCH_MAX_PATIENTS patients; ?stream=json|ndjson writes the
+        response patient by patient.
+        """
+        try:
+            fmt = stream_format(request.query_params)
+        except ListingError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        patient_ids = request.data.get('patient_ids')
+        if (
+            not isinstance(patient_ids, list) or not patient_ids
+            or not all(isinstance(p, str) for p in patient_ids)
+        ):
+            return Response(
+                {'error': 'patient_ids must be a non-empty list of strings'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        patient_ids = list(dict.fromkeys(patient_ids))
+        max_patients = getattr(settings, 'BATCH_MAX_PATIENTS', 50)
+        if len(patient_ids) > max_patients:
+            return Response(
+                {'error': f'At most {max_patients} patients per batch'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        sections = request.data.get('sections') or list(CHART_SECTIONS)
+        if not isinstance(sections, list):
+            sections = [sections]
+        sections = list(dict.fromkeys(sections))
+        unknown = [s for s in sections if s not in CHART_SECTIONS]
+        if unknown:
+            return Response({
+                'error': f"Unknown sections: {', '.join(map(str, unknown))}",
+                'available_sections': list(CHART_SECTIONS),
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        token_ids = request.data.get('token_ids') or {}
+        if not isinstance(token_ids, dict):
+            return Response(
+                {'error': 'token_ids must map patient_id to token_id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        is_emergency = request.data.get('emergency') is True
+        location = request.data.get('location')
+
+        try:
+            with_token = check_emergency_tokens(request.user, {
+                p: t for p, t in token_ids.items() if p in patient_ids
+            }, *(CHART_SECTIONS[name][0] for name in sections))
+        except ValueError:
+            return Response(
+                {'error': 'token_ids contains an invalid token id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        with phase('load'):
+            patients = Patient.objects.in_bulk(patient_ids, field_name='patient_id')
+        found = [p for p in patient_ids if p in patients]
+
+        # Patients with a valid EAT are evaluated in emergency mode, so
+        # records are read for at most two emergency states
+        groups = {}
+        for patient_id in found:
+            groups.setdefault(is_emergency or patient_id in with_token, []).append(
+                patients[patient_id]
+            )
+
+        pdp = PolicyDecisionPoint()
+        records = {patient_id: {} for patient_id in found}
+        batches = []
+        for emergency, members in groups.items():
+            by_pk = {patient.pk: patient.patient_id for patient in members}
+            resources = {}
+            for name in sections:
+                resource_type, _, summary_fields, _, _ = CHART_SECTIONS[name]
+                querysets = access_querysets(
+                    pdp, request.user, resource_type,
+                    RESOURCE_MODELS[resource_type].objects.filter(patient_id__in=by_pk),
+                    summary_fields, emergency, location
+                )
+                # Patient, then id: one ordered index range per patient
+                # and each patient's rows still in id order
+                with phase('load'):
+                    rows = [
+                        row for queryset in querysets
+                        for row in queryset.order_by('patient', 'id')
+                    ]
+                resources[resource_type] = rows
+                for patient_id in by_pk.values():
+                    records[patient_id][name] = []
+                for row in rows:
+                    records[by_pk[row.patient_id]][name].append(row)
+            batches.append((resources, emergency))
+
+        decided = pdp.make_batch_decisions(request.user, batches, location)
+        decisions = {}
+        for (resources, _), grouped in zip(batches, decided):
+            for resource_type, rows in resources.items():
+                decisions.update(zip(
+                    ((resource_type, row.id) for row in rows), grouped[resource_type]
+                ))
+
+        entries = (
+            self.patient_entry(
+                patients[patient_id], records[patient_id], decisions, sections,
+                is_emergency or patient_id in with_token, patient_id in with_token
+            )
+            for patient_id in found
+        )
+        not_found = [p for p in patient_ids if p not in patients]
+
+        if fmt == 'ndjson':
+            return stream_response(ndjson_lines(entries), fmt)
+        if fmt:
+            return stream_response(json_document(
+                {}, [('patients', entries), ('not_found', not_found)]
+            ), fmt)
+        return Response({
+            'patients': list(entries),
+            'not_found': not_found,
+        })
+
+    @timed('serialize')
+    def patient_entry(
+        self, patient, records, decisions, sections, is_emergency, has_valid_eat
+    ) -> dict:
+        """
+        One patient's chart sections, shaped like the chart endpoint's
+        """
+        chart = {}
+        for name in sections:
+            resource_type, _, _, serializer_class, denied_entry = CHART_SECTIONS[name]
+            rows = records[name]
+            accessible, denied = split_by_decision(
+                rows, [decisions[resource_type, row.id] for row in rows],
+                serializer_class, denied_entry
+            )
+            chart[name] = {
+                'accessible': accessible,
+                'denied': denied,
+                'summary': {
+                    'total': len(rows),
+                    'accessible': len(accessible),
+                    'denied': len(denied),
+                }
+            }
+        return {
+            'patient': get_serializer(PatientSerializer)(patient),
+            'is_emergency': is_emergency,
+            'has_emergency_token': has_valid_eat,
+            'sections': chart,
+        }
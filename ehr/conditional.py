@@ -0,0 +1,112 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+
+from engine.decision_cache import decision_fingerprint
+from engine.timing import timed
+from audit.sink import get_audit_sink
+
+
+# Parameters that only select the EAT; its validity is part of the tag
+IGNORED_PARAMS = ('token_id',)
+
+
+@timed('etag')
+def records_etag(
+    pdp, user, patient, querysets: dict, query_params,
+    is_emergency=False, has_valid_eat=False, location=None
+) -> tuple:
+    """
+    Strong validator of a record response built without reading any
+    record: one aggregate per queryset (row count, latest created_at and
+    updated_at), the patient's updated_at, the user, the policy-relevant
+    user and environment attributes, the emergency and EAT state, the
+    policy version and the query parameters.
+    querysets maps resource type -> the patient's records of that type.
+    Returns (etag, record count).
+    """
+    user_attrs = pdp.resolver.resolve_user_attributes(user)
+    env_attrs = pdp.resolver.resolve_environment_attributes(is_emergency, location)
+
+    parts = [
+        patient.pk, patient.updated_at.isoformat(), user.pk,
+        decision_fingerprint(
+            user_attrs, {}, env_attrs,
+            getattr(pdp.evaluator, 'fingerprint_extra', ())
+        ),
+        has_valid_eat, getattr(pdp.evaluator, 'version', None),
+        sorted(
+            (key, query_params.getlist(key)) for key in query_params
+            if key not in IGNORED_PARAMS
+        ),
+    ]
+    records = 0
+    for resource_type, queryset in querysets.items():
+        stats = queryset.order_by().aggregate(
+            count=Count('id'), created=Max('created_at'), updated=Max('updated_at')
+        )
+        records += stats['count']
+        parts += [
+            resource_type, stats['count'],
+            stats['created'] and stats['created'].isoformat(),
+            stats['updated'] and stats['updated'].isoformat(),
+        ]
+
+    digest = hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+    return f'"{digest}"', records
+
+
+def etag_matches(request, etag: str) -> bool:
+    """
+    Weak comparison against If-None-Match, as RFC 9110 requires for GET
+    """
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    tags = parse_etags(header)
+    if tags == ['*']:
+        return True
+    return etag in (tag.removeprefix('W/') for tag in tags)
+
+
+def not_modified(
+    request, etag, records, resource_type, patient,
+    is_emergency=False, has_valid_eat=False
+):
+    """
+    304 for a matching If-None-Match, or None. The revalidation is
+    audited as one ACCESS_NOT_MODIFIED entry naming the patient and the
+    ETag of the response it confirms, whose records were audited one by
+    one when it was served.
+    """
+    if not etag_matches(request, etag):
+        return None
+
+    get_audit_sink().log(
+        user=request.user,
+        action='ACCESS_NOT_MODIFIED',
+        resource_type=resource_type,
+        resource_id=patient.patient_id,
+        access_granted=True,
+        is_emergency=is_emergency,
+        details={
+            'etag': etag,
+            'records': records,
+            'has_emergency_token': has_valid_eat,
+        }
+    )
+    return with_etag(HttpResponseNotModified(), etag)
+
+
+def with_etag(response, etag: str):
+    """
+    Tags a 200 response. Caches may keep it but must revalidate every
+    time, so each reuse still reaches the policy check and the audit
+    trail; private keeps shared caches from storing patient data.
+    """
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,131 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import fields as drf_fields
+from rest_framework.relations import PKOnlyObject, PrimaryKeyRelatedField
+
+
+# DRF fields whose to_representation returns the database value
+# unchanged when the model column is one of RAW_MODEL_FIELDS
+RAW_SERIALIZER_FIELDS = (
+    drf_fields.CharField, drf_fields.IntegerField, drf_fields.BigIntegerField,
+    drf_fields.BooleanField, drf_fields.ChoiceField,
+)
+RAW_MODEL_FIELDS = (
+    'AutoField', 'BigAutoField', 'IntegerField', 'BigIntegerField',
+    'CharField', 'TextField', 'BooleanField',
+)
+
+
+def _generic_accessor(field):
+    """
+    What Serializer.to_representation does for one field
+    """
+    def access(obj):
+        attribute = field.get_attribute(obj)
+        check = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+        return None if check is None else field.to_representation(attribute)
+    return access
+
+
+class FastSerializer:
+    """
+    A ModelSerializer compiled to one generated function per input kind:
+    serialize(instance) reads model attributes, serialize_values(row)
+    reads the dicts of queryset.values(*value_names). Columns whose DRF
+    representation is the database value are copied as-is; dates and
+    other converted fields call the DRF field's to_representation, so
+    the output is identical to serializer_class(instance).data.
+    """
+
+    def __init__(self, serializer_class, fields=None):
+        self.serializer_class = serializer_class
+        prototype = serializer_class(fields=fields) if fields is not None else serializer_class()
+        model = serializer_class.Meta.model
+
+        namespace = {}
+        instance_items = []
+        values_items = []
+        self.value_names = []
+        self.supports_values = True
+
+        for index, (name, field) in enumerate(
+            (name, field) for name, field in prototype.fields.items()
+            if not field.write_only
+        ):
+            model_field = None
+            if len(field.source_attrs) == 1:
+                try:
+                    model_field = model._meta.get_field(field.source_attrs[0])
+                except FieldDoesNotExist:
+                    pass
+
+            if model_field is None or not model_field.concrete:
+                # Anything that is not a plain column goes through DRF
+                namespace[f'g{index}'] = _generic_accessor(field)
+                instance_items.append(f"{name!r}: g{index}(obj)")
+                self.supports_values = False
+                continue
+
+            self.value_names.append(model_field.name)
+            attribute = f"obj.{model_field.attname}"
+            column = f"row[{model_field.name!r}]"
+
+            if (
+                isinstance(field, PrimaryKeyRelatedField)
+                and field.use_pk_only_optimization()
+                and field.pk_field is None
+            ):
+                expression = '{}'
+            elif (
+                type(field) in RAW_SERIALIZER_FIELDS
+                and model_field.get_internal_type() in RAW_MODEL_FIELDS
+                and not getattr(field, 'coerce_to_string', False)
+            ):
+                expression = '{}'
+            else:
+                namespace[f'c{index}'] = field.to_representation
+                expression = f'(None if (v{index} := {{}}) is None else c{index}(v{index}))'
+
+            instance_items.append(f"{name!r}: {expression.format(attribute)}")
+            values_items.append(f"{name!r}: {expression.format(column)}")
+
+        source = "\n".join([
+            "def serialize(obj):",
+            "    return {" + ", ".join(instance_items) + "}",
+            "",
+            "def serialize_values(row):",
+            "    return {" + ", ".join(values_items) + "}",
+        ])
+        exec(compile(source, f'<fast {serializer_class.__name__}>', 'exec'), namespace)
+        self.source = source
+        self.serialize = namespace['serialize']
+        if self.supports_values:
+            self.serialize_values = namespace['serialize_values']
+
+    def __call__(self, instance) -> dict:
+        return self.serialize(instance)
+
+
+@lru_cache(maxsize=None)
+def _compiled(serializer_class, fields):
+    return FastSerializer(serializer_class, list(fields) if fields is not None else None)
+
+
+def get_fast_serializer(serializer_class, fields=None) -> FastSerializer:
+    """
+    Compiled serializer for serializer_class restricted to fields,
+    cached per (class, fields)
+    """
+    return _compiled(serializer_class, tuple(fields) if fields is not None else None)
+
+
+def get_serializer(serializer_class, fields=None):
+    """
+    Callable turning one instance into its representation: the
+    compiled serializer, or the DRF one when FAST_SERIALIZERS is off
+    """
+    if getattr(settings, 'FAST_SERIALIZERS', True):
+        return get_fast_serializer(serializer_class, fields)
+    return lambda instance: serializer_class(instance, fields=fields).data
@@ -0,0 +1,164 @@
+import base64
+import binascii
+from datetime import datetime, time
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+class ListingError(ValueError):
+    """
+    Invalid listing query parameter, reported to the client as a 400
+    """
+
+
+# ── Cursors ──
+# A cursor is the id of the last row of the previous page. Rows are
+# always ordered by primary key, so a page is one index range scan
+# however deep the client has paged.
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ListingError('Invalid cursor')
+
+
+# ── Filter value parsers ──
+
+def parse_int(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        raise ListingError(f"'{value}' is not an integer")
+
+
+def parse_timestamp(value: str) -> datetime:
+    """
+    ISO date or datetime; dates mean midnight in the current time zone
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ListingError(f"'{value}' is not an ISO date or datetime")
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def choice_parser(choices):
+    allowed = [value for value, _ in choices]
+
+    def parse(value):
+        if value not in allowed:
+            raise ListingError(f"'{value}' is not one of {', '.join(allowed)}")
+        return value
+    return parse
+
+
+CREATED_RANGE_FILTERS = {
+    'created_after': ('created_at__gte', parse_timestamp),
+    'created_before': ('created_at__lt', parse_timestamp),
+}
+
+
+# ── Parameters ──
+
+def parse_listing(query_params, fields: list, filters: dict) -> dict:
+    """
+    Parses the listing parameters shared by the patient and record lists:
+    limit, cursor, ordering (id or -id), fields (comma separated subset
+    of fields), count (exact total when true) and the given filters, a
+    mapping of parameter -> (ORM lookup, parser).
+    """
+    default_limit = getattr(settings, 'LISTING_PAGE_SIZE', 100)
+    max_limit = getattr(settings, 'LISTING_MAX_PAGE_SIZE', 1000)
+
+    limit = query_params.get('limit')
+    limit = default_limit if limit is None else parse_int(limit)
+    if not 1 <= limit <= max_limit:
+        raise ListingError(f'limit must be between 1 and {max_limit}')
+
+    ordering = query_params.get('ordering', 'id')
+    if ordering not in ('id', '-id'):
+        raise ListingError("ordering must be 'id' or '-id'")
+
+    cursor = query_params.get('cursor')
+
+    selected = None
+    if query_params.get('fields'):
+        selected = [f.strip() for f in query_params['fields'].split(',') if f.strip()]
+        unknown = [f for f in selected if f not in fields]
+        if unknown:
+            raise ListingError(
+                f"Unknown fields: {', '.join(unknown)}. "
+                f"Available: {', '.join(fields)}"
+            )
+        # id is always returned so clients can correlate rows
+        selected = list(dict.fromkeys(['id', *selected]))
+
+    condition = Q()
+    for name, (lookup, parse) in filters.items():
+        value = query_params.get(name)
+        if value not in (None, ''):
+            condition &= Q(**{lookup: parse(value)})
+
+    return {
+        'limit': limit,
+        'descending': ordering == '-id',
+        'after': decode_cursor(cursor) if cursor else None,
+        'fields': selected,
+        'count': query_params.get('count', 'false').lower() == 'true',
+        'filter': condition,
+    }
+
+
+# ── Keyset pages ──
+
+def keyset(queryset, listing: dict):
+    """
+    Applies the filters, ordering and cursor of listing to queryset.
+    Slice it to listing['limit'] + 1 rows and pass them to page().
+    """
+    queryset = queryset.filter(listing['filter'])
+    if listing['descending']:
+        queryset = queryset.order_by('-id')
+        if listing['after'] is not None:
+            queryset = queryset.filter(id__lt=listing['after'])
+    else:
+        queryset = queryset.order_by('id')
+        if listing['after'] is not None:
+            queryset = queryset.filter(id__gt=listing['after'])
+    return queryset
+
+
+def page(rows: list, listing: dict) -> tuple:
+    """
+    Cuts limit + 1 fetched rows (instances or .values() dicts) to one
+    page. Returns (rows, next_cursor); next_cursor is None on the last
+    page.
+    """
+    limit = listing['limit']
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last['id'] if isinstance(last, dict) else last.id)
+
+
+def total_count(queryset, listing: dict):
+    """
+    Exact number of rows matching the filters, or None unless requested
+    """
+    if not listing['count']:
+        return None
+    return queryset.filter(listing['filter']).count()
@@ -0,0 +1,238 @@
+import random
+import time
+from datetime import date, time as clock, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from authentication.models import User
+from ehr.models import Patient, EHRRecord, MedicalReport, LabResult
+
+
+# ── Distributions ──
+# (value, weight) pairs tuned to look like a mid-sized hospital
+
+ROLE_WEIGHTS = [
+    ('nurse', 40), ('doctor', 25), ('lab_technician', 10),
+    ('receptionist', 10), ('emergency_staff', 10), ('admin', 5),
+]
+
+# Typical clearance range per role
+ROLE_CLEARANCE = {
+    'nurse': (1, 3),
+    'doctor': (3, 5),
+    'lab_technician': (2, 3),
+    'receptionist': (1, 1),
+    'emergency_staff': (3, 5),
+    'admin': (4, 5),
+}
+
+DEPARTMENT_WEIGHTS = [
+    ('general', 25), ('emergency', 15), ('cardiology', 12), ('icu', 12),
+    ('orthopedics', 10), ('neurology', 8), ('psychiatry', 8), ('laboratory', 10),
+]
+
+SENSITIVITY_WEIGHTS = [(1, 35), (2, 30), (3, 20), (4, 10), (5, 5)]
+
+RECORD_TYPE_SENSITIVITY = {
+    'general': 1, 'chronic': 2, 'surgical': 3, 'emergency': 2,
+    'substance': 4, 'mental_health': 4, 'genetic': 5,
+}
+
+BLOOD_GROUPS = [bg for bg, _ in Patient.BLOOD_GROUP_CHOICES]
+REPORT_TYPES = [rt for rt, _ in MedicalReport.REPORT_TYPE_CHOICES]
+FIRST_NAMES = [
+    'Aarav', 'Ananya', 'Rohan', 'Priya', 'Vikram', 'Sneha', 'Arjun', 'Kavya',
+    'Rahul', 'Isha', 'Sanjay', 'Meera', 'Karan', 'Divya', 'Amit', 'Pooja',
+]
+LAST_NAMES = [
+    'Mohanty', 'Sharma', 'Patel', 'Das', 'Nayak', 'Reddy', 'Iyer', 'Singh',
+    'Mishra', 'Rao', 'Gupta', 'Sahu', 'Pradhan', 'Jena', 'Kumar', 'Mehta',
+]
+LAB_TESTS = [
+    'Complete Blood Count', 'Lipid Profile', 'HbA1c', 'Liver Function Test',
+    'Kidney Function Test', 'Thyroid Profile', 'Urinalysis', 'Vitamin D',
+]
+
+
+def weighted(rng, pairs):
+    values, weights = zip(*pairs)
+    return rng.choices(values, weights)[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates synthetic users, patients and clinical records for "
+        "benchmarking, using chunked bulk_create"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--patients', type=int, default=100000)
+        parser.add_argument('--ehr-records', type=int, default=1000000)
+        parser.add_argument('--reports', type=int, default=500000)
+        parser.add_argument('--lab-results', type=int, default=1000000)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.chunk_size = options['chunk_size']
+        self.verbosity = options['verbosity']
+
+        user_ids = self.create_users(options['users'])
+        doctor_ids = list(
+            User.objects.filter(id__in=user_ids, role='doctor')
+            .values_list('id', flat=True)
+        ) or [None]
+        patient_ids = self.create_patients(options['patients'], doctor_ids)
+        if not patient_ids:
+            return
+
+        self.create_rows(
+            EHRRecord, options['ehr_records'],
+            lambda: self.ehr_record(patient_ids, user_ids)
+        )
+        self.create_rows(
+            MedicalReport, options['reports'],
+            lambda: self.medical_report(patient_ids, user_ids)
+        )
+        self.create_rows(
+            LabResult, options['lab_results'],
+            lambda: self.lab_result(patient_ids, user_ids)
+        )
+
+    # ── Bulk insertion ──
+
+    def create_rows(self, model, total, build, keep_ids=False) -> list:
+        """
+        Inserts total rows in chunks. Returns their ids with keep_ids,
+        otherwise an empty list (millions of ids add up).
+        """
+        started = time.perf_counter()
+        ids = []
+        for start in range(0, total, self.chunk_size):
+            batch = [build() for _ in range(min(self.chunk_size, total - start))]
+            with transaction.atomic():
+                created = model.objects.bulk_create(batch)
+            if keep_ids:
+                ids.extend(obj.id for obj in created)
+            if self.verbosity > 1:
+                self.stdout.write(f"{model.__name__}: {start + len(batch)}/{total}")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{model.__name__}: {total} rows in {elapsed:.1f}s"
+            + (f" ({total / elapsed:,.0f} rows/sec)" if elapsed > 0 else "")
+        )
+        return ids
+
+    def create_users(self, total) -> list:
+        # Hashing is deliberately slow, so every synthetic user shares one hash
+        password = make_password('synthetic')
+        offset = User.objects.count()
+        counter = iter(range(offset, offset + total))
+
+        def build():
+            i = next(counter)
+            role = weighted(self.rng, ROLE_WEIGHTS)
+            low, high = ROLE_CLEARANCE[role]
+            department = (
+                'laboratory' if role == 'lab_technician'
+                else 'emergency' if role == 'emergency_staff'
+                else weighted(self.rng, DEPARTMENT_WEIGHTS)
+            )
+            shift_start = self.rng.choice([6, 14, 22])
+            return User(
+                username=f'synthetic_{i}',
+                password=password,
+                first_name=self.rng.choice(FIRST_NAMES),
+                last_name=self.rng.choice(LAST_NAMES),
+                role=role,
+                department=department,
+                clearance_level=self.rng.randint(low, high),
+                certifications='BLS, ACLS' if role in ('doctor', 'emergency_staff') else 'BLS',
+                working_hours_start=clock(shift_start),
+                working_hours_end=clock((shift_start + 8) % 24),
+                is_emergency_authorized=(
+                    role in ('emergency_staff', 'admin')
+                    or (role == 'doctor' and self.rng.random() < 0.3)
+                ),
+            )
+
+        return self.create_rows(User, total, build, keep_ids=True)
+
+    def create_patients(self, total, doctor_ids) -> list:
+        offset = Patient.objects.count()
+        counter = iter(range(offset, offset + total))
+        born = date(1940, 1, 1)
+
+        def build():
+            i = next(counter)
+            return Patient(
+                patient_id=f'SYN{i:09d}',
+                first_name=self.rng.choice(FIRST_NAMES),
+                last_name=self.rng.choice(LAST_NAMES),
+                date_of_birth=born + timedelta(days=self.rng.randint(0, 30000)),
+                blood_group=self.rng.choice(BLOOD_GROUPS),
+                contact_number=f'9{self.rng.randint(0, 999999999):09d}',
+                assigned_doctor_id=self.rng.choice(doctor_ids),
+            )
+
+        return self.create_rows(Patient, total, build, keep_ids=True)
+
+    # ── Row builders ──
+
+    def access_columns(self, sensitivity=None) -> dict:
+        if sensitivity is None:
+            sensitivity = weighted(self.rng, SENSITIVITY_WEIGHTS)
+        return {
+            'sensitivity_level': sensitivity,
+            'required_clearance_level': max(1, sensitivity - self.rng.randint(0, 1)),
+        }
+
+    def ehr_record(self, patient_ids, user_ids) -> EHRRecord:
+        record_type = self.rng.choice(list(RECORD_TYPE_SENSITIVITY))
+        sensitivity = min(5, RECORD_TYPE_SENSITIVITY[record_type] + self.rng.randint(0, 1))
+        return EHRRecord(
+            patient_id=self.rng.choice(patient_ids),
+            record_type=record_type,
+            diagnosis=f'Synthetic {record_type} diagnosis',
+            treatment_plan='Follow-up in two weeks. ' * self.rng.randint(1, 8),
+            medications='Paracetamol 500mg; Metformin 500mg',
+            notes='Observation notes. ' * self.rng.randint(0, 20),
+            required_department=(
+                weighted(self.rng, DEPARTMENT_WEIGHTS)
+                if self.rng.random() < 0.4 else None
+            ),
+            patient_consent=self.rng.random() < 0.95,
+            created_by_id=self.rng.choice(user_ids),
+            **self.access_columns(sensitivity),
+        )
+
+    def medical_report(self, patient_ids, user_ids) -> MedicalReport:
+        report_type = self.rng.choice(REPORT_TYPES)
+        return MedicalReport(
+            patient_id=self.rng.choice(patient_ids),
+            report_type=report_type,
+            title=f'{report_type.upper()} report',
+            description='Synthetic report description. ' * self.rng.randint(1, 5),
+            findings='No acute abnormality. ' * self.rng.randint(0, 5),
+            created_by_id=self.rng.choice(user_ids),
+            **self.access_columns(),
+        )
+
+    def lab_result(self, patient_ids, user_ids) -> LabResult:
+        abnormal = self.rng.random() < 0.15
+        return LabResult(
+            patient_id=self.rng.choice(patient_ids),
+            test_name=self.rng.choice(LAB_TESTS),
+            test_date=date(2024, 1, 1) + timedelta(days=self.rng.randint(0, 700)),
+            result_value=f'{self.rng.uniform(1, 200):.1f}',
+            normal_range='10-100',
+            unit='mg/dL',
+            is_abnormal=abnormal,
+            remarks='Repeat test advised' if abnormal else None,
+            created_by_id=self.rng.choice(user_ids),
+            **self.access_columns(),
+        )
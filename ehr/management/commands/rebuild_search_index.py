@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from ehr.search import rebuild_search_indexes
+
+
+class Command(BaseCommand):
+    help = (
+        "Drops and refills the SQLite FTS5 search indexes and their sync "
+        "triggers from the source tables"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if connections[using].vendor != 'sqlite':
+            raise CommandError("The search indexes are SQLite FTS5 tables")
+
+        started = time.perf_counter()
+        with transaction.atomic(using=using):
+            counts = rebuild_search_indexes(using)
+        elapsed = time.perf_counter() - started
+        for name, rows in counts.items():
+            self.stdout.write(f"{name}: {rows} rows")
+        self.stdout.write(f"Rebuilt in {elapsed:.1f}s")
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.2 on 2026-10-18 14:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labresult',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='medicalreport',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
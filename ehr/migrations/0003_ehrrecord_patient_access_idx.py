@@ -0,0 +1,25 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ehr', '0002_report_lab_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ehrrecord',
+            name='patient',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ehr_records', to='ehr.patient'),
+        ),
+        migrations.AddIndex(
+            model_name='ehrrecord',
+            index=models.Index(fields=['patient', 'id', 'sensitivity_level', 'required_clearance_level', 'patient_consent', 'required_department'], name='ehr_patient_access_idx'),
+        ),
+    ]
@@ -60,7 +60,9 @@ class EHRRecord(models.Model):
     patient = models.ForeignKey(
         Patient,
         on_delete=models.CASCADE,
-        related_name='ehr_records'
+        related_name='ehr_records',
+        # ehr_patient_access_idx starts with patient
+        db_index=False
     )
     record_type = models.CharField(
         max_length=20,
@@ -96,6 +98,21 @@ class EHRRecord(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Record pages filter one patient on the access flags in id
+            # order: id second keeps that order, so pages need no sort and
+            # the flags are checked in the index before any row is read
+            models.Index(
+                fields=[
+                    'patient', 'id', 'sensitivity_level',
+                    'required_clearance_level', 'patient_consent',
+                    'required_department',
+                ],
+                name='ehr_patient_access_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.patient} - {self.record_type} (Sensitivity: {self.sensitivity_level})"
 
@@ -134,6 +151,7 @@ class MedicalReport(models.Model):
         related_name='created_reports'
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.patient} - {self.report_type} - {self.title}"
@@ -165,6 +183,15 @@ class LabResult(models.Model):
         related_name='created_lab_results'
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.patient} - {self.test_name} - {self.test_date}"
\ No newline at end of file
+        return f"{self.patient} - {self.test_name} - {self.test_date}"
+
+
+# Resource type names used by the policy engine
+RESOURCE_MODELS = {
+    'ehr': EHRRecord,
+    'report': MedicalReport,
+    'lab': LabResult,
+}
@@ -0,0 +1,359 @@
+from html import escape
+
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Q
+
+from .listing import ListingError
+from .models import Patient
+
+
+# Stripped from phone numbers on both sides, so '+91 98765-43210' and
+# '9876543210' match
+PHONE_PUNCTUATION = ' -+().'
+
+
+def _digits_sql(expression: str) -> str:
+    for char in PHONE_PUNCTUATION:
+        expression = f"replace({expression}, '{char}', '')"
+    return expression
+
+
+class SearchIndex:
+    """
+    An SQLite FTS5 table over columns of one table, kept in sync by
+    triggers on that table, so bulk_create() and update() are indexed as
+    well as save(). columns maps each source column to the SQL
+    expression indexed for it, with {row} for the row alias; matches are
+    read back by rowid (the table's primary key).
+    Contentless indexes store only the index. External content indexes
+    (external=True, plain columns only) read the text from the table,
+    which snippet() needs.
+    """
+
+    def __init__(self, name, table, columns: dict, options: str, external=False):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.options = options
+        self.external = external
+
+    @property
+    def content(self) -> str:
+        if self.external:
+            return f"content='{self.table}', content_rowid='id'"
+        return "content=''"
+
+    def values(self, row: str) -> str:
+        return ', '.join(
+            expression.format(row=row) for expression in self.columns.values()
+        )
+
+    def changed(self) -> str:
+        return ' OR '.join(f'old.{name} IS NOT new.{name}' for name in self.columns)
+
+    def create_sql(self) -> list:
+        names = ', '.join(self.columns)
+        insert = (
+            f"INSERT INTO {self.name}(rowid, {names}) "
+            f"VALUES (new.id, {self.values('new')});"
+        )
+        delete = (
+            f"INSERT INTO {self.name}({self.name}, rowid, {names}) "
+            f"VALUES ('delete', old.id, {self.values('old')});"
+        )
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.name} USING fts5("
+            f"{names}, {self.content}, {self.options})",
+            f"CREATE TRIGGER IF NOT EXISTS {self.name}_insert "
+            f"AFTER INSERT ON {self.table} BEGIN {insert} END",
+            f"CREATE TRIGGER IF NOT EXISTS {self.name}_delete "
+            f"AFTER DELETE ON {self.table} BEGIN {delete} END",
+            # Saves that leave the indexed columns alone skip the index
+            f"CREATE TRIGGER IF NOT EXISTS {self.name}_update "
+            f"AFTER UPDATE ON {self.table} WHEN {self.changed()} "
+            f"BEGIN {delete} {insert} END",
+        ]
+
+    def drop_sql(self) -> list:
+        return [
+            *(
+                f"DROP TRIGGER IF EXISTS {self.name}_{event}"
+                for event in ('insert', 'delete', 'update')
+            ),
+            f"DROP TABLE IF EXISTS {self.name}",
+        ]
+
+    def populate_sql(self) -> str:
+        if self.external:
+            return f"INSERT INTO {self.name}({self.name}) VALUES ('rebuild')"
+        return (
+            f"INSERT INTO {self.name}(rowid, {', '.join(self.columns)}) "
+            f"SELECT id, {self.values(self.table)} FROM {self.table}"
+        )
+
+
+PATIENT_COLUMNS = {
+    'patient_id': '{row}.patient_id',
+    'first_name': '{row}.first_name',
+    'last_name': '{row}.last_name',
+    'contact_number': _digits_sql('{row}.contact_number'),
+}
+
+# Whole words and word prefixes; the prefix option keeps short
+# prefixes to one index lookup
+PATIENT_PREFIX_INDEX = SearchIndex(
+    'ehr_patient_search', 'ehr_patient', PATIENT_COLUMNS,
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'"
+)
+# Any substring of three or more characters (the middle of a phone
+# number or patient id)
+PATIENT_TRIGRAM_INDEX = SearchIndex(
+    'ehr_patient_search_trigram', 'ehr_patient', PATIENT_COLUMNS,
+    "tokenize='trigram'"
+)
+
+# bm25 column weights: patient_id, first_name, last_name, contact_number
+PATIENT_WEIGHTS = (10.0, 4.0, 4.0, 6.0)
+
+
+def _plain(*columns) -> dict:
+    return {column: f'{{row}}.{column}' for column in columns}
+
+
+# Clinical text, stemmed so 'fractures' finds 'fracture'. Report titles
+# and test names are indexed with the text so 'MRI' or 'HbA1c' find them.
+CLINICAL_OPTIONS = "tokenize='porter unicode61 remove_diacritics 2'"
+CLINICAL_INDEXES = {
+    'ehr': SearchIndex(
+        'ehr_ehrrecord_search', 'ehr_ehrrecord',
+        _plain('diagnosis', 'treatment_plan', 'medications', 'notes'),
+        CLINICAL_OPTIONS, external=True
+    ),
+    'report': SearchIndex(
+        'ehr_medicalreport_search', 'ehr_medicalreport',
+        _plain('title', 'findings'), CLINICAL_OPTIONS, external=True
+    ),
+    'lab': SearchIndex(
+        'ehr_labresult_search', 'ehr_labresult',
+        _plain('test_name', 'remarks'), CLINICAL_OPTIONS, external=True
+    ),
+}
+
+SEARCH_INDEXES = [
+    PATIENT_PREFIX_INDEX, PATIENT_TRIGRAM_INDEX, *CLINICAL_INDEXES.values()
+]
+
+
+def install_search_indexes(using='default'):
+    """
+    Creates missing search tables and triggers, filling new tables from
+    their source. Runs after every migrate: a migration that rebuilds a
+    source table drops its triggers with it. FTS5 is SQLite only.
+    """
+    if connections[using].vendor != 'sqlite':
+        return
+    with connections[using].cursor() as cursor:
+        existing = set(connections[using].introspection.table_names(cursor))
+        for index in SEARCH_INDEXES:
+            if index.table not in existing:
+                continue
+            for sql in index.create_sql():
+                cursor.execute(sql)
+            if index.name not in existing:
+                cursor.execute(index.populate_sql())
+
+
+def rebuild_search_indexes(using='default') -> dict:
+    """
+    Drops and refills every search index. Returns rows indexed per index.
+    """
+    counts = {}
+    with connections[using].cursor() as cursor:
+        for index in SEARCH_INDEXES:
+            for sql in index.drop_sql():
+                cursor.execute(sql)
+            for sql in index.create_sql():
+                cursor.execute(sql)
+            cursor.execute(index.populate_sql())
+            cursor.execute(f"SELECT COUNT(*) FROM {index.table}")
+            counts[index.name] = cursor.fetchone()[0]
+    return counts
+
+
+# ── Queries ──
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def search_terms(query: str) -> list:
+    """
+    Terms of a search box query. A query of digits and phone punctuation
+    is one phone number term; single characters are dropped since they
+    would match most of the table.
+    """
+    stripped = ''.join(c for c in query if c not in PHONE_PUNCTUATION)
+    terms = [stripped] if stripped.isdigit() else query.split()
+    return [term for term in terms if len(term) > 1]
+
+
+def _ranked(index: SearchIndex, match: str, limit: int) -> list:
+    # Ranking is bounded by the candidate cap, so broad queries like a
+    # common surname cost the same at any table size
+    candidates = getattr(settings, 'PATIENT_SEARCH_CANDIDATES', 500)
+    weights = ', '.join(str(weight) for weight in PATIENT_WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM ("
+            f"  SELECT rowid, bm25({index.name}, {weights}) AS score"
+            f"  FROM {index.name} WHERE {index.name} MATCH %s LIMIT %s"
+            f") ORDER BY score LIMIT %s",
+            [match, candidates, limit]
+        )
+        return [pk for (pk,) in cursor.fetchall()]
+
+
+def search_patients(query: str, limit: int) -> list:
+    """
+    Ranked (patient pk, match) pairs, best first. Every term must match
+    the start of a word (match 'prefix'); only when no patient does are
+    patients containing every term anywhere returned (match
+    'substring'), since substrings of long ids and numbers are slow.
+    """
+    terms = search_terms(query)
+    if not terms:
+        raise ListingError('q must contain a term of at least two characters')
+    if connection.vendor != 'sqlite':
+        # No FTS5: a LIKE scan, as the admin search does
+        condition = Q()
+        for term in terms:
+            condition &= (
+                Q(patient_id__icontains=term) | Q(first_name__icontains=term) |
+                Q(last_name__icontains=term) | Q(contact_number__icontains=term)
+            )
+        found = Patient.objects.filter(condition).order_by('id')[:limit]
+        return [(pk, 'substring') for pk in found.values_list('id', flat=True)]
+
+    found = _ranked(
+        PATIENT_PREFIX_INDEX, ' '.join(f'{_quote(term)}*' for term in terms), limit
+    )
+    if found:
+        return [(pk, 'prefix') for pk in found]
+    # Trigrams cannot match terms shorter than three characters
+    if all(len(term) >= 3 for term in terms):
+        found = _ranked(
+            PATIENT_TRIGRAM_INDEX, ' '.join(_quote(term) for term in terms), limit
+        )
+    return [(pk, 'substring') for pk in found]
+
+
+# ── Clinical search ──
+
+# Per-column weights of each clinical index, in column order
+CLINICAL_WEIGHTS = {
+    'ehr': (3.0, 1.0, 2.0, 1.0),
+    'report': (3.0, 1.0),
+    'lab': (3.0, 1.0),
+}
+
+# Hit markers for highlight() and snippet(); control characters cannot
+# occur in the text
+HIT_OPEN, HIT_CLOSE = '\x02', '\x03'
+
+# BM25 term-frequency saturation and length normalisation
+BM25_K1, BM25_B = 1.2, 0.75
+
+
+def clinical_match(query: str) -> str:
+    """
+    FTS5 query requiring every term of query, each stemmed like the
+    index
+    """
+    terms = query.split()
+    if not terms:
+        raise ListingError('q is required')
+    return ' '.join(_quote(term) for term in terms)
+
+
+def matching_ids(resource_type: str, match: str, scope, limit: int) -> list:
+    """
+    Ids of the rows of scope (a queryset of the resource's model)
+    matching match, unranked, at most limit. The index is probed with
+    the ids of scope, which costs well under a millisecond for one
+    patient's history.
+    """
+    index = CLINICAL_INDEXES[resource_type]
+    sql, params = scope.order_by().values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {index.name} "
+            f"WHERE {index.name} MATCH %s AND rowid IN ({sql}) LIMIT %s",
+            [match, *params, limit]
+        )
+        return [pk for (pk,) in cursor.fetchall()]
+
+
+def _in_ids(ids) -> str:
+    return ', '.join(str(int(pk)) for pk in ids)
+
+
+def relevance(resource_type: str, match: str, ids: list) -> dict:
+    """
+    {id: score} of matching rows, higher first. BM25 without its IDF
+    term: FTS5's bm25() counts the documents of every term in the whole
+    table on each rowid probe, which costs more than the search itself
+    for common terms, while every hit here contains every term anyway.
+    Term frequencies come from highlight() markers, so they follow the
+    index's stemming.
+    """
+    if not ids:
+        return {}
+    index = CLINICAL_INDEXES[resource_type]
+    weights = CLINICAL_WEIGHTS[resource_type]
+    highlights = ', '.join(
+        f"highlight({index.name}, {column}, '{HIT_OPEN}', '{HIT_CLOSE}')"
+        for column in range(len(index.columns))
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, {highlights} FROM {index.name} "
+            f"WHERE {index.name} MATCH %s AND rowid IN ({_in_ids(ids)})",
+            [match]
+        )
+        rows = [(pk, [text or '' for text in texts]) for pk, *texts in cursor.fetchall()]
+
+    lengths = [[len(text.split()) for text in texts] for _, texts in rows]
+    average = [
+        max(1.0, sum(column) / len(rows)) for column in zip(*lengths)
+    ]
+    scores = {}
+    for (pk, texts), row_lengths in zip(rows, lengths):
+        score = 0.0
+        for text, length, avg, weight in zip(texts, row_lengths, average, weights):
+            hits = text.count(HIT_OPEN)
+            norm = 1 - BM25_B + BM25_B * length / avg
+            score += weight * hits * (BM25_K1 + 1) / (hits + BM25_K1 * norm)
+        scores[pk] = round(score, 4)
+    return scores
+
+
+def snippets(resource_type: str, match: str, ids: list, tokens: int = 16) -> dict:
+    """
+    {id: snippet} of the best matching column of each row, HTML-escaped
+    with the hits in <mark>. Only call it for rows the user was granted.
+    """
+    if not ids:
+        return {}
+    index = CLINICAL_INDEXES[resource_type]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, snippet({index.name}, -1, '{HIT_OPEN}', '{HIT_CLOSE}', "
+            f"'…', {int(tokens)}) FROM {index.name} "
+            f"WHERE {index.name} MATCH %s AND rowid IN ({_in_ids(ids)})",
+            [match]
+        )
+        return {
+            pk: escape(text).replace(HIT_OPEN, '<mark>').replace(HIT_CLOSE, '</mark>')
+            for pk, text in cursor.fetchall()
+        }
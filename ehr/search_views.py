@@ -0,0 +1,248 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from rest_framework import status
+from django.conf import settings
+from django.shortcuts import get_object_or_404
+
+from .models import Patient, RESOURCE_MODELS
+from .serializers import PatientSerializer
+from .fast_serializers import get_serializer
+from .listing import (
+    ListingError, parse_int, encode_cursor, decode_cursor
+)
+from .search import (
+    search_patients, clinical_match, matching_ids, relevance, snippets
+)
+from .access import check_emergency_token, resource_types
+from engine.decision_point import PolicyDecisionPoint
+from engine.query_compiler import model_access_fields
+from engine.timing import phase
+from audit.sink import get_audit_sink
+
+
+class PatientSearchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Patients matching a search box query (name, patient id or phone
+        number), best match first
+        """
+        query = request.query_params.get('q', '').strip()
+        max_results = getattr(settings, 'PATIENT_SEARCH_MAX_RESULTS', 100)
+        try:
+            limit = request.query_params.get('limit')
+            limit = 20 if limit is None else parse_int(limit)
+            if not 1 <= limit <= max_results:
+                raise ListingError(f'limit must be between 1 and {max_results}')
+            with phase('search'):
+                matches = search_patients(query, limit)
+        except ListingError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = get_serializer(PatientSerializer)
+        pks = [pk for pk, _ in matches]
+        with phase('load'):
+            if getattr(serializer, 'supports_values', False):
+                rows = {
+                    row['id']: row for row in
+                    Patient.objects.filter(id__in=pks).values(*serializer.value_names)
+                }
+                serialize = serializer.serialize_values
+            else:
+                rows = Patient.objects.in_bulk(pks)
+                serialize = serializer
+
+        return Response({
+            'query': query,
+            'patients': [
+                {**serialize(rows[pk]), 'match': match}
+                for pk, match in matches if pk in rows
+            ],
+        })
+
+
+# Columns returned with each search hit besides its id
+SEARCH_SUMMARY_FIELDS = {
+    'ehr': ['record_type', 'sensitivity_level'],
+    'report': ['report_type', 'title'],
+    'lab': ['test_name', 'test_date'],
+}
+
+
+class RecordSearchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Full-text search of one patient's records (?patient_id=) or of
+        the records of the user's assigned patients (?scope=caseload),
+        best match first. The policy filter is applied before ranking,
+        so denied records are neither listed nor counted, and snippets
+        are only read for the granted records of the page.
+        """
+        params = request.query_params
+        query = params.get('q', '').strip()
+        patient_id = params.get('patient_id')
+        is_emergency = params.get('emergency', 'false').lower() == 'true'
+        location = params.get('location', None)
+        max_results = getattr(settings, 'CLINICAL_SEARCH_MAX_RESULTS', 100)
+        try:
+            match = clinical_match(query)
+            types = resource_types(params)
+            limit = parse_int(params.get('limit', '20'))
+            if not 1 <= limit <= max_results:
+                raise ListingError(f'limit must be between 1 and {max_results}')
+            offset = decode_cursor(params['cursor']) if params.get('cursor') else 0
+            if not patient_id and params.get('scope') != 'caseload':
+                raise ListingError('patient_id or scope=caseload is required')
+        except ListingError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        has_valid_eat = False
+        if patient_id:
+            patient = get_object_or_404(Patient, patient_id=patient_id)
+            has_valid_eat = check_emergency_token(
+                request.user, patient_id, params.get('token_id'), *types
+            )
+            if has_valid_eat:
+                is_emergency = True
+            scope = {'patient': patient}
+        else:
+            scope = {'patient__assigned_doctor': request.user}
+
+        pdp = PolicyDecisionPoint()
+        candidates = getattr(settings, 'CLINICAL_SEARCH_CANDIDATES', 1000)
+        ranked = []
+        truncated = False
+        with phase('search'):
+            for resource_type in types:
+                queryset = RESOURCE_MODELS[resource_type].objects.filter(**scope)
+                access = pdp.access_filter(
+                    request.user, resource_type, is_emergency, location
+                )
+                if access is not None:
+                    queryset = queryset.filter(access)
+                ids = matching_ids(resource_type, match, queryset, candidates + 1)
+                truncated |= len(ids) > candidates
+                ids = ids[:candidates]
+                if access is None:
+                    ids = self.granted_ids(
+                        pdp, request.user, resource_type, ids, is_emergency, location
+                    )
+                ranked += [
+                    (score, resource_type, pk)
+                    for pk, score in relevance(resource_type, match, ids).items()
+                ]
+        # Best score first, then newest
+        ranked.sort(key=lambda hit: (-hit[0], hit[1], -hit[2]))
+        hits = ranked[offset:offset + limit]
+        next_cursor = (
+            encode_cursor(offset + limit) if len(ranked) > offset + limit else None
+        )
+
+        results = self.page_results(
+            pdp, request.user, match, hits, is_emergency, location
+        )
+
+        get_audit_sink().log(
+            user=request.user,
+            action='SEARCH_RECORDS',
+            resource_type=','.join(types),
+            resource_id=patient_id or 'caseload',
+            access_granted=True,
+            is_emergency=is_emergency,
+            details={
+                'query': query,
+                'matches': len(ranked),
+                'returned': len(results),
+                'has_emergency_token': has_valid_eat,
+            }
+        )
+
+        return Response({
+            'query': query,
+            'scope': patient_id or 'caseload',
+            'is_emergency': is_emergency,
+            'has_emergency_token': has_valid_eat,
+            'results': results,
+            'page': {
+                'next_cursor': next_cursor,
+                'count': len(ranked),
+                'truncated': truncated,
+            }
+        })
+
+    def granted_ids(
+        self, pdp, user, resource_type, ids, is_emergency, location
+    ) -> list:
+        """
+        ids the user is granted, for policies without a query translation.
+        Unaudited: only the returned page is audited.
+        """
+        model = RESOURCE_MODELS[resource_type]
+        fields = ('id', *model_access_fields(model)) + (
+            ('record_type',) if resource_type == 'ehr' else ()
+        )
+        with phase('load'):
+            resources = list(model.objects.filter(id__in=ids).only(*fields))
+        results = pdp.check_access(
+            user, resource_type, resources, is_emergency, location
+        )
+        return [
+            resource.id for resource, result in zip(resources, results)
+            if result['access_granted']
+        ]
+
+    def page_results(self, pdp, user, match, hits, is_emergency, location) -> list:
+        """
+        Entries of one page of hits, in rank order. The rows are decided
+        and audited as a group like any record access; only granted rows
+        get an entry and a snippet.
+        """
+        by_type = {}
+        for _, resource_type, pk in hits:
+            by_type.setdefault(resource_type, []).append(pk)
+
+        rows = {}
+        with phase('load'):
+            for resource_type, ids in by_type.items():
+                model = RESOURCE_MODELS[resource_type]
+                rows[resource_type] = list(
+                    model.objects.filter(id__in=ids).select_related('patient').only(
+                        'id', 'created_at', 'patient__patient_id',
+                        *SEARCH_SUMMARY_FIELDS[resource_type],
+                        *model_access_fields(model)
+                    )
+                )
+        decisions = pdp.make_grouped_decisions(user, rows, is_emergency, location)
+
+        granted = {}
+        texts = {}
+        for resource_type, resources in rows.items():
+            granted[resource_type] = {
+                resource.id: resource
+                for resource, decision in zip(resources, decisions[resource_type])
+                if decision['access_granted']
+            }
+            texts[resource_type] = snippets(
+                resource_type, match, list(granted[resource_type])
+            )
+
+        return [
+            {
+                'resource_type': resource_type,
+                'id': pk,
+                'patient_id': granted[resource_type][pk].patient.patient_id,
+                **{
+                    field: getattr(granted[resource_type][pk], field)
+                    for field in SEARCH_SUMMARY_FIELDS[resource_type]
+                },
+                'created_at': granted[resource_type][pk].created_at,
+                'score': score,
+                'snippet': texts[resource_type].get(pk),
+            }
+            for score, resource_type, pk in hits
+            if pk in granted[resource_type]
+        ]
@@ -2,7 +2,19 @@ from rest_framework import serializers
 from .models import Patient, EHRRecord, MedicalReport, LabResult
 
 
-class PatientSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Accepts fields=[...] to serialize only a subset of Meta.fields
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class PatientSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Patient
         fields = [
@@ -12,7 +24,7 @@ class PatientSerializer(serializers.ModelSerializer):
         ]
 
 
-class EHRRecordSerializer(serializers.ModelSerializer):
+class EHRRecordSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = EHRRecord
         fields = [
@@ -23,7 +35,7 @@ class EHRRecordSerializer(serializers.ModelSerializer):
         ]
 
 
-class MedicalReportSerializer(serializers.ModelSerializer):
+class MedicalReportSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = MedicalReport
         fields = [
@@ -33,7 +45,7 @@ class MedicalReportSerializer(serializers.ModelSerializer):
         ]
 
 
-class LabResultSerializer(serializers.ModelSerializer):
+class LabResultSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = LabResult
         fields = [
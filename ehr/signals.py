@@ -0,0 +1,11 @@
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+from .search import install_search_indexes
+
+
+@receiver(post_migrate)
+def install_search(sender, using, **kwargs):
+    # The FTS5 tables and triggers are not part of the migrations
+    if sender.name == 'ehr':
+        install_search_indexes(using)
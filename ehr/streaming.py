@@ -0,0 +1,112 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+from .listing import ListingError
+
+
+STREAM_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Same encoding as DRF's compact JSONRenderer
+_encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+dumps = _encoder.encode
+
+
+def stream_format(query_params):
+    """
+    The requested ?stream= format, or None for a regular response
+    """
+    value = query_params.get('stream')
+    if value is None:
+        return None
+    if value not in STREAM_FORMATS:
+        raise ListingError(f"stream must be one of {', '.join(STREAM_FORMATS)}")
+    return value
+
+
+def json_document(head: dict, members: list):
+    """
+    Yields one JSON object in pieces: the keys of head, then members,
+    a list of (key, value) pairs. A value that is an iterator is written
+    as an array one item at a time; a callable is called only when its
+    turn comes, so it can report totals gathered while streaming.
+    """
+    text = dumps(head)
+    yield text[:-1]
+    separator = ',' if len(text) > 2 else ''
+
+    for key, value in members:
+        yield f'{separator}{dumps(key)}:'
+        separator = ','
+        if callable(value):
+            yield dumps(value())
+        elif hasattr(value, '__next__'):
+            yield '['
+            item_separator = ''
+            for item in value:
+                yield item_separator + dumps(item)
+                item_separator = ','
+            yield ']'
+        else:
+            yield dumps(value)
+    yield '}'
+
+
+def ndjson_lines(items):
+    for item in items:
+        yield dumps(item) + '\n'
+
+
+def buffered(pieces, size: int = 65536):
+    """
+    Joins small text pieces into chunks of about size bytes
+    """
+    buffer = []
+    length = 0
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(buffer).encode()
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def stream_response(pieces, fmt: str) -> StreamingHttpResponse:
+    return StreamingHttpResponse(
+        buffered(pieces), content_type=STREAM_FORMATS[fmt]
+    )
+
+
+def stream_chunk_size() -> int:
+    return getattr(settings, 'STREAM_CHUNK_SIZE', 2000)
+
+
+def iter_decided(
+    pdp, user, resource_type, querysets,
+    is_emergency=False, location=None, chunk_size=None
+):
+    """
+    Yields (resource, decision) for every row of querysets. Rows are read
+    with .iterator() and evaluated and audited chunk_size at a time, so
+    memory does not grow with the number of rows.
+    """
+    chunk_size = chunk_size or stream_chunk_size()
+
+    for queryset in querysets:
+        chunk = []
+        for resource in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(resource)
+            if len(chunk) == chunk_size:
+                yield from zip(chunk, pdp.make_decisions(
+                    user, resource_type, chunk, is_emergency, location
+                ))
+                chunk = []
+        if chunk:
+            yield from zip(chunk, pdp.make_decisions(
+                user, resource_type, chunk, is_emergency, location
+            ))
@@ -1,3 +1,926 @@
-from django.test import TestCase
+import asyncio
+import json
+from unittest import mock
+from io import StringIO
+from datetime import date, datetime, timezone as dt_timezone
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.http import QueryDict
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.core.cache import cache
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.throttling import UserRateThrottle
+from rest_framework.test import APIClient
+
+from authentication.models import User
+from audit.models import AuditLog
+from audit.sink import DirectAuditSink
+from .async_views import AsyncEHRAccessView
+from .models import Patient, EHRRecord, MedicalReport, LabResult
+from .serializers import (
+    PatientSerializer, EHRRecordSerializer,
+    MedicalReportSerializer, LabResultSerializer
+)
+from .fast_serializers import get_fast_serializer
+from .conditional import records_etag
+from engine.decision_point import PolicyDecisionPoint
+from policies.models import PolicySet
+from policies.store import PolicyStore, StorePolicyEvaluator, policy_store
+
+
+def create_patient(patient_id, count):
+    """
+    Patient with count records of every type across all sensitivity levels
+    """
+    patient = Patient.objects.create(
+        patient_id=patient_id, first_name='A', last_name='B',
+        date_of_birth=date(1980, 1, 1), blood_group='O+', contact_number='000'
+    )
+    departments = [None, 'cardiology', 'neurology']
+    EHRRecord.objects.bulk_create(
+        EHRRecord(
+            patient=patient, diagnosis=f'd{i}', sensitivity_level=i % 5 + 1,
+            required_clearance_level=i % 4 + 1,
+            required_department=departments[i % 3],
+            patient_consent=i % 7 != 0,
+        )
+        for i in range(count)
+    )
+    MedicalReport.objects.bulk_create(
+        MedicalReport(
+            patient=patient, report_type='mri', title='t', description='-',
+            sensitivity_level=i % 5 + 1, required_clearance_level=i % 3 + 1,
+        )
+        for i in range(count)
+    )
+    LabResult.objects.bulk_create(
+        LabResult(
+            patient=patient, test_name=f'test {i}', test_date=date(2024, 1, 1),
+            result_value='1', sensitivity_level=i % 5 + 1,
+            required_clearance_level=i % 2 + 1,
+        )
+        for i in range(count)
+    )
+    return patient
+
+
+@override_settings(AUDIT_SINK='direct')
+class PatientChartViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='chart', password='x', role='doctor',
+            department='cardiology', clearance_level=3
+        )
+        create_patient('P-SMALL', 2)
+        create_patient('P-LARGE', 40)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_sections_match_individual_endpoints(self):
+        chart = self.client.get('/api/ehr/patients/P-LARGE/chart/').data
+        ehr = self.client.get('/api/ehr/patients/P-LARGE/ehr/').data
+        reports = self.client.get('/api/ehr/patients/P-LARGE/reports/').data
+        lab = self.client.get('/api/ehr/patients/P-LARGE/lab/').data
+
+        self.assertEqual(chart['patient'], ehr['patient'])
+        self.assertEqual(chart['sections']['ehr']['accessible'], ehr['accessible_records'])
+        self.assertEqual(chart['sections']['ehr']['denied'], ehr['denied_records'])
+        self.assertEqual(chart['sections']['reports']['accessible'], reports['accessible_reports'])
+        self.assertEqual(chart['sections']['reports']['denied'], reports['denied_reports'])
+        self.assertEqual(chart['sections']['lab']['accessible'], lab['accessible_results'])
+        self.assertEqual(chart['sections']['lab']['denied'], lab['denied_results'])
+        self.assertEqual(chart['sections']['ehr']['summary']['total'], 40)
+
+    def test_query_count_is_independent_of_record_count(self):
+        self.client.get('/api/ehr/patients/P-SMALL/chart/')
+        counts = []
+        for patient_id in ('P-SMALL', 'P-LARGE'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(f'/api/ehr/patients/{patient_id}/chart/')
+            self.assertEqual(response.status_code, 200)
+            # The audit INSERT is split only by the backend's parameter limit
+            counts.append(sum(
+                not query['sql'].startswith('INSERT INTO "audit_auditlog"')
+                for query in queries.captured_queries
+            ))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_section_selection(self):
+        response = self.client.get('/api/ehr/patients/P-SMALL/chart/?sections=lab,ehr')
+        self.assertEqual(list(response.data['sections']), ['lab', 'ehr'])
+
+        response = self.client.get('/api/ehr/patients/P-SMALL/chart/?sections=ehr,xray')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/api/ehr/patients/P-NONE/chart/')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(AUDIT_SINK='direct')
+class ListingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='lister', password='x', role='doctor',
+            department='cardiology', clearance_level=3
+        )
+        cls.other = User.objects.create_user(username='other', password='x')
+        for i in range(7):
+            create_patient(f'P-{i}', 0)
+        Patient.objects.filter(patient_id__in=['P-1', 'P-4']).update(
+            blood_group='AB-', assigned_doctor=cls.other
+        )
+        Patient.objects.filter(patient_id='P-6').update(
+            created_at=datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+        )
+        create_patient('P-REC', 40)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def collect(self, url, key):
+        rows, cursor = [], None
+        while True:
+            response = self.client.get(url + (f'&cursor={cursor}' if cursor else ''))
+            self.assertEqual(response.status_code, 200)
+            data = response.data
+            page = data.get('page', data)
+            rows += data[key] if isinstance(key, str) else data[key[0]] + data[key[1]]
+            cursor = page['next_cursor']
+            if cursor is None:
+                return rows
+
+    def test_patient_pages(self):
+        patients = self.collect('/api/ehr/patients/?limit=3', 'patients')
+        ids = list(Patient.objects.order_by('id').values_list('id', flat=True))
+        self.assertEqual([p['id'] for p in patients], ids)
+
+        patients = self.collect('/api/ehr/patients/?limit=3&ordering=-id', 'patients')
+        self.assertEqual([p['id'] for p in patients], ids[::-1])
+
+    def test_patient_filters_and_count(self):
+        response = self.client.get('/api/ehr/patients/?blood_group=AB-&count=true')
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(
+            {p['patient_id'] for p in response.data['patients']}, {'P-1', 'P-4'}
+        )
+
+        response = self.client.get(f'/api/ehr/patients/?assigned_doctor={self.other.id}')
+        self.assertEqual(len(response.data['patients']), 2)
+        self.assertIsNone(response.data['count'])
+
+        response = self.client.get('/api/ehr/patients/?created_before=2021-01-01')
+        self.assertEqual([p['patient_id'] for p in response.data['patients']], ['P-6'])
+        response = self.client.get('/api/ehr/patients/?created_after=2021-01-01&count=true')
+        self.assertEqual(response.data['count'], 7)
+
+    def test_sparse_fields(self):
+        response = self.client.get('/api/ehr/patients/?fields=blood_group,last_name')
+        self.assertEqual(set(response.data['patients'][0]), {'id', 'blood_group', 'last_name'})
+
+        response = self.client.get('/api/ehr/patients/P-REC/lab/?fields=test_name')
+        for entry in response.data['accessible_results']:
+            self.assertEqual(set(entry), {'id', 'test_name', 'access_decision'})
+
+    def test_invalid_parameters(self):
+        for query in ('fields=ssn', 'cursor=%%%', 'limit=0', 'limit=x',
+                      'ordering=name', 'blood_group=Z', 'created_after=yesterday'):
+            response = self.client.get(f'/api/ehr/patients/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn('error', response.data)
+
+    def test_record_pages_cover_every_record(self):
+        full = self.client.get('/api/ehr/patients/P-REC/ehr/?limit=1000').data
+        entries = self.collect(
+            '/api/ehr/patients/P-REC/ehr/?limit=7&count=true',
+            ('accessible_records', 'denied_records')
+        )
+        self.assertEqual(len(entries), 40)
+        self.assertEqual(
+            sorted(e.get('id', e.get('record_id')) for e in entries),
+            sorted(
+                [e['id'] for e in full['accessible_records']]
+                + [e['record_id'] for e in full['denied_records']]
+            )
+        )
+        self.assertEqual(
+            sum(1 for e in entries if 'id' in e), len(full['accessible_records'])
+        )
+        self.assertEqual(full['page']['count'], None)
+
+
+@override_settings(AUDIT_SINK='direct', STREAM_CHUNK_SIZE=7)
+class StreamingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='streamer', password='x', role='nurse',
+            department='cardiology', clearance_level=2
+        )
+        create_patient('P-STREAM', 30)
+        for i in range(5):
+            create_patient(f'P-S{i}', 0)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_records_match_regular_response(self):
+        regular = self.client.get('/api/ehr/patients/P-STREAM/ehr/?limit=1000').data
+        audited = AuditLog.objects.count()
+
+        streamed = json.loads(self.get('/api/ehr/patients/P-STREAM/ehr/?stream=json'))
+        self.assertEqual(AuditLog.objects.count() - audited, 30)
+        self.assertEqual(streamed['patient'], json.loads(json.dumps(regular['patient'])))
+        self.assertEqual(
+            streamed['records'],
+            json.loads(json.dumps(regular['accessible_records'] + regular['denied_records']))
+        )
+        self.assertEqual(streamed['summary'], {
+            'total': 30,
+            'accessible': len(regular['accessible_records']),
+            'denied': len(regular['denied_records']),
+        })
+
+    def test_ndjson(self):
+        lines = self.get('/api/ehr/patients/P-STREAM/lab/?stream=ndjson&fields=test_name')
+        entries = [json.loads(line) for line in lines.splitlines()]
+        self.assertEqual(len(entries), 30)
+        for entry in entries:
+            if entry['access_decision']['granted']:
+                self.assertEqual(set(entry), {'id', 'test_name', 'access_decision'})
+
+    def test_patient_list(self):
+        document = json.loads(self.get('/api/ehr/patients/?stream=json&count=true'))
+        self.assertEqual(document['count'], 6)
+        self.assertEqual(len(document['patients']), 6)
+
+        lines = self.get('/api/ehr/patients/?stream=ndjson&fields=patient_id')
+        self.assertEqual(
+            [json.loads(line) for line in lines.splitlines()],
+            [{'id': p.id, 'patient_id': p.patient_id} for p in Patient.objects.order_by('id')]
+        )
+
+        response = self.client.get('/api/ehr/patients/?stream=xml')
+        self.assertEqual(response.status_code, 400)
+
+    def test_chart(self):
+        regular = self.client.get('/api/ehr/patients/P-STREAM/chart/').data['sections']
+        streamed = json.loads(self.get('/api/ehr/patients/P-STREAM/chart/?stream=json'))
+        for name, section in regular.items():
+            self.assertEqual(
+                streamed[name],
+                json.loads(json.dumps(section['accessible'] + section['denied']))
+            )
+            self.assertEqual(streamed['summary'][name], section['summary'])
+
+        lines = self.get('/api/ehr/patients/P-STREAM/chart/?stream=ndjson&sections=reports')
+        sections = {json.loads(line)['section'] for line in lines.splitlines()}
+        self.assertEqual(sections, {'reports'})
+
+
+class FastSerializerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        doctor = User.objects.create_user(username='fast', password='x', role='doctor')
+        patient = create_patient('P-FAST', 12)
+        Patient.objects.create(
+            patient_id='P-FULL', first_name='Ä', last_name='"quoted"',
+            date_of_birth=date(1901, 12, 31), blood_group='AB-',
+            contact_number='1', emergency_contact='2', address='x',
+            assigned_doctor=doctor
+        )
+        EHRRecord.objects.filter(patient=patient, id__in=EHRRecord.objects.filter(
+            patient=patient).values('id')[:4]).update(
+            treatment_plan=None, notes='ünïcode\n', created_by=doctor
+        )
+        LabResult.objects.filter(patient=patient).update(remarks=None, unit='mg')
+
+    def assert_identical(self, serializer_class, queryset, fields=None):
+        renderer = JSONRenderer()
+        fast = get_fast_serializer(serializer_class, fields)
+        for instance in queryset:
+            self.assertEqual(
+                renderer.render(fast(instance)),
+                renderer.render(serializer_class(instance, fields=fields).data)
+            )
+        if fast.supports_values:
+            for row, instance in zip(
+                queryset.values(*fast.value_names).order_by('id'),
+                queryset.order_by('id')
+            ):
+                self.assertEqual(
+                    renderer.render(fast.serialize_values(row)),
+                    renderer.render(serializer_class(instance, fields=fields).data)
+                )
+
+    def test_output_is_byte_identical(self):
+        cases = (
+            (PatientSerializer, Patient.objects.all()),
+            (EHRRecordSerializer, EHRRecord.objects.all()),
+            (MedicalReportSerializer, MedicalReport.objects.all()),
+            (LabResultSerializer, LabResult.objects.all()),
+        )
+        for zone in ('Asia/Kolkata', 'UTC', 'America/New_York'):
+            with timezone.override(zone):
+                for serializer_class, queryset in cases:
+                    self.assert_identical(serializer_class, queryset)
+                    self.assert_identical(
+                        serializer_class, queryset,
+                        ['id', *serializer_class.Meta.fields[-2:]]
+                    )
+
+    @override_settings(AUDIT_SINK='direct')
+    def test_views_match_drf_serializers(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(username='fast'))
+        urls = (
+            '/api/ehr/patients/P-FAST/chart/',
+            '/api/ehr/patients/?fields=first_name,date_of_birth',
+            '/api/ehr/patients/?stream=json',
+        )
+        for url in urls:
+            fast = client.get(url)
+            with self.settings(FAST_SERIALIZERS=False):
+                slow = client.get(url)
+            self.assertEqual(
+                b''.join(fast.streaming_content) if fast.streaming else fast.content,
+                b''.join(slow.streaming_content) if slow.streaming else slow.content,
+            )
+
+
+@override_settings(AUDIT_SINK='direct')
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='etag', password='x', role='doctor',
+            department='cardiology', clearance_level=3
+        )
+        cls.patient = create_patient('P-ETAG', 10)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_revalidation_returns_304_and_is_audited(self):
+        for url in (
+            '/api/ehr/patients/P-ETAG/ehr/',
+            '/api/ehr/patients/P-ETAG/reports/?limit=3',
+            '/api/ehr/patients/P-ETAG/lab/',
+            '/api/ehr/patients/P-ETAG/chart/?sections=ehr,lab',
+        ):
+            response = self.client.get(url)
+            self.assertIn('private', response['Cache-Control'])
+            etag = response['ETag']
+
+            AuditLog.objects.all().delete()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+            # Only aggregates touch the record tables: no bodies are read
+            for query in queries.captured_queries:
+                self.assertNotIn('"diagnosis"', query['sql'])
+                self.assertNotIn('"result_value"', query['sql'])
+            entry = AuditLog.objects.get()
+            self.assertEqual(entry.action, 'ACCESS_NOT_MODIFIED')
+            self.assertEqual(entry.resource_id, 'P-ETAG')
+            self.assertEqual(entry.details['etag'], etag)
+
+    def test_validator_changes(self):
+        url = '/api/ehr/patients/P-ETAG/ehr/'
+        seen = {self.etag(url)}
+
+        def assert_new(etag):
+            self.assertNotIn(etag, seen)
+            seen.add(etag)
+
+        record = EHRRecord.objects.filter(patient=self.patient).first()
+        record.notes = 'amended'
+        record.save()
+        assert_new(self.etag(url))
+
+        record.delete()
+        assert_new(self.etag(url))
+
+        self.user.clearance_level = 4
+        self.user.save()
+        assert_new(self.etag(url))
+
+        assert_new(self.etag(url + '?emergency=true'))
+        assert_new(self.etag(url + '?limit=5'))
+        self.assertEqual(self.etag(url + '?limit=5'), self.etag(url + '?limit=5'))
+
+        report = MedicalReport.objects.filter(patient=self.patient).first()
+        chart = '/api/ehr/patients/P-ETAG/chart/'
+        before = self.etag(chart)
+        report.findings = 'amended'
+        report.save()
+        self.assertNotEqual(self.etag(chart), before)
+
+    def test_validator_follows_policy_version(self):
+        pdp = PolicyDecisionPoint()
+        pdp.evaluator = StorePolicyEvaluator(store=PolicyStore(reload_interval=0))
+        querysets = {'ehr': EHRRecord.objects.filter(patient=self.patient)}
+        params = QueryDict()
+
+        builtin, count = records_etag(pdp, self.user, self.patient, querysets, params)
+        self.assertEqual(count, 10)
+        call_command('load_default_policy', '--activate', stdout=StringIO())
+        stored, _ = records_etag(pdp, self.user, self.patient, querysets, params)
+        self.assertNotEqual(builtin, stored)
+
+
+class OneRequestThrottle(UserRateThrottle):
+    rate = '1/min'
+
+
+@override_settings(AUDIT_SINK='direct')
+class AsyncViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='async', password='x', role='doctor',
+            department='cardiology', clearance_level=3,
+            is_emergency_authorized=True
+        )
+        create_patient('P-ASYNC', 15)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_responses_match_sync_views(self):
+        token = self.client.post(
+            '/api/emergency/request/', {'patient_id': 'P-ASYNC', 'reason': 'test'}
+        ).data['token_id']
+        for path in (
+            'patients/?fields=first_name,blood_group&count=true',
+            'patients/P-ASYNC/ehr/?limit=4&count=true',
+            'patients/P-ASYNC/ehr/?ordering=-id&fields=diagnosis',
+            f'patients/P-ASYNC/ehr/?token_id={token}',
+            'patients/P-ASYNC/reports/?emergency=true',
+            'patients/P-ASYNC/lab/?created_after=2000-01-01',
+        ):
+            sync = self.client.get(f'/api/ehr/{path}')
+            asynchronous = self.client.get(f'/api/async/ehr/{path}')
+            self.assertEqual(asynchronous.status_code, 200, path)
+            self.assertEqual(asynchronous.content, sync.content, path)
+            self.assertEqual(asynchronous.get('ETag'), sync.get('ETag'), path)
+
+    def test_drf_machinery_applies(self):
+        anonymous = APIClient()
+        for path in ('patients/P-ASYNC/ehr/', 'patients/P-NONE/lab/'):
+            for client in (anonymous, self.client):
+                sync = client.get(f'/api/ehr/{path}')
+                response = client.get(f'/api/async/ehr/{path}')
+                self.assertEqual(response.status_code, sync.status_code)
+                self.assertEqual(response.data, sync.data)
+                self.assertEqual(
+                    response.get('WWW-Authenticate'), sync.get('WWW-Authenticate')
+                )
+
+        with mock.patch.object(AsyncEHRAccessView, 'permission_classes', [IsAdminUser]):
+            self.assertEqual(
+                self.client.get('/api/async/ehr/patients/P-ASYNC/ehr/').status_code, 403
+            )
+        with mock.patch.object(
+            AsyncEHRAccessView, 'throttle_classes', [OneRequestThrottle]
+        ):
+            cache.clear()
+            url = '/api/async/ehr/patients/P-ASYNC/ehr/'
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(self.client.get(url).status_code, 429)
+
+    def test_errors_and_revalidation(self):
+        url = '/api/async/ehr/patients/P-ASYNC/lab/'
+        self.assertEqual(self.client.get(url + '?limit=0').status_code, 400)
+        self.assertEqual(self.client.get(url + '?stream=json').status_code, 400)
+        self.assertEqual(self.client.post(url).status_code, 405)
+        self.assertEqual(
+            self.client.get('/api/async/ehr/patients/P-NONE/lab/').status_code, 404
+        )
+        self.assertEqual(APIClient().get(url).status_code, 401)
+
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(AuditLog.objects.filter(action='ACCESS_NOT_MODIFIED').count(), 1)
+
+    async def test_concurrent_requests_with_jwt(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        client = AsyncClient()
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        paths = ('ehr', 'reports', 'lab') * 3
+        responses = await asyncio.gather(*(
+            client.get(f'/api/async/ehr/patients/P-ASYNC/{path}/', headers=headers)
+            for path in paths
+        ))
+        self.assertEqual([r.status_code for r in responses], [200] * len(paths))
+        self.assertEqual(json.loads(responses[0].content)['summary']['total_records'], 15)
+        self.assertEqual(await AuditLog.objects.acount(), 15 * len(paths))
+
+
+@override_settings(AUDIT_SINK='direct')
+class PatientBatchViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='rounds', password='x', role='nurse',
+            department='cardiology', clearance_level=2,
+            is_emergency_authorized=True
+        )
+        for i in range(6):
+            create_patient(f'P-WARD{i}', 3 + i)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def batch(self, body, query=''):
+        return self.client.post(f'/api/ehr/patients/batch/{query}', body, format='json')
+
+    def test_entries_match_chart(self):
+        token = self.client.post(
+            '/api/emergency/request/', {'patient_id': 'P-WARD1', 'reason': 'test'}
+        ).data['token_id']
+        response = self.batch({
+            'patient_ids': ['P-WARD0', 'P-NONE', 'P-WARD1', 'P-WARD0'],
+            'token_ids': {'P-WARD1': token},
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['not_found'], ['P-NONE'])
+        entries = json.loads(response.content)['patients']
+        self.assertEqual([e['patient']['patient_id'] for e in entries], ['P-WARD0', 'P-WARD1'])
+        self.assertTrue(entries[1]['has_emergency_token'])
+
+        self.assertEqual(entries[0], json.loads(
+            self.client.get('/api/ehr/patients/P-WARD0/chart/').content
+        ))
+        self.assertEqual(entries[1], json.loads(
+            self.client.get(f'/api/ehr/patients/P-WARD1/chart/?token_id={token}').content
+        ))
+
+    def test_fixed_queries_and_one_audit_batch(self):
+        counts = []
+        for size in (2, 6):
+            body = {'patient_ids': [f'P-WARD{i}' for i in range(size)], 'emergency': False}
+            with mock.patch.object(
+                DirectAuditSink, 'log_many', autospec=True,
+                side_effect=DirectAuditSink.log_many
+            ) as log_many, CaptureQueriesContext(connection) as queries:
+                response = self.batch(body)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(log_many.call_count, 1)
+            counts.append(sum(
+                not query['sql'].startswith('INSERT INTO "audit_auditlog"')
+                for query in queries.captured_queries
+            ))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(AuditLog.objects.count(), 3 * (3 + 4) + 3 * sum(range(3, 9)))
+
+    def test_streamed(self):
+        body = {'patient_ids': ['P-WARD2', 'P-WARD3'], 'sections': ['lab']}
+        regular = json.loads(self.batch(body).content)
+
+        response = self.batch(body, '?stream=json')
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), regular)
+
+        response = self.batch(body, '?stream=ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], regular['patients'])
+
+    @override_settings(BATCH_MAX_PATIENTS=3)
+    def test_invalid_batches(self):
+        for body in (
+            {},
+            {'patient_ids': []},
+            {'patient_ids': 'P-WARD0'},
+            {'patient_ids': [f'P-WARD{i}' for i in range(4)]},
+            {'patient_ids': ['P-WARD0'], 'sections': ['xray']},
+            {'patient_ids': ['P-WARD0'], 'token_ids': {'P-WARD0': 'not-a-uuid'}},
+        ):
+            self.assertEqual(self.batch(body).status_code, 400, body)
+        self.assertEqual(self.batch({'patient_ids': ['P-WARD0']}, '?stream=csv').status_code, 400)
+
+
+@override_settings(AUDIT_SINK='direct')
+class AccessCheckViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='checker', password='x', role='doctor',
+            department='cardiology', clearance_level=3
+        )
+        create_patient('P-CHECK', 20)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_decisions_match_record_endpoints(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/ehr/patients/P-CHECK/access/')
+        self.assertEqual(response.status_code, 200)
+        for query in queries.captured_queries:
+            for column in ('"diagnosis"', '"notes"', '"findings"', '"remarks"', '"result_value"'):
+                self.assertNotIn(column, query['sql'])
+
+        decisions = response.data['decisions']
+        for resource_type, path, key in (
+            ('ehr', 'ehr', 'accessible_records'),
+            ('report', 'reports', 'accessible_reports'),
+            ('lab', 'lab', 'accessible_results'),
+        ):
+            full = self.client.get(f'/api/ehr/patients/P-CHECK/{path}/').data
+            self.assertEqual(
+                [r['id'] for r in decisions[resource_type]['records'] if r['granted']],
+                [r['id'] for r in full[key]]
+            )
+            for record in decisions[resource_type]['records']:
+                self.assertEqual(record['granted'], not record['reason_codes'])
+
+        ehr = {r['id']: r for r in decisions['ehr']['records']}
+        for record in EHRRecord.objects.filter(patient__patient_id='P-CHECK'):
+            if record.required_clearance_level > 3:
+                self.assertIn('clearance', ehr[record.id]['reason_codes'])
+            if not record.patient_consent:
+                self.assertIn('consent', ehr[record.id]['reason_codes'])
+
+    def test_types_head_and_audit(self):
+        response = self.client.get('/api/ehr/patients/P-CHECK/access/?types=lab')
+        self.assertEqual(list(response.data['decisions']), ['lab'])
+        self.assertEqual(response.data['decisions']['lab']['summary']['total'], 20)
+        entry = AuditLog.objects.get(action='ACCESS_CHECK')
+        self.assertEqual(entry.resource_id, 'P-CHECK')
+
+        head = self.client.head('/api/ehr/patients/P-CHECK/access/?types=lab')
+        self.assertEqual(head['ETag'], response['ETag'])
+        entry = AuditLog.objects.latest('id')
+        self.assertEqual(AuditLog.objects.count(), 2)
+        self.assertEqual(entry.action, 'ACCESS_CHECK')
+        self.assertEqual(entry.details['etag'], head['ETag'])
+        response = self.client.get(
+            '/api/ehr/patients/P-CHECK/access/?types=lab', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get('/api/ehr/patients/P-CHECK/access/?types=xray')
+        self.assertEqual(response.status_code, 400)
+
+    def test_stored_policy_reason_codes(self):
+        policy_set = PolicySet.objects.create(name='Lockdown')
+        policy_set.rules.create(name='Deny all', effect='deny')
+        policy_set.activate()
+
+        pdp = PolicyDecisionPoint()
+        pdp.evaluator = StorePolicyEvaluator(store=PolicyStore(reload_interval=0))
+        results = pdp.check_access(self.user, 'lab', LabResult.objects.all()[:2])
+        self.assertEqual(
+            results, [{'access_granted': False, 'reason_codes': ['Deny all']}] * 2
+        )
+
+
+class PatientSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='frontdesk', password='x', role='receptionist'
+        )
+        for patient_id, first, last, phone in (
+            ('P-1001', 'Priya', 'Sharma', '+91 98765-43210'),
+            ('P-1002', 'Rohan', 'Sharma', '9123456789'),
+            ('P-1003', 'Ananya', 'Patel', '9000000001'),
+        ):
+            Patient.objects.create(
+                patient_id=patient_id, first_name=first, last_name=last,
+                date_of_birth=date(1980, 1, 1), blood_group='O+',
+                contact_number=phone
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, query, **params):
+        response = self.client.get('/api/ehr/patients/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(p['patient_id'], p['match']) for p in response.data['patients']]
+
+    def test_prefix_and_substring_matches(self):
+        self.assertEqual(
+            sorted(self.search('sha')), [('P-1001', 'prefix'), ('P-1002', 'prefix')]
+        )
+        self.assertEqual(self.search('priya SHARMA'), [('P-1001', 'prefix')])
+        self.assertEqual(self.search('P-1003'), [('P-1003', 'prefix')])
+        self.assertEqual(self.search('98765 43210'), [('P-1001', 'substring')])
+        self.assertEqual(self.search('nany'), [('P-1003', 'substring')])
+        self.assertEqual(self.search('sha', limit=1)[0][1], 'prefix')
+        self.assertEqual(self.search('zz'), [])
+
+        response = self.client.get('/api/ehr/patients/search/', {'q': 'Sharma'})
+        self.assertEqual(
+            set(response.data['patients'][0]), {*PatientSerializer.Meta.fields, 'match'}
+        )
+
+    def test_index_follows_writes(self):
+        patient = Patient.objects.get(patient_id='P-1003')
+        patient.last_name = 'Mohanty'
+        patient.save()
+        self.assertEqual(self.search('patel'), [])
+        self.assertEqual(self.search('mohanty'), [('P-1003', 'prefix')])
+
+        Patient.objects.filter(patient_id='P-1002').update(first_name='Karan')
+        self.assertEqual(self.search('karan'), [('P-1002', 'prefix')])
+
+        Patient.objects.bulk_create([Patient(
+            patient_id='P-1004', first_name='Meera', last_name='Das',
+            date_of_birth=date(1990, 1, 1), blood_group='A+', contact_number='1'
+        )])
+        self.assertEqual(self.search('meera'), [('P-1004', 'prefix')])
+
+        patient.delete()
+        self.assertEqual(self.search('mohanty'), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO ehr_patient_search(ehr_patient_search) VALUES ('delete-all')"
+            )
+        # Only the trigram index still has the patient
+        self.assertEqual(self.search('rohan'), [('P-1002', 'substring')])
+
+        stdout = StringIO()
+        call_command('rebuild_search_index', stdout=stdout)
+        self.assertIn('ehr_patient_search: 3 rows', stdout.getvalue())
+        self.assertEqual(self.search('rohan'), [('P-1002', 'prefix')])
+
+    def test_invalid_parameters(self):
+        for params in ({'q': ''}, {'q': 'a'}, {'q': 'sharma', 'limit': 0},
+                       {'q': 'sharma', 'limit': 'x'}):
+            response = self.client.get('/api/ehr/patients/search/', params)
+            self.assertEqual(response.status_code, 400)
+
+
+@override_settings(AUDIT_SINK='direct')
+class RecordSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='searcher', password='x', role='doctor',
+            department='cardiology', clearance_level=3
+        )
+        cls.patient = Patient.objects.create(
+            patient_id='P-S1', first_name='A', last_name='B',
+            date_of_birth=date(1980, 1, 1), blood_group='O+',
+            contact_number='000', assigned_doctor=cls.user
+        )
+        other = Patient.objects.create(
+            patient_id='P-S2', first_name='C', last_name='D',
+            date_of_birth=date(1980, 1, 1), blood_group='O+', contact_number='000'
+        )
+        cls.main = EHRRecord.objects.create(
+            patient=cls.patient, diagnosis='Atrial fibrillation',
+            medications='Warfarin 5mg daily'
+        )
+        cls.secret = EHRRecord.objects.create(
+            patient=cls.patient, diagnosis='Warfarin overdose',
+            medications='Warfarin', sensitivity_level=5, required_clearance_level=5
+        )
+        cls.note = EHRRecord.objects.create(
+            patient=cls.patient, diagnosis='Follow-up',
+            notes='Asked about <b>warfarin</b> diet. ' + 'Stable. ' * 40
+        )
+        cls.report = MedicalReport.objects.create(
+            patient=cls.patient, report_type='mri', title='MRI Brain',
+            description='-', findings='No bleed despite warfarin'
+        )
+        cls.lab = LabResult.objects.create(
+            patient=cls.patient, test_name='INR', test_date=date(2024, 1, 1),
+            result_value='2.5', remarks='On warfarin therapy'
+        )
+        EHRRecord.objects.create(patient=other, diagnosis='-', medications='Warfarin')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, **params):
+        response = self.client.get('/api/ehr/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_denied_records_are_not_returned(self):
+        data = self.search(q='warfarin', patient_id='P-S1')
+        hits = [(r['resource_type'], r['id']) for r in data['results']]
+        self.assertEqual(set(hits), {
+            ('ehr', self.main.id), ('ehr', self.note.id),
+            ('report', self.report.id), ('lab', self.lab.id),
+        })
+        self.assertEqual(data['page']['count'], 4)
+        # A hit in a weighted column of a short record ranks first
+        self.assertEqual(hits[0], ('ehr', self.main.id))
+        for result in data['results']:
+            self.assertEqual(result['patient_id'], 'P-S1')
+            self.assertIn('<mark>', result['snippet'])
+            self.assertNotIn('<b>', result['snippet'])
+
+        audited = AuditLog.objects.filter(action='ACCESS_EHR')
+        self.assertEqual(
+            set(audited.values_list('resource_id', flat=True)),
+            {str(self.main.id), str(self.note.id)}
+        )
+        search = AuditLog.objects.get(action='SEARCH_RECORDS')
+        self.assertEqual(search.resource_id, 'P-S1')
+        self.assertEqual(search.details['returned'], 4)
+
+    def test_stemming_types_and_caseload(self):
+        data = self.search(q='fibrillations', patient_id='P-S1')
+        self.assertEqual([r['id'] for r in data['results']], [self.main.id])
+
+        data = self.search(q='MRI', patient_id='P-S1', types='report')
+        self.assertEqual([r['title'] for r in data['results']], ['MRI Brain'])
+
+        # The other patient is not in the caseload
+        data = self.search(q='warfarin', scope='caseload', types='ehr')
+        self.assertEqual(
+            {r['id'] for r in data['results']}, {self.main.id, self.note.id}
+        )
+
+    def test_pagination(self):
+        everything = self.search(q='warfarin', patient_id='P-S1')['results']
+        paged, cursor = [], None
+        while True:
+            params = {'q': 'warfarin', 'patient_id': 'P-S1', 'limit': 1}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.search(**params)
+            paged += data['results']
+            cursor = data['page']['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(paged, everything)
+
+    def test_index_follows_writes(self):
+        self.lab.remarks = 'Heparin bridge'
+        self.lab.save()
+        self.assertEqual(self.search(q='heparin', patient_id='P-S1')['page']['count'], 1)
+        self.assertEqual(
+            self.search(q='warfarin', patient_id='P-S1', types='lab')['results'], []
+        )
+
+        self.report.delete()
+        self.assertEqual(self.search(q='MRI', patient_id='P-S1')['results'], [])
+
+    def test_stored_policy_without_query_translation(self):
+        PolicySet.objects.create(name='Lockdown').activate()
+        # The shared store would keep the rolled back set until its next poll
+        self.addCleanup(policy_store.invalidate)
+        data = self.search(q='warfarin', patient_id='P-S1')
+        self.assertEqual(data['results'], [])
+        self.assertEqual(data['page']['count'], 0)
+
+    def test_invalid_parameters(self):
+        for params in (
+            {'patient_id': 'P-S1'},
+            {'q': 'warfarin'},
+            {'q': 'warfarin', 'patient_id': 'P-S1', 'types': 'xray'},
+            {'q': 'warfarin', 'patient_id': 'P-S1', 'limit': 0},
+            {'q': 'warfarin', 'patient_id': 'P-S1', 'cursor': '!'},
+        ):
+            response = self.client.get('/api/ehr/search/', params)
+            self.assertEqual(response.status_code, 400, params)
+        response = self.client.get('/api/ehr/search/', {'q': 'x', 'patient_id': 'P-NONE'})
+        self.assertEqual(response.status_code, 404)
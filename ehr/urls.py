@@ -3,12 +3,20 @@ from .views import (
     PatientListView,
     EHRAccessView,
     MedicalReportAccessView,
-    LabResultAccessView
+    LabResultAccessView,
+    AccessCheckView
 )
+from .chart_views import PatientChartView, PatientBatchView
+from .search_views import PatientSearchView, RecordSearchView
 
 urlpatterns = [
+    path('search/', RecordSearchView.as_view(), name='record_search'),
     path('patients/', PatientListView.as_view(), name='patient_list'),
+    path('patients/search/', PatientSearchView.as_view(), name='patient_search'),
+    path('patients/batch/', PatientBatchView.as_view(), name='patient_batch'),
     path('patients/<str:patient_id>/ehr/', EHRAccessView.as_view(), name='ehr_access'),
     path('patients/<str:patient_id>/reports/', MedicalReportAccessView.as_view(), name='report_access'),
     path('patients/<str:patient_id>/lab/', LabResultAccessView.as_view(), name='lab_access'),
+    path('patients/<str:patient_id>/access/', AccessCheckView.as_view(), name='access_check'),
+    path('patients/<str:patient_id>/chart/', PatientChartView.as_view(), name='patient_chart'),
 ]
\ No newline at end of file
@@ -4,31 +4,37 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from django.shortcuts import get_object_or_404
 
-from .models import Patient, EHRRecord, MedicalReport, LabResult
+from .models import Patient, EHRRecord, MedicalReport, LabResult, RESOURCE_MODELS
 from .serializers import (
     PatientSerializer, EHRRecordSerializer,
     MedicalReportSerializer, LabResultSerializer
 )
+from .fast_serializers import get_serializer
+from .listing import (
+    ListingError, CREATED_RANGE_FILTERS, parse_listing, parse_int,
+    choice_parser, keyset, page, total_count
+)
+from .conditional import records_etag, not_modified, with_etag
+from .streaming import (
+    stream_format, stream_response, stream_chunk_size, json_document,
+    ndjson_lines
+)
+from .access import (
+    check_emergency_token, load_page_by_access, split_by_decision,
+    stream_records, resource_types,
+    ehr_denied_entry, report_denied_entry, lab_denied_entry
+)
 from engine.decision_point import PolicyDecisionPoint
-from emergency.models import EmergencyAccessToken
+from engine.query_compiler import model_access_fields
+from engine.timing import phase
+from audit.sink import get_audit_sink
 
 
-def check_emergency_token(user, patient_id, token_id):
-    """
-    Helper to check if a valid EAT exists
-    """
-    if not token_id:
-        return False
-    try:
-        token = EmergencyAccessToken.objects.get(
-            token_id=token_id,
-            requested_by=user,
-            patient_id=patient_id,
-            status='active'
-        )
-        return token.is_valid()
-    except EmergencyAccessToken.DoesNotExist:
-        return False
+PATIENT_FILTERS = {
+    'assigned_doctor': ('assigned_doctor_id', parse_int),
+    'blood_group': ('blood_group', choice_parser(Patient.BLOOD_GROUP_CHOICES)),
+    **CREATED_RANGE_FILTERS,
+}
 
 
 class PatientListView(APIView):
@@ -36,15 +42,62 @@ class PatientListView(APIView):
 
     def get(self, request):
         """
-        List all patients - basic info only
+        List patients - basic info only, one keyset page at a time
         """
-        patients = Patient.objects.all()
-        serializer = PatientSerializer(patients, many=True)
+        try:
+            listing = parse_listing(
+                request.query_params, PatientSerializer.Meta.fields, PATIENT_FILTERS
+            )
+            fmt = stream_format(request.query_params)
+        except ListingError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = get_serializer(PatientSerializer, listing['fields'])
+        if getattr(serializer, 'supports_values', False):
+            # Compiled serializers read .values() rows: no model instances
+            patients = Patient.objects.values(*serializer.value_names)
+            serialize = serializer.serialize_values
+        else:
+            patients = Patient.objects.all()
+            if listing['fields']:
+                patients = patients.only(*listing['fields'])
+            serialize = serializer
+
+        if fmt:
+            return self.stream(patients, serialize, listing, fmt)
+
+        with phase('load'):
+            rows, next_cursor = page(
+                list(keyset(patients, listing)[:listing['limit'] + 1]), listing
+            )
+        with phase('serialize'):
+            data = [serialize(row) for row in rows]
+
         return Response({
-            'count': patients.count(),
-            'patients': serializer.data
+            'count': total_count(Patient.objects.all(), listing),
+            'next_cursor': next_cursor,
+            'patients': data
         })
 
+    def stream(self, patients, serialize, listing, fmt):
+        """
+        Every patient matching the filters, from the cursor on, read in
+        chunks and written as they are serialized
+        """
+        rows = (
+            serialize(patient)
+            for patient in keyset(patients, listing).iterator(
+                chunk_size=stream_chunk_size()
+            )
+        )
+        if fmt == 'ndjson':
+            return stream_response(ndjson_lines(rows), fmt)
+
+        head = {}
+        if listing['count']:
+            head['count'] = total_count(Patient.objects.all(), listing)
+        return stream_response(json_document(head, [('patients', rows)]), fmt)
+
 
 class EHRAccessView(APIView):
     permission_classes = [IsAuthenticated]
@@ -54,63 +107,84 @@ class EHRAccessView(APIView):
         Access EHR records for a patient
         Runs through Attribute Engine for every request
         """
+        try:
+            listing = parse_listing(
+                request.query_params, EHRRecordSerializer.Meta.fields, CREATED_RANGE_FILTERS
+            )
+            fmt = stream_format(request.query_params)
+        except ListingError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         patient = get_object_or_404(Patient, patient_id=patient_id)
         is_emergency = request.query_params.get('emergency', 'false').lower() == 'true'
         token_id = request.query_params.get('token_id', None)
         location = request.query_params.get('location', None)
 
         # Check emergency token
-        has_valid_eat = check_emergency_token(request.user, patient_id, token_id)
+        has_valid_eat = check_emergency_token(request.user, patient_id, token_id, 'ehr')
         if has_valid_eat:
             is_emergency = True
 
-        # Get all EHR records for patient
-        records = EHRRecord.objects.filter(patient=patient)
-
         pdp = PolicyDecisionPoint()
-        accessible_records = []
-        denied_records = []
-
-        for record in records:
-            decision = pdp.make_decision(
-                user=request.user,
-                resource_type='ehr',
-                resource=record,
-                is_emergency=is_emergency,
-                location=location
+        if fmt:
+            return stream_records(
+                fmt, pdp, request.user, 'ehr',
+                EHRRecord.objects.filter(patient=patient), ['record_type'],
+                EHRRecordSerializer, ehr_denied_entry, listing,
+                {
+                    'patient': get_serializer(PatientSerializer)(patient),
+                    'is_emergency': is_emergency,
+                    'has_emergency_token': has_valid_eat,
+                },
+                is_emergency, location
             )
 
-            if decision['access_granted']:
-                data = EHRRecordSerializer(record).data
-                data['access_decision'] = {
-                    'granted': True,
-                    'checks_passed': decision['checks_passed'],
-                }
-                accessible_records.append(data)
-            else:
-                denied_records.append({
-                    'record_id': record.id,
-                    'record_type': record.record_type,
-                    'sensitivity_level': record.sensitivity_level,
-                    'access_decision': {
-                        'granted': False,
-                        'checks_failed': decision['checks_failed'],
-                        'reasons': decision['reasons'],
-                    }
-                })
+        # Revalidation answers from the ETag without reading any record
+        etag, count = records_etag(
+            pdp, request.user, patient,
+            {'ehr': EHRRecord.objects.filter(patient=patient)},
+            request.query_params, is_emergency, has_valid_eat, location
+        )
+        cached = not_modified(
+            request, etag, count, 'ehr', patient, is_emergency, has_valid_eat
+        )
+        if cached is not None:
+            return cached
+
+        # One page of the patient's EHR records
+        records, next_cursor = load_page_by_access(
+            pdp, request.user, 'ehr',
+            EHRRecord.objects.filter(patient=patient), ['record_type'], listing,
+            is_emergency, location
+        )
+        decisions = pdp.make_decisions(
+            user=request.user,
+            resource_type='ehr',
+            resources=records,
+            is_emergency=is_emergency,
+            location=location
+        )
 
-        return Response({
-            'patient': PatientSerializer(patient).data,
+        accessible_records, denied_records = split_by_decision(
+            records, decisions, EHRRecordSerializer, ehr_denied_entry, listing['fields']
+        )
+
+        return with_etag(Response({
+            'patient': get_serializer(PatientSerializer)(patient),
             'is_emergency': is_emergency,
             'has_emergency_token': has_valid_eat,
             'accessible_records': accessible_records,
             'denied_records': denied_records,
             'summary': {
-                'total_records': records.count(),
+                'total_records': len(records),
                 'accessible': len(accessible_records),
                 'denied': len(denied_records),
+            },
+            'page': {
+                'next_cursor': next_cursor,
+                'count': total_count(EHRRecord.objects.filter(patient=patient), listing),
             }
-        })
+        }), etag)
 
 
 class MedicalReportAccessView(APIView):
@@ -120,58 +194,80 @@ class MedicalReportAccessView(APIView):
         """
         Access Medical Reports for a patient
         """
+        try:
+            listing = parse_listing(
+                request.query_params, MedicalReportSerializer.Meta.fields, CREATED_RANGE_FILTERS
+            )
+            fmt = stream_format(request.query_params)
+        except ListingError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         patient = get_object_or_404(Patient, patient_id=patient_id)
         is_emergency = request.query_params.get('emergency', 'false').lower() == 'true'
         token_id = request.query_params.get('token_id', None)
         location = request.query_params.get('location', None)
 
-        has_valid_eat = check_emergency_token(request.user, patient_id, token_id)
+        has_valid_eat = check_emergency_token(request.user, patient_id, token_id, 'report')
         if has_valid_eat:
             is_emergency = True
 
-        reports = MedicalReport.objects.filter(patient=patient)
         pdp = PolicyDecisionPoint()
+        if fmt:
+            return stream_records(
+                fmt, pdp, request.user, 'report',
+                MedicalReport.objects.filter(patient=patient), ['report_type'],
+                MedicalReportSerializer, report_denied_entry, listing,
+                {
+                    'patient': get_serializer(PatientSerializer)(patient),
+                    'is_emergency': is_emergency,
+                },
+                is_emergency, location
+            )
 
-        accessible = []
-        denied = []
+        # Revalidation answers from the ETag without reading any record
+        etag, count = records_etag(
+            pdp, request.user, patient,
+            {'report': MedicalReport.objects.filter(patient=patient)},
+            request.query_params, is_emergency, has_valid_eat, location
+        )
+        cached = not_modified(
+            request, etag, count, 'report', patient, is_emergency, has_valid_eat
+        )
+        if cached is not None:
+            return cached
 
-        for report in reports:
-            decision = pdp.make_decision(
-                user=request.user,
-                resource_type='report',
-                resource=report,
-                is_emergency=is_emergency,
-                location=location
-            )
+        reports, next_cursor = load_page_by_access(
+            pdp, request.user, 'report',
+            MedicalReport.objects.filter(patient=patient), ['report_type'], listing,
+            is_emergency, location
+        )
+        decisions = pdp.make_decisions(
+            user=request.user,
+            resource_type='report',
+            resources=reports,
+            is_emergency=is_emergency,
+            location=location
+        )
 
-            if decision['access_granted']:
-                data = MedicalReportSerializer(report).data
-                data['access_decision'] = {
-                    'granted': True,
-                    'checks_passed': decision['checks_passed'],
-                }
-                accessible.append(data)
-            else:
-                denied.append({
-                    'report_id': report.id,
-                    'report_type': report.report_type,
-                    'access_decision': {
-                        'granted': False,
-                        'reasons': decision['reasons'],
-                    }
-                })
+        accessible, denied = split_by_decision(
+            reports, decisions, MedicalReportSerializer, report_denied_entry, listing['fields']
+        )
 
-        return Response({
-            'patient': PatientSerializer(patient).data,
+        return with_etag(Response({
+            'patient': get_serializer(PatientSerializer)(patient),
             'is_emergency': is_emergency,
             'accessible_reports': accessible,
             'denied_reports': denied,
             'summary': {
-                'total': reports.count(),
+                'total': len(reports),
                 'accessible': len(accessible),
                 'denied': len(denied),
+            },
+            'page': {
+                'next_cursor': next_cursor,
+                'count': total_count(MedicalReport.objects.filter(patient=patient), listing),
             }
-        })
+        }), etag)
 
 
 class LabResultAccessView(APIView):
@@ -181,55 +277,190 @@ class LabResultAccessView(APIView):
         """
         Access Lab Results for a patient
         """
+        try:
+            listing = parse_listing(
+                request.query_params, LabResultSerializer.Meta.fields, CREATED_RANGE_FILTERS
+            )
+            fmt = stream_format(request.query_params)
+        except ListingError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         patient = get_object_or_404(Patient, patient_id=patient_id)
         is_emergency = request.query_params.get('emergency', 'false').lower() == 'true'
         token_id = request.query_params.get('token_id', None)
         location = request.query_params.get('location', None)
 
-        has_valid_eat = check_emergency_token(request.user, patient_id, token_id)
+        has_valid_eat = check_emergency_token(request.user, patient_id, token_id, 'lab')
         if has_valid_eat:
             is_emergency = True
 
-        results = LabResult.objects.filter(patient=patient)
         pdp = PolicyDecisionPoint()
+        if fmt:
+            return stream_records(
+                fmt, pdp, request.user, 'lab',
+                LabResult.objects.filter(patient=patient), ['test_name'],
+                LabResultSerializer, lab_denied_entry, listing,
+                {
+                    'patient': get_serializer(PatientSerializer)(patient),
+                    'is_emergency': is_emergency,
+                },
+                is_emergency, location
+            )
 
-        accessible = []
-        denied = []
+        # Revalidation answers from the ETag without reading any record
+        etag, count = records_etag(
+            pdp, request.user, patient,
+            {'lab': LabResult.objects.filter(patient=patient)},
+            request.query_params, is_emergency, has_valid_eat, location
+        )
+        cached = not_modified(
+            request, etag, count, 'lab', patient, is_emergency, has_valid_eat
+        )
+        if cached is not None:
+            return cached
 
-        for result in results:
-            decision = pdp.make_decision(
-                user=request.user,
-                resource_type='lab',
-                resource=result,
-                is_emergency=is_emergency,
-                location=location
-            )
+        results, next_cursor = load_page_by_access(
+            pdp, request.user, 'lab',
+            LabResult.objects.filter(patient=patient), ['test_name'], listing,
+            is_emergency, location
+        )
+        decisions = pdp.make_decisions(
+            user=request.user,
+            resource_type='lab',
+            resources=results,
+            is_emergency=is_emergency,
+            location=location
+        )
 
-            if decision['access_granted']:
-                data = LabResultSerializer(result).data
-                data['access_decision'] = {
-                    'granted': True,
-                    'checks_passed': decision['checks_passed'],
-                }
-                accessible.append(data)
-            else:
-                denied.append({
-                    'result_id': result.id,
-                    'test_name': result.test_name,
-                    'access_decision': {
-                        'granted': False,
-                        'reasons': decision['reasons'],
-                    }
-                })
+        accessible, denied = split_by_decision(
+            results, decisions, LabResultSerializer, lab_denied_entry, listing['fields']
+        )
 
-        return Response({
-            'patient': PatientSerializer(patient).data,
+        return with_etag(Response({
+            'patient': get_serializer(PatientSerializer)(patient),
             'is_emergency': is_emergency,
             'accessible_results': accessible,
             'denied_results': denied,
             'summary': {
-                'total': results.count(),
+                'total': len(results),
                 'accessible': len(accessible),
                 'denied': len(denied),
+            },
+            'page': {
+                'next_cursor': next_cursor,
+                'count': total_count(LabResult.objects.filter(patient=patient), listing),
             }
-        })
\ No newline at end of file
+        }), etag)
+
+
+class AccessCheckView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, patient_id):
+        """
+        Access decisions for every record of a patient, without any
+        clinical content: granted flag and reason codes per record id.
+        Only the id and access-control columns are read.
+        ?types=ehr,report,lab selects resource types. HEAD answers with
+        the ETag alone, without evaluating anything.
+        """
+        try:
+            types = resource_types(request.query_params)
+        except ListingError as e:
+            return Response({
+                'error': str(e),
+                'available_types': list(RESOURCE_MODELS),
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        patient = get_object_or_404(Patient, patient_id=patient_id)
+        is_emergency = request.query_params.get('emergency', 'false').lower() == 'true'
+        token_id = request.query_params.get('token_id', None)
+        location = request.query_params.get('location', None)
+
+        has_valid_eat = check_emergency_token(request.user, patient_id, token_id, *types)
+        if has_valid_eat:
+            is_emergency = True
+
+        pdp = PolicyDecisionPoint()
+        querysets = {
+            resource_type: RESOURCE_MODELS[resource_type].objects.filter(patient=patient)
+            for resource_type in types
+        }
+        etag, count = records_etag(
+            pdp, request.user, patient, querysets, request.query_params,
+            is_emergency, has_valid_eat, location
+        )
+        cached = not_modified(
+            request, etag, count, 'access_check', patient, is_emergency, has_valid_eat
+        )
+        if cached is not None:
+            return cached
+        if request.method == 'HEAD':
+            # The ETag still reveals whether the records changed
+            get_audit_sink().log(
+                user=request.user,
+                action='ACCESS_CHECK',
+                resource_type=','.join(types),
+                resource_id=patient.patient_id,
+                access_granted=True,
+                is_emergency=is_emergency,
+                details={
+                    'records': count,
+                    'etag': etag,
+                    'has_emergency_token': has_valid_eat,
+                }
+            )
+            return with_etag(Response(), etag)
+
+        decisions = {}
+        granted = 0
+        for resource_type, queryset in querysets.items():
+            model = RESOURCE_MODELS[resource_type]
+            # record_type is a policy attribute of EHR records
+            fields = ('id', *model_access_fields(model)) + (
+                ('record_type',) if resource_type == 'ehr' else ()
+            )
+            with phase('load'):
+                resources = list(queryset.order_by('id').only(*fields))
+            results = pdp.check_access(
+                request.user, resource_type, resources, is_emergency, location
+            )
+            accessible = sum(result['access_granted'] for result in results)
+            granted += accessible
+            decisions[resource_type] = {
+                'records': [
+                    {
+                        'id': resource.id,
+                        'granted': result['access_granted'],
+                        'reason_codes': result['reason_codes'],
+                    }
+                    for resource, result in zip(resources, results)
+                ],
+                'summary': {
+                    'total': len(resources),
+                    'accessible': accessible,
+                    'denied': len(resources) - accessible,
+                },
+            }
+
+        # One entry for the whole check: no record content was returned
+        get_audit_sink().log(
+            user=request.user,
+            action='ACCESS_CHECK',
+            resource_type=','.join(types),
+            resource_id=patient.patient_id,
+            access_granted=True,
+            is_emergency=is_emergency,
+            details={
+                'records': count,
+                'accessible': granted,
+                'has_emergency_token': has_valid_eat,
+            }
+        )
+
+        return with_etag(Response({
+            'patient_id': patient.patient_id,
+            'is_emergency': is_emergency,
+            'has_emergency_token': has_valid_eat,
+            'decisions': decisions,
+        }), etag)
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class EmergencyConfig(AppConfig):
     name = 'emergency'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .sweeper import expiry_sweeper
+        if expiry_sweeper.interval > 0:
+            expiry_sweeper.start()
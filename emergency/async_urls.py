@@ -0,0 +1,8 @@
+from django.urls import path
+from .async_views import AsyncRequestEATView, AsyncValidateEATView, AsyncMyTokensView
+
+urlpatterns = [
+    path('request/', AsyncRequestEATView.as_view(), name='async_request_eat'),
+    path('validate/', AsyncValidateEATView.as_view(), name='async_validate_eat'),
+    path('my-tokens/', AsyncMyTokensView.as_view(), name='async_my_tokens'),
+]
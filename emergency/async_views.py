@@ -0,0 +1,66 @@
+from asgiref.sync import sync_to_async
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from rest_framework import status
+
+from .eat_handler import EATHandler
+from .models import EmergencyAccessToken
+from engine.async_api import AsyncAPIView
+
+
+class AsyncRequestEATView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    async def post(self, request):
+        patient_id = request.data.get('patient_id')
+        reason = request.data.get('reason')
+
+        if not patient_id or not reason:
+            return Response(
+                {'error': 'patient_id and reason are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        handler = EATHandler()
+        result = await sync_to_async(handler.generate_token)(
+            request.user, patient_id, reason
+        )
+
+        if result['success']:
+            return Response(result, status=status.HTTP_201_CREATED)
+        return Response(result, status=status.HTTP_403_FORBIDDEN)
+
+
+class AsyncValidateEATView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    async def post(self, request):
+        token_id = request.data.get('token_id')
+
+        if not token_id:
+            return Response(
+                {'error': 'token_id is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        handler = EATHandler()
+        result = await sync_to_async(handler.validate_token)(token_id, request.user)
+
+        return Response(result)
+
+
+class AsyncMyTokensView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request):
+        tokens = EmergencyAccessToken.objects.filter(
+            requested_by=request.user
+        ).values(
+            'token_id', 'patient_id', 'status',
+            'issued_at', 'expires_at', 'times_used',
+            'reason'
+        )
+
+        return Response({
+            'tokens': [token async for token in tokens]
+        })
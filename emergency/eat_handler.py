@@ -1,8 +1,14 @@
 from datetime import timedelta
 from django.utils import timezone
 from django.conf import settings
-from .models import EmergencyAccessToken
-from audit.models import AuditLog
+from .models import EmergencyAccessToken, format_remaining
+from .signed_tokens import (
+    SignedTokenError, is_signed, revocation_list, sign_token, verify_token
+)
+from .token_cache import token_cache
+from .usage import get_usage_counter
+from audit.sink import get_audit_sink
+from engine.timing import timed
 
 
 class EATHandler:
@@ -11,6 +17,7 @@ class EATHandler:
     validation, and usage
     """
 
+    @timed('eat')
     def generate_token(self, user, patient_id: str, reason: str) -> dict:
         """
         Generate a new Emergency Access Token
@@ -39,6 +46,7 @@ class EATHandler:
                 'expires_at': existing.expires_at,
                 'remaining_time': existing.get_remaining_time(),
                 'already_existed': True,
+                **self.signed_form(existing),
             }
 
         # Generate new token
@@ -55,7 +63,7 @@ class EATHandler:
         )
 
         # Log it
-        AuditLog.objects.create(
+        get_audit_sink().log(
             user=user,
             action='EMERGENCY_TOKEN_ISSUED',
             resource_type='patient',
@@ -78,6 +86,7 @@ class EATHandler:
             'expires_at': token.expires_at,
             'remaining_time': token.get_remaining_time(),
             'validity_minutes': validity_minutes,
+            **self.signed_form(token),
             'access_scope': {
                 'ehr_data': token.can_access_ehr,
                 'medical_reports': token.can_access_reports,
@@ -85,10 +94,13 @@ class EATHandler:
             }
         }
 
+    @timed('eat')
     def validate_token(self, token_id: str, user) -> dict:
         """
         Validate an Emergency Access Token
         """
+        if is_signed(token_id):
+            return self.validate_signed_token(token_id, user)
         try:
             token = EmergencyAccessToken.objects.get(
                 token_id=token_id,
@@ -101,10 +113,12 @@ class EATHandler:
             }
 
         if token.is_valid():
-            token.use_token()
+            times_used = get_usage_counter().use(token)
+            # Record requests carrying this token now skip the lookup
+            token_cache.put(token)
 
             # Log usage
-            AuditLog.objects.create(
+            get_audit_sink().log(
                 user=user,
                 action='EMERGENCY_TOKEN_USED',
                 resource_type='patient',
@@ -113,7 +127,7 @@ class EATHandler:
                 is_emergency=True,
                 details={
                     'token_id': str(token.token_id),
-                    'times_used': token.times_used,
+                    'times_used': times_used,
                     'remaining_time': token.get_remaining_time(),
                 }
             )
@@ -123,7 +137,7 @@ class EATHandler:
                 'message': 'Token is valid',
                 'patient_id': token.patient_id,
                 'remaining_time': token.get_remaining_time(),
-                'times_used': token.times_used,
+                'times_used': times_used,
                 'access_scope': {
                     'ehr_data': token.can_access_ehr,
                     'medical_reports': token.can_access_reports,
@@ -132,7 +146,7 @@ class EATHandler:
             }
         else:
             # Log expiry
-            AuditLog.objects.create(
+            get_audit_sink().log(
                 user=user,
                 action='EMERGENCY_TOKEN_EXPIRED',
                 resource_type='patient',
@@ -151,10 +165,86 @@ class EATHandler:
                 'expired_at': token.expires_at,
             }
 
+    def validate_signed_token(self, value: str, user) -> dict:
+        """
+        validate_token for a signed token: a signature check and a
+        revocation list lookup instead of reading the row. times_used is
+        not returned since the row is never read.
+        """
+        try:
+            claims = verify_token(value)
+        except SignedTokenError:
+            claims = None
+        if claims is None or claims.issuer != user.pk:
+            return {
+                'valid': False,
+                'message': 'Token not found'
+            }
+
+        now = timezone.now()
+        if claims.expires_at <= now or revocation_list.is_revoked(claims.token_id):
+            get_audit_sink().log(
+                user=user,
+                action='EMERGENCY_TOKEN_EXPIRED',
+                resource_type='patient',
+                resource_id=claims.patient_id,
+                access_granted=False,
+                is_emergency=True,
+                details={
+                    'token_id': str(claims.token_id),
+                    'expired_at': str(claims.expires_at),
+                    'signed': True,
+                }
+            )
+
+            return {
+                'valid': False,
+                'message': 'Token has expired',
+                'expired_at': claims.expires_at,
+            }
+
+        get_usage_counter().record(claims.token_id, now)
+        remaining_time = format_remaining(claims.expires_at)
+
+        get_audit_sink().log(
+            user=user,
+            action='EMERGENCY_TOKEN_USED',
+            resource_type='patient',
+            resource_id=claims.patient_id,
+            access_granted=True,
+            is_emergency=True,
+            details={
+                'token_id': str(claims.token_id),
+                'remaining_time': remaining_time,
+                'signed': True,
+            }
+        )
+
+        return {
+            'valid': True,
+            'message': 'Token is valid',
+            'patient_id': claims.patient_id,
+            'remaining_time': remaining_time,
+            'access_scope': {
+                'ehr_data': claims.can_access_ehr,
+                'medical_reports': claims.can_access_reports,
+                'lab_results': claims.can_access_lab,
+            }
+        }
+
+    @timed('eat')
     def revoke_token(self, token_id: str, user) -> dict:
         """
         Revoke an active token
         """
+        if is_signed(token_id):
+            try:
+                token_id = verify_token(token_id).token_id
+            except SignedTokenError:
+                return {
+                    'success': False,
+                    'message': 'Token not found'
+                }
         try:
             token = EmergencyAccessToken.objects.get(
                 token_id=token_id,
@@ -171,4 +261,12 @@ class EATHandler:
             return {
                 'success': False,
                 'message': 'Token not found'
-            }
\ No newline at end of file
+            }
+
+    def signed_form(self, token) -> dict:
+        """
+        The signed token to hand out alongside token_id, if enabled
+        """
+        if getattr(settings, 'EMERGENCY_TOKEN_FORMAT', 'uuid') != 'signed':
+            return {}
+        return {'token': sign_token(token)}
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from audit.sink import get_audit_sink
+from emergency.sweeper import sweep_expired_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Marks active Emergency Access Tokens past their expiry as expired "
+        "and audits them. Runs once unless --interval is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float,
+            help="Keep sweeping every this many seconds"
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if interval is not None and interval <= 0:
+            raise CommandError("--interval must be positive")
+
+        while True:
+            started = time.perf_counter()
+            expired = sweep_expired_tokens()
+            get_audit_sink().flush()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"Expired {expired} tokens in {elapsed * 1000:.1f}ms")
+            if interval is None:
+                return
+            time.sleep(interval)
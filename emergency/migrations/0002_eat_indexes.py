@@ -0,0 +1,27 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emergencyaccesstoken',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['requested_by', 'patient_id', '-issued_at'], name='eat_active_owner_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emergencyaccesstoken',
+            index=models.Index(fields=['requested_by', '-issued_at'], name='eat_owner_issued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='emergencyaccesstoken',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['expires_at'], name='eat_active_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-18 22:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emergency', '0002_eat_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emergencyaccesstoken',
+            index=models.Index(condition=models.Q(('status', 'revoked')), fields=['expires_at'], name='eat_revoked_expiry_idx'),
+        ),
+    ]
@@ -1,9 +1,19 @@
 from django.db import models
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce, Greatest
 from authentication.models import User
 from django.utils import timezone
 import uuid
 
 
+# Resource type -> the scope flag that lets a token read it
+TOKEN_SCOPES = {
+    'ehr': 'can_access_ehr',
+    'report': 'can_access_reports',
+    'lab': 'can_access_lab',
+}
+
+
 class EmergencyAccessToken(models.Model):
 
     STATUS_CHOICES = [
@@ -51,29 +61,74 @@ class EmergencyAccessToken(models.Model):
 
     class Meta:
         ordering = ['-issued_at']
+        indexes = [
+            # Active token of a user for a patient, newest first
+            models.Index(
+                fields=['requested_by', 'patient_id', '-issued_at'],
+                name='eat_active_owner_idx',
+                condition=Q(status='active'),
+            ),
+            # A user's tokens, newest first
+            models.Index(
+                fields=['requested_by', '-issued_at'],
+                name='eat_owner_issued_idx',
+            ),
+            # Active tokens past their expiry
+            models.Index(
+                fields=['expires_at'],
+                name='eat_active_expiry_idx',
+                condition=Q(status='active'),
+            ),
+            # Revoked tokens still within their validity
+            models.Index(
+                fields=['expires_at'],
+                name='eat_revoked_expiry_idx',
+                condition=Q(status='revoked'),
+            ),
+        ]
 
     def __str__(self):
         return f"EAT-{str(self.token_id)[:8].upper()} | {self.requested_by} | {self.status}"
 
     def is_valid(self):
-        now = timezone.now()
-        if self.status == 'active' and self.expires_at > now:
-            return True
-        elif self.status == 'active' and self.expires_at <= now:
-            # Auto expire
-            self.status = 'expired'
-            self.save()
-        return False
-
-    def use_token(self):
-        self.times_used += 1
-        self.last_used_at = timezone.now()
-        self.save()
+        # Lapsed tokens are marked expired by emergency.sweeper
+        return self.status == 'active' and self.expires_at > timezone.now()
+
+    def use_token(self, used_at=None):
+        # Updated in the database, so concurrent uses are all counted
+        self.times_used = F('times_used') + 1
+        self.last_used_at = last_used_at_after(used_at or timezone.now())
+        self.save(update_fields=['times_used', 'last_used_at'])
+        self.refresh_from_db(fields=['times_used', 'last_used_at'])
 
     def get_remaining_time(self):
         if self.is_valid():
-            remaining = self.expires_at - timezone.now()
-            minutes = int(remaining.total_seconds() // 60)
-            seconds = int(remaining.total_seconds() % 60)
-            return f"{minutes}m {seconds}s"
-        return "Expired"
\ No newline at end of file
+            return format_remaining(self.expires_at)
+        return "Expired"
+
+
+def format_remaining(expires_at) -> str:
+    remaining = expires_at - timezone.now()
+    minutes = int(remaining.total_seconds() // 60)
+    seconds = int(remaining.total_seconds() % 60)
+    return f"{minutes}m {seconds}s"
+
+
+def last_used_at_after(used_at):
+    """
+    last_used_at moved forward to used_at but never back, so a slower
+    concurrent writer cannot rewind it
+    """
+    used_at = Value(used_at, output_field=models.DateTimeField())
+    return Greatest(Coalesce('last_used_at', used_at), used_at)
+
+
+def token_covers(token, resource_types) -> bool:
+    """
+    True if the scope of token (a token, CachedToken or SignedToken)
+    includes every one of resource_types; unknown types never are
+    """
+    return all(
+        resource_type in TOKEN_SCOPES and getattr(token, TOKEN_SCOPES[resource_type])
+        for resource_type in resource_types
+    )
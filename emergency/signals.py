@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import EmergencyAccessToken
+from .signed_tokens import revocation_list
+from .token_cache import token_cache
+
+
+# Revocation, expiry and scope changes all go through save()
+@receiver(post_save, sender=EmergencyAccessToken)
+@receiver(post_delete, sender=EmergencyAccessToken)
+def invalidate_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.token_id)
+
+
+@receiver(post_save, sender=EmergencyAccessToken)
+def revoke_signed_token(sender, instance, **kwargs):
+    if instance.status == 'revoked':
+        revocation_list.add(instance.token_id, instance.expires_at)
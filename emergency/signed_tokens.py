@@ -0,0 +1,202 @@
+import json
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.signing import b64_decode, b64_encode
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .models import TOKEN_SCOPES, EmergencyAccessToken, token_covers
+
+
+# Tokens look like 'eat1.<key id>.<payload>.<signature>'; UUID token ids
+# never contain a dot
+SIGNED_TOKEN_PREFIX = 'eat1'
+KEY_SALT = 'emergency.signed_tokens'
+
+SCOPE_FIELDS = tuple(TOKEN_SCOPES.values())
+
+SignedToken = namedtuple('SignedToken', [
+    'token_id', 'patient_id', 'issuer', 'expires_at', *SCOPE_FIELDS,
+])
+
+
+class SignedTokenError(ValueError):
+    pass
+
+
+def signing_keys() -> dict:
+    """
+    key id -> secret. The first key signs new tokens; every key listed
+    verifies, so a rotated-out key stays until its tokens have expired.
+    """
+    keys = getattr(settings, 'EMERGENCY_TOKEN_SIGNING_KEYS', None)
+    return keys or {'default': settings.SECRET_KEY}
+
+
+def _signature(key_id: str, secret: str, payload: str) -> str:
+    digest = salted_hmac(
+        KEY_SALT, f'{key_id}.{payload}', secret, algorithm='sha256'
+    ).digest()
+    return b64_encode(digest).decode()
+
+
+def is_signed(value) -> bool:
+    return isinstance(value, str) and value.startswith(SIGNED_TOKEN_PREFIX + '.')
+
+
+def sign_token(token: EmergencyAccessToken) -> str:
+    """
+    Signed form of an issued token, carrying everything a check needs
+    """
+    key_id, secret = next(iter(signing_keys().items()))
+    claims = {
+        'jti': token.token_id.hex,
+        'sub': token.patient_id,
+        'iss': token.requested_by_id,
+        # Rounded down, so the signed token never outlives the row
+        'exp': int(token.expires_at.timestamp()),
+        'scope': [name for name in SCOPE_FIELDS if getattr(token, name)],
+    }
+    payload = b64_encode(
+        json.dumps(claims, separators=(',', ':')).encode()
+    ).decode()
+    return '.'.join((
+        SIGNED_TOKEN_PREFIX, key_id, payload, _signature(key_id, secret, payload)
+    ))
+
+
+def verify_token(value: str) -> SignedToken:
+    """
+    The claims of a signed token. Raises SignedTokenError if it is
+    malformed or its signature does not match; expiry and revocation
+    are left to the caller.
+    """
+    try:
+        prefix, key_id, payload, signature = value.split('.')
+    except ValueError:
+        raise SignedTokenError('Malformed token')
+    secret = signing_keys().get(key_id)
+    if prefix != SIGNED_TOKEN_PREFIX or secret is None:
+        raise SignedTokenError('Unknown signing key')
+    if not constant_time_compare(signature, _signature(key_id, secret, payload)):
+        raise SignedTokenError('Bad signature')
+    try:
+        claims = json.loads(b64_decode(payload.encode()))
+        scope = set(claims['scope'])
+        return SignedToken(
+            uuid.UUID(claims['jti']),
+            claims['sub'],
+            claims['iss'],
+            datetime.fromtimestamp(claims['exp'], tz=dt_timezone.utc),
+            *(name in scope for name in SCOPE_FIELDS),
+        )
+    except (ValueError, KeyError, TypeError):
+        raise SignedTokenError('Malformed token')
+
+
+class RevocationList:
+    """
+    Ids of revoked tokens that have not expired yet. Signed tokens are
+    checked against it instead of their database row.
+
+    Like the policy store, workers re-read it at most once every
+    refresh_interval seconds; the query only touches revoked rows that
+    are still within their validity (eat_revoked_expiry_idx). Tokens
+    revoked in this process are added at once (see emergency.signals).
+    """
+
+    def __init__(self, refresh_interval: float = 5.0):
+        self.refresh_interval = refresh_interval
+        self.revoked = frozenset()
+        self._local = {}
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self.counters = {'lookups': 0, 'rejected': 0, 'refreshes': 0}
+
+    def due(self) -> bool:
+        return (
+            self._checked_at is None
+            or time.monotonic() - self._checked_at >= self.refresh_interval
+        )
+
+    def refresh(self):
+        with self._lock:
+            self._checked_at = time.monotonic()
+            now = timezone.now()
+            revoked = set(
+                EmergencyAccessToken.objects.filter(
+                    status='revoked', expires_at__gt=now
+                ).values_list('token_id', flat=True)
+            )
+            # Keep local revocations the query may have raced with
+            self._local = {
+                token_id: expires_at
+                for token_id, expires_at in self._local.items()
+                if expires_at > now
+            }
+            self.revoked = frozenset(revoked.union(self._local))
+            self.counters['refreshes'] += 1
+
+    def add(self, token_id, expires_at):
+        with self._lock:
+            self._local[token_id] = expires_at
+            self.revoked = self.revoked | {token_id}
+
+    def is_revoked(self, token_id, refresh: bool = True) -> bool:
+        """
+        refresh=False never queries, for callers on an event loop that
+        refresh beforehand
+        """
+        if refresh and self.due():
+            self.refresh()
+        self.counters['lookups'] += 1
+        if token_id in self.revoked:
+            self.counters['rejected'] += 1
+            return True
+        return False
+
+    def invalidate(self):
+        """
+        Forces the next lookup to re-read the database
+        """
+        self._checked_at = None
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self.revoked),
+            'refresh_interval_seconds': self.refresh_interval,
+            **self.counters,
+        }
+
+
+revocation_list = RevocationList(
+    refresh_interval=getattr(
+        settings, 'EMERGENCY_TOKEN_REVOCATION_REFRESH_SECONDS', 5.0
+    )
+)
+
+
+def check_signed_token(
+    value: str, user_id, patient_id, *resource_types, refresh: bool = True
+) -> bool:
+    """
+    True if value is a valid signed token of user_id for patient_id
+    whose scope covers resource_types. Costs a signature check and a
+    revocation set lookup.
+    """
+    try:
+        claims = verify_token(value)
+    except SignedTokenError:
+        return False
+    return (
+        claims.issuer == user_id
+        and claims.patient_id == patient_id
+        and claims.expires_at > timezone.now()
+        and token_covers(claims, resource_types)
+        and not revocation_list.is_revoked(claims.token_id, refresh)
+    )
@@ -0,0 +1,111 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from audit.models import AuditLog
+from audit.sink import get_audit_sink
+from .models import EmergencyAccessToken
+from .token_cache import token_cache
+
+
+logger = logging.getLogger(__name__)
+
+
+def lapsed_tokens(now) -> list:
+    """
+    (token_id, user_id, patient_id, expires_at) of the active tokens
+    past their expiry, from eat_active_expiry_idx. Locks the rows where
+    supported; call inside a transaction.
+    """
+    return list(
+        EmergencyAccessToken.objects.filter(status='active', expires_at__lte=now)
+        .select_for_update().order_by()
+        .values_list('token_id', 'requested_by_id', 'patient_id', 'expires_at')
+    )
+
+
+def sweep_expired_tokens(now=None) -> int:
+    """
+    Marks every active token past its expiry as expired with one UPDATE
+    and hands one EMERGENCY_TOKEN_EXPIRED entry per token to the audit
+    sink in a single batch. Returns how many tokens were expired.
+
+    The UPDATE only claims the tokens read in the same transaction. If
+    another sweeper expired any of them in between, the sweep is rolled
+    back and left to the next run, so no token is audited twice.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        expired = lapsed_tokens(now)
+        if not expired:
+            return 0
+        claimed = EmergencyAccessToken.objects.filter(
+            token_id__in=[row[0] for row in expired], status='active'
+        ).update(status='expired')
+        if claimed != len(expired):
+            transaction.set_rollback(True)
+            return 0
+
+    # update() sends no post_save
+    for token_id, *_ in expired:
+        token_cache.invalidate(token_id)
+
+    get_audit_sink().log_many(
+        AuditLog(
+            user_id=user_id,
+            action='EMERGENCY_TOKEN_EXPIRED',
+            resource_type='patient',
+            resource_id=patient_id,
+            access_granted=False,
+            is_emergency=True,
+            details={
+                'token_id': str(token_id),
+                'expired_at': str(expires_at),
+            },
+            timestamp=now,
+        )
+        for token_id, user_id, patient_id, expires_at in expired
+    )
+    return len(expired)
+
+
+class ExpirySweeper:
+    """
+    Runs sweep_expired_tokens every interval seconds on a daemon thread
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.counters = {'sweeps': 0, 'expired': 0}
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='eat-expiry-sweeper', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.counters['expired'] += sweep_expired_tokens()
+                self.counters['sweeps'] += 1
+            except Exception:
+                logger.exception("Emergency token sweep failed")
+            finally:
+                close_old_connections()
+
+
+expiry_sweeper = ExpirySweeper(
+    interval=getattr(settings, 'EMERGENCY_TOKEN_SWEEP_INTERVAL_SECONDS', 0)
+)
@@ -1,3 +1,532 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import date, timedelta
+from io import StringIO
 
-# Create your tests here.
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from authentication.models import User
+from audit.models import AuditLog
+from ehr.async_views import acheck_emergency_token
+from ehr.models import Patient
+from ehr.access import check_emergency_token, check_emergency_tokens
+from .eat_handler import EATHandler
+from .models import EmergencyAccessToken
+from .sweeper import lapsed_tokens, sweep_expired_tokens
+from .signed_tokens import (
+    SignedTokenError, revocation_list, sign_token, verify_token
+)
+from .token_cache import EmergencyTokenCache, token_cache
+from .usage import BufferedUsageCounter, DirectUsageCounter
+
+
+@override_settings(AUDIT_SINK='direct')
+class AsyncEmergencyViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='responder', password='x', role='doctor',
+            is_emergency_authorized=True
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_token_lifecycle(self):
+        response = self.client.post(
+            '/api/async/emergency/request/',
+            {'patient_id': 'P-1', 'reason': 'Cardiac arrest'}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        token_id = response.json()['token_id']
+
+        response = self.client.post(
+            '/api/async/emergency/validate/', {'token_id': token_id}, format='json'
+        )
+        self.assertTrue(response.json()['valid'])
+        self.assertEqual(response.json()['times_used'], 1)
+
+        self.assertEqual(
+            self.client.get('/api/async/emergency/my-tokens/').content,
+            self.client.get('/api/emergency/my-tokens/').content,
+        )
+        self.assertEqual(
+            list(AuditLog.objects.order_by('id').values_list('action', flat=True)),
+            ['EMERGENCY_TOKEN_ISSUED', 'EMERGENCY_TOKEN_USED'],
+        )
+
+    def test_validation_errors(self):
+        response = self.client.post('/api/async/emergency/request/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            self.client.get('/api/async/emergency/validate/').status_code, 405
+        )
+
+        self.user.is_emergency_authorized = False
+        self.user.save()
+        response = self.client.post(
+            '/api/async/emergency/request/',
+            {'patient_id': 'P-1', 'reason': 'x'}, format='json'
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(AUDIT_SINK='direct')
+class EmergencyTokenCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='responder', password='x', role='doctor',
+            is_emergency_authorized=True
+        )
+        cls.other = User.objects.create_user(username='other', password='x')
+
+    def setUp(self):
+        token_cache.clear()
+        self.token = EmergencyAccessToken.objects.create(
+            requested_by=self.user, patient_id='P-1', reason='Trauma',
+            expires_at=timezone.now() + timedelta(minutes=10),
+        )
+
+    def check(self, user=None, patient_id='P-1'):
+        return check_emergency_token(
+            user or self.user, patient_id, str(self.token.token_id)
+        )
+
+    def test_repeat_checks_only_revalidate(self):
+        before = token_cache.stats()
+        with self.assertNumQueries(1):
+            self.assertTrue(self.check())
+        with CaptureQueriesContext(connection) as captured:
+            self.assertTrue(self.check())
+            self.assertEqual(
+                check_emergency_tokens(self.user, {'P-1': self.token.token_id}),
+                {'P-1'}
+            )
+        # Primary key lookups of status and scope, not the whole row
+        self.assertEqual(len(captured), 2)
+        for query in captured:
+            self.assertNotIn('"reason"', query['sql'])
+        after = token_cache.stats()
+        self.assertEqual(after['hits'] - before['hits'], 2)
+        self.assertEqual(after['misses'] - before['misses'], 1)
+
+    def test_without_revalidation_hits_skip_the_database(self):
+        token_cache.revalidate = False
+        self.addCleanup(setattr, token_cache, 'revalidate', True)
+        self.assertTrue(self.check())
+        with self.assertNumQueries(0):
+            self.assertTrue(self.check())
+
+    def test_revocation_in_another_process(self):
+        self.assertTrue(self.check())
+        stale = token_cache.stats()['stale']
+        # Saved without signals, as another worker's revocation looks here
+        EmergencyAccessToken.objects.filter(pk=self.token.pk).update(status='revoked')
+        self.assertFalse(self.check())
+        self.assertEqual(token_cache.stats()['stale'], stale + 1)
+
+    def test_scope_change_in_another_process(self):
+        self.assertTrue(self.check())
+        stale = token_cache.stats()['stale']
+        EmergencyAccessToken.objects.filter(pk=self.token.pk).update(
+            can_access_lab=False
+        )
+        with self.assertNumQueries(2):
+            self.assertTrue(self.check())
+        self.assertEqual(token_cache.stats()['stale'], stale + 1)
+
+    def test_key_includes_user_and_patient(self):
+        self.assertTrue(self.check())
+        self.assertFalse(self.check(user=self.other))
+        self.assertFalse(self.check(patient_id='P-2'))
+
+    def test_revocation_is_seen_on_the_next_request(self):
+        self.assertTrue(self.check())
+        result = EATHandler().revoke_token(str(self.token.token_id), self.user)
+        self.assertTrue(result['success'])
+        with self.assertNumQueries(1):
+            self.assertFalse(self.check())
+
+    def test_scope_change_invalidates(self):
+        self.assertTrue(self.check())
+        invalidations = token_cache.stats()['invalidations']
+        self.token.can_access_lab = False
+        self.token.save()
+        self.assertEqual(token_cache.stats()['invalidations'], invalidations + 1)
+        with self.assertNumQueries(1):
+            self.assertTrue(self.check())
+
+    def test_entries_never_outlive_the_token(self):
+        cache = EmergencyTokenCache(ttl=300)
+        self.token.expires_at = timezone.now() + timedelta(seconds=2)
+        cache.put(self.token)
+        key = (self.token.token_id, self.user.pk, 'P-1')
+        deadline, _ = cache._entries[key]
+        self.assertLessEqual(deadline, time.monotonic() + 2)
+
+        cache.put(EmergencyAccessToken(
+            requested_by=self.user, patient_id='P-2',
+            expires_at=timezone.now() - timedelta(seconds=1),
+        ))
+        self.assertEqual(cache.stats()['size'], 1)
+
+    def test_lapsed_token_is_rejected(self):
+        self.assertTrue(self.check())
+        EmergencyAccessToken.objects.filter(pk=self.token.pk).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        token_cache.clear()
+        self.assertFalse(self.check())
+
+    def test_validate_primes_the_cache(self):
+        result = EATHandler().validate_token(str(self.token.token_id), self.user)
+        self.assertTrue(result['valid'])
+        with self.assertNumQueries(1):
+            self.assertTrue(self.check())
+
+
+@override_settings(
+    AUDIT_SINK='direct',
+    EMERGENCY_TOKEN_FORMAT='signed',
+    EMERGENCY_TOKEN_SIGNING_KEYS={'k1': 'first-secret'},
+)
+class SignedTokenTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='responder', password='x', role='doctor',
+            is_emergency_authorized=True
+        )
+        cls.other = User.objects.create_user(username='other', password='x')
+
+    def setUp(self):
+        self.handler = EATHandler()
+        result = self.handler.generate_token(self.user, 'P-1', 'Trauma')
+        self.signed = result['token']
+        self.row = EmergencyAccessToken.objects.get(token_id=result['token_id'])
+        revocation_list.refresh()
+
+    def test_claims(self):
+        claims = verify_token(self.signed)
+        self.assertEqual(claims.token_id, self.row.token_id)
+        self.assertEqual(claims.patient_id, 'P-1')
+        self.assertEqual(claims.issuer, self.user.pk)
+        self.assertLessEqual(claims.expires_at, self.row.expires_at)
+        self.assertTrue(claims.can_access_lab)
+
+        again = self.handler.generate_token(self.user, 'P-1', 'Trauma')
+        self.assertTrue(again['already_existed'])
+        self.assertEqual(again['token'], self.signed)
+
+    def test_checks_skip_the_database(self):
+        with self.assertNumQueries(0):
+            self.assertTrue(check_emergency_token(self.user, 'P-1', self.signed))
+            self.assertEqual(
+                check_emergency_tokens(self.user, {'P-1': self.signed}), {'P-1'}
+            )
+            self.assertTrue(
+                async_to_sync(acheck_emergency_token)(self.user, 'P-1', self.signed)
+            )
+        self.assertFalse(check_emergency_token(self.other, 'P-1', self.signed))
+        self.assertFalse(check_emergency_token(self.user, 'P-2', self.signed))
+
+    def test_scope_is_enforced(self):
+        self.row.can_access_ehr = False
+        self.row.save()
+        signed = sign_token(self.row)
+        token_id = str(self.row.token_id)
+        token_cache.clear()
+
+        for value in (signed, token_id, token_id):  # miss, then cache hit
+            self.assertTrue(check_emergency_token(self.user, 'P-1', value, 'lab'))
+            self.assertFalse(check_emergency_token(self.user, 'P-1', value, 'ehr'))
+            self.assertFalse(
+                check_emergency_token(self.user, 'P-1', value, 'lab', 'ehr')
+            )
+            self.assertEqual(
+                check_emergency_tokens(self.user, {'P-1': value}, 'lab'), {'P-1'}
+            )
+            self.assertEqual(check_emergency_tokens(self.user, {'P-1': value}, 'ehr'), set())
+            self.assertFalse(
+                async_to_sync(acheck_emergency_token)(self.user, 'P-1', value, 'ehr')
+            )
+
+        Patient.objects.create(
+            patient_id='P-1', first_name='A', last_name='B',
+            date_of_birth=date(1980, 1, 1), blood_group='O+', contact_number='000'
+        )
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for path, granted in (('ehr', False), ('lab', True)):
+            response = client.get(
+                f'/api/ehr/patients/P-1/{path}/', {'token_id': signed}
+            )
+            self.assertIs(response.data['is_emergency'], granted)
+
+    def test_tampering_is_rejected(self):
+        prefix, key_id, payload, signature = self.signed.split('.')
+        other = sign_token(EmergencyAccessToken(
+            requested_by=self.user, patient_id='P-2',
+            expires_at=self.row.expires_at,
+        ))
+        forged = '.'.join((prefix, key_id, other.split('.')[2], signature))
+        for value in (forged, f'{prefix}.k9.{payload}.{signature}', 'eat1.x'):
+            with self.assertRaises(SignedTokenError):
+                verify_token(value)
+            self.assertFalse(check_emergency_token(self.user, 'P-2', value))
+
+    def test_key_rotation(self):
+        keys = {'k2': 'second-secret', 'k1': 'first-secret'}
+        with self.settings(EMERGENCY_TOKEN_SIGNING_KEYS=keys):
+            self.assertTrue(check_emergency_token(self.user, 'P-1', self.signed))
+            self.assertTrue(sign_token(self.row).startswith('eat1.k2.'))
+        with self.settings(EMERGENCY_TOKEN_SIGNING_KEYS={'k2': 'second-secret'}):
+            self.assertFalse(check_emergency_token(self.user, 'P-1', self.signed))
+
+    def test_revocation(self):
+        result = self.handler.revoke_token(self.signed, self.user)
+        self.assertTrue(result['success'])
+        with self.assertNumQueries(0):
+            self.assertFalse(check_emergency_token(self.user, 'P-1', self.signed))
+
+    def test_revocation_in_another_process(self):
+        # Saved without signals, as another worker's revocation looks here
+        EmergencyAccessToken.objects.filter(pk=self.row.pk).update(status='revoked')
+        self.assertTrue(check_emergency_token(self.user, 'P-1', self.signed))
+        revocation_list.invalidate()
+        self.assertFalse(check_emergency_token(self.user, 'P-1', self.signed))
+        self.assertIn(self.row.token_id, revocation_list.revoked)
+
+    def test_validate_counts_usage_without_reading_the_row(self):
+        with self.assertNumQueries(2):
+            result = self.handler.validate_token(self.signed, self.user)
+        self.assertTrue(result['valid'])
+        self.assertEqual(result['access_scope']['lab_results'], True)
+        self.row.refresh_from_db()
+        self.assertEqual(self.row.times_used, 1)
+        self.assertIsNotNone(self.row.last_used_at)
+
+        result = self.handler.validate_token(self.signed, self.other)
+        self.assertEqual(result['message'], 'Token not found')
+
+        EmergencyAccessToken.objects.filter(pk=self.row.pk).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        self.row.refresh_from_db()
+        expired = sign_token(self.row)
+        self.assertFalse(self.handler.validate_token(expired, self.user)['valid'])
+        self.assertEqual(
+            AuditLog.objects.filter(action='EMERGENCY_TOKEN_EXPIRED').count(), 1
+        )
+
+
+@override_settings(AUDIT_SINK='direct')
+class ExpirySweeperTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='responder', password='x', role='doctor',
+            is_emergency_authorized=True
+        )
+
+    def issue(self, patient_id, minutes, token_status='active'):
+        return EmergencyAccessToken.objects.create(
+            requested_by=self.user, patient_id=patient_id, reason='Trauma',
+            expires_at=timezone.now() + timedelta(minutes=minutes),
+            status=token_status,
+        )
+
+    def test_is_valid_never_writes(self):
+        token = self.issue('P-1', -1)
+        with self.assertNumQueries(0):
+            self.assertFalse(token.is_valid())
+            self.assertEqual(token.get_remaining_time(), 'Expired')
+        token.refresh_from_db()
+        self.assertEqual(token.status, 'active')
+
+    def test_sweep(self):
+        lapsed = [self.issue(f'P-{n}', -n) for n in range(1, 4)]
+        self.issue('P-9', 10)
+        self.issue('P-8', -1, 'revoked')
+
+        # SELECT, UPDATE and one bulk INSERT of the audit entries, plus
+        # the savepoint pair of the atomic block inside the test case
+        with self.assertNumQueries(5):
+            self.assertEqual(sweep_expired_tokens(), 3)
+        self.assertEqual(sweep_expired_tokens(), 0)
+
+        statuses = dict(
+            EmergencyAccessToken.objects.values_list('patient_id', 'status')
+        )
+        self.assertEqual(
+            statuses,
+            {'P-1': 'expired', 'P-2': 'expired', 'P-3': 'expired',
+             'P-9': 'active', 'P-8': 'revoked'},
+        )
+        entries = AuditLog.objects.filter(action='EMERGENCY_TOKEN_EXPIRED')
+        self.assertEqual(
+            sorted(entry.details['token_id'] for entry in entries),
+            sorted(str(token.token_id) for token in lapsed),
+        )
+        self.assertTrue(all(entry.user_id == self.user.pk for entry in entries))
+
+    def test_concurrent_sweeps_audit_each_token_once(self):
+        first, second = self.issue('P-1', -1), self.issue('P-2', -2)
+        rows = lapsed_tokens(timezone.now())
+
+        # Another worker read the same rows and expires one of them first
+        EmergencyAccessToken.objects.filter(pk=first.pk).update(status='expired')
+        with patch('emergency.sweeper.lapsed_tokens', return_value=rows):
+            self.assertEqual(sweep_expired_tokens(), 0)
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'active')
+        self.assertFalse(AuditLog.objects.filter(action='EMERGENCY_TOKEN_EXPIRED').exists())
+
+        # The next run picks up what the rolled back sweep left
+        self.assertEqual(sweep_expired_tokens(), 1)
+        entries = AuditLog.objects.filter(action='EMERGENCY_TOKEN_EXPIRED')
+        self.assertEqual(
+            [entry.details['token_id'] for entry in entries],
+            [str(second.token_id)],
+        )
+
+    def test_command(self):
+        self.issue('P-1', -1)
+        out = StringIO()
+        call_command('expire_tokens', stdout=out)
+        self.assertIn('Expired 1 tokens', out.getvalue())
+
+
+@override_settings(AUDIT_SINK='direct')
+class TokenUsageTests(TransactionTestCase):
+    threads = 8
+    uses = 25
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='responder', password='x')
+        self.token = EmergencyAccessToken.objects.create(
+            requested_by=self.user, patient_id='P-1', reason='Trauma',
+            expires_at=timezone.now() + timedelta(minutes=10),
+        )
+
+    def run_concurrently(self, use):
+        """
+        Calls use() self.uses times on each of self.threads threads,
+        all started together. Statements run one at a time, as behind
+        SQLite's writer lock (the in-memory test database reports
+        contention instead of waiting), but threads interleave freely
+        between them.
+        """
+        barrier = threading.Barrier(self.threads)
+        statement_lock = threading.Lock()
+        errors = []
+
+        def serialized(execute, sql, params, many, context):
+            with statement_lock:
+                return execute(sql, params, many, context)
+
+        def worker():
+            try:
+                if connection.vendor == 'sqlite':
+                    # Open SELECT cursors would otherwise hold table locks
+                    with connection.cursor() as cursor:
+                        cursor.execute('PRAGMA read_uncommitted = 1')
+                with connection.execute_wrapper(serialized):
+                    barrier.wait()
+                    for _ in range(self.uses):
+                        use()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_use_token_loses_no_updates(self):
+        def use():
+            # Each call works on its own stale copy of the row
+            EmergencyAccessToken.objects.get(pk=self.token.pk).use_token()
+
+        self.run_concurrently(use)
+        self.token.refresh_from_db()
+        self.assertEqual(self.token.times_used, self.threads * self.uses)
+
+    def test_use_token_writes_only_usage_columns(self):
+        stale = EmergencyAccessToken.objects.get(pk=self.token.pk)
+        EATHandler().revoke_token(str(self.token.token_id), self.user)
+        stale.use_token()
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, 'revoked')
+        self.assertEqual(stale.times_used, 1)
+
+    def test_last_used_at_never_moves_back(self):
+        newer = timezone.now()
+        older = newer - timedelta(seconds=5)
+
+        def use_token(token_id, used_at):
+            EmergencyAccessToken.objects.get(token_id=token_id).use_token(used_at)
+
+        def buffered(token_id, used_at):
+            counter = BufferedUsageCounter(background=False)
+            counter.record(token_id, used_at)
+            counter.flush()
+
+        for record in (use_token, DirectUsageCounter().record, buffered):
+            with self.subTest(record=record):
+                EmergencyAccessToken.objects.update(last_used_at=None)
+                # The slower of two concurrent uses writes last
+                record(self.token.token_id, newer)
+                record(self.token.token_id, older)
+                self.token.refresh_from_db()
+                self.assertEqual(self.token.last_used_at, newer)
+
+    def test_buffered_counts_loses_no_updates(self):
+        counter = BufferedUsageCounter(background=False)
+        used_at = []
+
+        def use():
+            used_at.append(timezone.now())
+            counter.record(self.token.token_id, used_at[-1])
+            if len(used_at) % 40 == 0:
+                counter.flush()
+
+        self.run_concurrently(use)
+        counter.flush()
+        self.token.refresh_from_db()
+        self.assertEqual(self.token.times_used, self.threads * self.uses)
+        self.assertEqual(self.token.last_used_at, max(used_at))
+        self.assertEqual(counter.stats()['pending_uses'], 0)
+
+    def test_buffered_validation(self):
+        counter = BufferedUsageCounter(background=False)
+        with self.settings(EMERGENCY_TOKEN_USAGE='buffered'):
+            with patch('emergency.usage._counters', {'buffered': counter}):
+                handler = EATHandler()
+                for expected in (1, 2):
+                    result = handler.validate_token(str(self.token.token_id), self.user)
+                    self.assertEqual(result['times_used'], expected)
+
+        self.token.refresh_from_db()
+        self.assertEqual(self.token.times_used, 0)
+        counter.flush()
+        self.token.refresh_from_db()
+        self.assertEqual(self.token.times_used, 2)
@@ -0,0 +1,176 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import TOKEN_SCOPES, EmergencyAccessToken
+
+
+SCOPE_FIELDS = tuple(TOKEN_SCOPES.values())
+
+CachedToken = namedtuple('CachedToken', [
+    'pk', 'token_id', 'user_id', 'patient_id', 'expires_at', *SCOPE_FIELDS,
+])
+
+
+def current_scopes(pks) -> dict:
+    """
+    pk -> scope flags of the tokens among pks that are still active.
+    A raw primary key lookup: an order of magnitude cheaper than an ORM
+    query, which matters on every cache hit.
+    """
+    if not pks:
+        return {}
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(name) for name in ('id', *SCOPE_FIELDS))
+    placeholders = ', '.join(['%s'] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {columns} FROM {quote(EmergencyAccessToken._meta.db_table)} "
+            f"WHERE {quote('id')} IN ({placeholders}) AND {quote('status')} = %s",
+            [*pks, 'active']
+        )
+        return {
+            pk: tuple(bool(flag) for flag in flags)
+            for pk, *flags in cursor.fetchall()
+        }
+
+
+def token_key(token_id, user_id, patient_id):
+    """
+    Cache key for a token presented by user_id for patient_id.
+    Raises ValueError for a malformed token id.
+    """
+    return (uuid.UUID(str(token_id)), user_id, patient_id)
+
+
+class EmergencyTokenCache:
+    """
+    Bounded LRU of active Emergency Access Tokens keyed on
+    (token_id, user, patient_id). An entry never outlives the token's
+    expires_at. Saving or deleting a token drops its entry in this
+    process (see emergency.signals); with revalidate, every hit also
+    re-reads the token's status and scope by primary key, so a token
+    revoked or narrowed by another worker process is rejected on the
+    next request. Only valid tokens are cached, so a miss always goes
+    to the database.
+    """
+
+    def __init__(
+        self, max_size: int = 4096, ttl: float = 60.0, revalidate: bool = True
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.revalidate = revalidate
+        self._entries = OrderedDict()
+        self._keys = {}
+        self._lock = threading.Lock()
+        self.counters = {
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'stale': 0,
+            'evictions': 0,
+            'invalidations': 0,
+        }
+
+    def get(self, key):
+        """
+        The CachedToken for key, or None when it has to be loaded
+        """
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys) -> dict:
+        """
+        key -> CachedToken for the keys that are cached, revalidated
+        with one query
+        """
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                cached = self._entries.get(key)
+                if cached is None:
+                    self.counters['misses'] += 1
+                elif cached[0] <= now:
+                    self._drop(key)
+                    self.counters['expired'] += 1
+                    self.counters['misses'] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    found[key] = cached[1]
+
+        if found and self.revalidate:
+            scopes = current_scopes([cached.pk for cached in found.values()])
+            for key, cached in list(found.items()):
+                if scopes.get(cached.pk) != tuple(cached[-len(SCOPE_FIELDS):]):
+                    # Revoked, expired or rescoped elsewhere
+                    del found[key]
+                    with self._lock:
+                        self._drop(key)
+                        self.counters['stale'] += 1
+                        self.counters['misses'] += 1
+
+        with self._lock:
+            self.counters['hits'] += len(found)
+        return found
+
+    def put(self, token):
+        """
+        Caches token if it is active and not yet expired
+        """
+        remaining = (token.expires_at - timezone.now()).total_seconds()
+        if token.status != 'active' or remaining <= 0 or self.max_size <= 0:
+            return
+        key = (token.token_id, token.requested_by_id, token.patient_id)
+        value = CachedToken(
+            token.pk, token.token_id, token.requested_by_id, token.patient_id,
+            token.expires_at, *(getattr(token, name) for name in SCOPE_FIELDS),
+        )
+        deadline = time.monotonic() + min(self.ttl, remaining)
+        with self._lock:
+            self._entries[key] = (deadline, value)
+            self._entries.move_to_end(key)
+            self._keys[token.token_id] = key
+            while len(self._entries) > self.max_size:
+                evicted, _ = self._entries.popitem(last=False)
+                self._keys.pop(evicted[0], None)
+                self.counters['evictions'] += 1
+
+    def invalidate(self, token_id):
+        with self._lock:
+            key = self._keys.get(token_id)
+            if key is not None:
+                self._drop(key)
+                self.counters['invalidations'] += 1
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        self._keys.pop(key[0], None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+
+    def stats(self) -> dict:
+        lookups = self.counters['hits'] + self.counters['misses']
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl,
+            'revalidate': self.revalidate,
+            **self.counters,
+            'hit_rate': round(self.counters['hits'] / lookups, 4) if lookups else 0.0,
+        }
+
+
+token_cache = EmergencyTokenCache(
+    max_size=getattr(settings, 'EMERGENCY_TOKEN_CACHE_SIZE', 4096),
+    ttl=getattr(settings, 'EMERGENCY_TOKEN_CACHE_TTL_SECONDS', 60),
+    revalidate=getattr(settings, 'EMERGENCY_TOKEN_CACHE_REVALIDATE', True),
+)
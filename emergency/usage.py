@@ -0,0 +1,192 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import EmergencyAccessToken, last_used_at_after
+
+
+logger = logging.getLogger(__name__)
+
+
+class DirectUsageCounter:
+    """
+    Counts each use with an atomic UPDATE on the calling thread
+    """
+
+    def use(self, token) -> int:
+        """
+        Counts one use of a loaded token; returns its times_used
+        """
+        token.use_token()
+        return token.times_used
+
+    def record(self, token_id, used_at=None):
+        EmergencyAccessToken.objects.filter(token_id=token_id).update(
+            times_used=F('times_used') + 1,
+            last_used_at=last_used_at_after(used_at or timezone.now()),
+        )
+
+    def flush(self):
+        pass
+
+    def stats(self) -> dict:
+        return {'mode': 'direct'}
+
+
+class BufferedUsageCounter:
+    """
+    Write-behind usage counter for high-traffic emergencies.
+
+    Uses are summed per token in memory and a background thread adds
+    them to the rows every flush_interval seconds, one F() UPDATE per
+    token inside a single transaction. last_used_at only ever moves
+    forward, so processes flushing out of order cannot rewind it.
+    Counts of a failed flush are put back and retried. With
+    background=False nothing is written until flush() is called.
+    """
+
+    def __init__(self, flush_interval: float = 1.0, background: bool = True):
+        self.flush_interval = flush_interval
+        self.background = background
+
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._closed = False
+
+        self.counters = {
+            'recorded': 0,
+            'flushed': 0,
+            'flushes': 0,
+            'failures': 0,
+        }
+
+    def use(self, token) -> int:
+        """
+        Counts one use of a loaded token; returns its times_used
+        including the uses still pending in this process
+        """
+        return token.times_used + self.record(token.token_id)
+
+    def record(self, token_id, used_at=None) -> int:
+        """
+        Counts one use; returns how many uses of the token are pending
+        """
+        used_at = used_at or timezone.now()
+        with self._lock:
+            count, last_used_at = self._pending.get(token_id, (0, used_at))
+            count += 1
+            self._pending[token_id] = (count, max(last_used_at, used_at))
+            self.counters['recorded'] += 1
+        self._ensure_thread()
+        return count
+
+    def _ensure_thread(self):
+        if not self.background:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='eat-usage', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Emergency token usage flush failed")
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """
+        Adds the pending counts to the database
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+
+            try:
+                with transaction.atomic():
+                    for token_id, (count, used_at) in pending.items():
+                        EmergencyAccessToken.objects.filter(token_id=token_id).update(
+                            times_used=F('times_used') + count,
+                            last_used_at=last_used_at_after(used_at),
+                        )
+            except DatabaseError:
+                logger.warning(
+                    "Database unavailable, keeping usage of %d tokens", len(pending)
+                )
+                self._restore(pending)
+                self.counters['failures'] += 1
+                return
+
+            self.counters['flushed'] += sum(count for count, _ in pending.values())
+            self.counters['flushes'] += 1
+
+    def _restore(self, pending):
+        with self._lock:
+            for token_id, (count, used_at) in pending.items():
+                newer, last_used_at = self._pending.get(token_id, (0, used_at))
+                self._pending[token_id] = (count + newer, max(used_at, last_used_at))
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending_tokens = len(self._pending)
+            pending_uses = sum(count for count, _ in self._pending.values())
+        return {
+            'mode': 'buffered',
+            'pending_tokens': pending_tokens,
+            'pending_uses': pending_uses,
+            **self.counters,
+        }
+
+
+_counters = {}
+_counters_lock = threading.Lock()
+
+
+def get_usage_counter():
+    """
+    Returns the process-wide counter selected by
+    settings.EMERGENCY_TOKEN_USAGE
+    """
+    mode = getattr(settings, 'EMERGENCY_TOKEN_USAGE', 'direct')
+    counter = _counters.get(mode)
+    if counter is not None:
+        return counter
+
+    with _counters_lock:
+        if mode not in _counters:
+            if mode == 'buffered':
+                counter = BufferedUsageCounter(
+                    flush_interval=getattr(
+                        settings, 'EMERGENCY_TOKEN_USAGE_FLUSH_SECONDS', 1.0
+                    ),
+                )
+                atexit.register(counter.close)
+            else:
+                counter = DirectUsageCounter()
+            _counters[mode] = counter
+        return _counters[mode]
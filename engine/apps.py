@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class EngineConfig(AppConfig):
     name = 'engine'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+class UserAttributeCache:
+    """
+    Two-level cache for the static part of a user's attributes.
+
+    Level 1 lives for one request (see request_scope) and needs no
+    locking or expiry checks. Level 2 is a bounded LRU shared across
+    requests, with a TTL as a backstop for updates that bypass signals.
+    Entries are keyed on the user id and only reused while the user's
+    updated_at is unchanged.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._request = ContextVar('user_attribute_request_cache', default=None)
+        self.counters = {
+            'request_hits': 0,
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evictions': 0,
+            'invalidations': 0,
+        }
+
+    @contextmanager
+    def request_scope(self):
+        token = self._request.set({})
+        try:
+            yield
+        finally:
+            self._request.reset(token)
+
+    def get(self, user, build):
+        """
+        Returns the cached static attributes for user, calling
+        build(user) on a miss
+        """
+        if user.pk is None:
+            return build(user)
+
+        version = user.updated_at
+        request_cache = self._request.get()
+        if request_cache is not None:
+            cached = request_cache.get(user.pk)
+            if cached is not None and cached[0] == version:
+                self.counters['request_hits'] += 1
+                return cached[1]
+
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(user.pk)
+            if cached is not None and cached[0] == version:
+                if cached[1] > now:
+                    self._entries.move_to_end(user.pk)
+                    self.counters['hits'] += 1
+                    value = cached[2]
+                else:
+                    self.counters['expired'] += 1
+                    value = None
+            else:
+                value = None
+
+        if value is None:
+            self.counters['misses'] += 1
+            value = build(user)
+            with self._lock:
+                self._entries[user.pk] = (version, now + self.ttl, value)
+                self._entries.move_to_end(user.pk)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.counters['evictions'] += 1
+
+        if request_cache is not None:
+            request_cache[user.pk] = (version, value)
+        return value
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.counters['invalidations'] += 1
+        request_cache = self._request.get()
+        if request_cache is not None:
+            request_cache.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = (
+            self.counters['request_hits'] + self.counters['hits']
+            + self.counters['misses']
+        )
+        hits = self.counters['request_hits'] + self.counters['hits']
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl,
+            **self.counters,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+user_attribute_cache = UserAttributeCache(
+    max_size=getattr(settings, 'USER_ATTRIBUTE_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'USER_ATTRIBUTE_CACHE_TTL_SECONDS', 300),
+)
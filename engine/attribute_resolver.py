@@ -1,5 +1,7 @@
 from datetime import datetime
 from authentication.models import User
+from .attribute_cache import user_attribute_cache
+from .timing import timed
 
 
 class AttributeResolver:
@@ -7,7 +9,12 @@ class AttributeResolver:
     Resolves all attributes of a user in real-time
     """
 
+    @timed('resolve')
     def resolve_user_attributes(self, user: User) -> dict:
+        attrs = dict(user_attribute_cache.get(user, self._static_user_attributes))
+        attrs['certifications'] = list(attrs['certifications'])
+
+        # Only the time-dependent attributes are computed per call
         now = datetime.now()
         current_time = now.time()
 
@@ -20,6 +27,15 @@ class AttributeResolver:
                 user.working_hours_end
             )
 
+        attrs['within_working_hours'] = within_working_hours
+        attrs['current_time'] = str(current_time)
+        attrs['current_date'] = str(now.date())
+        return attrs
+
+    def _static_user_attributes(self, user: User) -> dict:
+        """
+        Attributes that only change when the user row changes
+        """
         return {
             'user_id': user.id,
             'username': user.username,
@@ -30,11 +46,9 @@ class AttributeResolver:
             'certifications': user.get_certifications_list(),
             'is_emergency_authorized': user.is_emergency_authorized,
             'current_location': user.current_location,
-            'within_working_hours': within_working_hours,
-            'current_time': str(current_time),
-            'current_date': str(now.date()),
         }
 
+    @timed('resolve')
     def resolve_resource_attributes(self, resource_type: str, resource) -> dict:
         """
         Resolves attributes of the resource being accessed
@@ -56,6 +70,7 @@ class AttributeResolver:
 
         return base
 
+    @timed('resolve')
     def resolve_environment_attributes(
         self, is_emergency: bool = False,
         location: str = None
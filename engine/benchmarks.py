@@ -0,0 +1,295 @@
+import asyncio
+import gc
+import threading
+import time
+import tracemalloc
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+
+from authentication.models import User
+from ehr.models import Patient, EHRRecord
+
+
+# ── Fixtures ──
+
+def benchmark_user(username=None):
+    """
+    The named user, or the first emergency-authorized doctor
+    """
+    if username:
+        try:
+            return User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f"User {username} not found")
+    user = (
+        User.objects.filter(role='doctor', is_emergency_authorized=True)
+        .order_by('id').first()
+    )
+    if user is None:
+        raise CommandError(
+            "No emergency-authorized doctor found; run generate_data first "
+            "or pass --user"
+        )
+    return user
+
+
+def benchmark_patient(patient_id=None):
+    """
+    The given patient, or the patient of the first EHR record
+    """
+    if patient_id is None:
+        patient_id = (
+            EHRRecord.objects.order_by('id')
+            .values_list('patient__patient_id', flat=True).first()
+        )
+    try:
+        return Patient.objects.get(patient_id=patient_id)
+    except Patient.DoesNotExist:
+        raise CommandError(
+            f"Patient {patient_id} not found; run generate_data first "
+            "or pass --patient"
+        )
+
+
+# ── Single-threaded cases ──
+
+def percentile(samples: list, pct: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    if not samples:
+        return 0.0
+    rank = max(0, min(len(samples) - 1, round(pct / 100 * len(samples)) - 1))
+    return samples[rank]
+
+
+class BenchmarkRunner:
+    """
+    Times callables and reports throughput, latency percentiles, SQL
+    queries per call and peak traced memory.
+
+    Each case runs in three separate passes so the instrumentation of
+    one metric does not distort another: a timed pass, a pass under
+    CaptureQueriesContext and a pass under tracemalloc.
+    """
+
+    def __init__(
+        self,
+        iterations: int = 1000,
+        warmup: int = 50,
+        query_samples: int = 20,
+        memory_samples: int = 20
+    ):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.query_samples = query_samples
+        self.memory_samples = memory_samples
+
+    def measure(self, func) -> dict:
+        """
+        func is called with the iteration number
+        """
+        for i in range(self.warmup):
+            func(i)
+
+        # ── Timing ──
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            durations = []
+            perf_counter = time.perf_counter
+            started = perf_counter()
+            for i in range(self.iterations):
+                t0 = perf_counter()
+                func(i)
+                durations.append(perf_counter() - t0)
+            elapsed = perf_counter() - started
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        durations.sort()
+
+        # ── SQL queries ──
+        query_counts = []
+        for i in range(self.query_samples):
+            with CaptureQueriesContext(connection) as queries:
+                func(i)
+            query_counts.append(len(queries))
+
+        # ── Memory ──
+        peak = 0
+        already_tracing = tracemalloc.is_tracing()
+        if not already_tracing:
+            tracemalloc.start()
+        try:
+            for i in range(self.memory_samples):
+                tracemalloc.reset_peak()
+                baseline, _ = tracemalloc.get_traced_memory()
+                func(i)
+                _, call_peak = tracemalloc.get_traced_memory()
+                peak = max(peak, call_peak - baseline)
+        finally:
+            if not already_tracing:
+                tracemalloc.stop()
+
+        return {
+            'iterations': self.iterations,
+            'ops_per_sec': round(self.iterations / elapsed, 2) if elapsed > 0 else None,
+            'mean_ms': round(elapsed / self.iterations * 1000, 4),
+            'p50_ms': round(percentile(durations, 50) * 1000, 4),
+            'p95_ms': round(percentile(durations, 95) * 1000, 4),
+            'p99_ms': round(percentile(durations, 99) * 1000, 4),
+            'max_ms': round(durations[-1] * 1000, 4),
+            'queries_per_call': (
+                round(sum(query_counts) / len(query_counts), 2)
+                if query_counts else None
+            ),
+            'max_queries_per_call': max(query_counts) if query_counts else None,
+            'peak_memory_kib': round(peak / 1024, 1),
+        }
+
+    def run(self, cases, report=None) -> dict:
+        """
+        cases is a sequence of (name, func) pairs. report, if given, is
+        called with (name, result) as each case finishes.
+        """
+        results = {}
+        for name, func in cases:
+            results[name] = self.measure(func)
+            if report:
+                report(name, results[name])
+        return results
+
+
+def compare_results(results: dict, baseline: dict, threshold: float = 0.10) -> list:
+    """
+    Compares two {case: result} mappings. A case regresses when its
+    throughput drops or its p95 latency grows by more than threshold,
+    or when it issues more queries per call than before.
+    """
+    rows = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+
+        def change(key):
+            if not previous.get(key) or current.get(key) is None:
+                return None
+            return (current[key] - previous[key]) / previous[key]
+
+        throughput = change('ops_per_sec')
+        p95 = change('p95_ms')
+        queries_added = (
+            (current.get('max_queries_per_call') or 0)
+            - (previous.get('max_queries_per_call') or 0)
+        )
+        rows.append({
+            'case': name,
+            'ops_per_sec_change': throughput,
+            'p95_change': p95,
+            'queries_added': queries_added,
+            'regressed': (
+                (throughput is not None and throughput < -threshold)
+                or (p95 is not None and p95 > threshold)
+                or queries_added > 0
+            ),
+        })
+    return rows
+
+
+# ── Concurrent load ──
+# Closed-loop load: concurrency clients each send their share of the
+# requests back to back, through the full WSGI or ASGI handler stack.
+
+def load_summary(durations: list, elapsed: float, errors: int) -> dict:
+    durations = sorted(durations)
+    return {
+        'requests': len(durations),
+        'errors': errors,
+        'ops_per_sec': round(len(durations) / elapsed, 2) if elapsed > 0 else None,
+        'p50_ms': round(percentile(durations, 50) * 1000, 3),
+        'p95_ms': round(percentile(durations, 95) * 1000, 3),
+        'p99_ms': round(percentile(durations, 99) * 1000, 3),
+        'max_ms': round(durations[-1] * 1000, 3) if durations else 0.0,
+    }
+
+
+def _shares(requests: int, concurrency: int) -> list:
+    return [
+        requests // concurrency + (1 if i < requests % concurrency else 0)
+        for i in range(concurrency)
+    ]
+
+
+def load_wsgi(url: str, headers: dict, requests: int, concurrency: int) -> dict:
+    """
+    GETs url from concurrency threads, each with its own test Client and
+    database connection, like a threaded WSGI server
+    """
+    durations = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def client_loop(count):
+        client = Client()
+        local = []
+        failed = 0
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                response = client.get(url, headers=headers)
+                local.append(time.perf_counter() - started)
+                failed += response.status_code != 200
+        finally:
+            connections.close_all()
+        with lock:
+            durations.extend(local)
+            errors[0] += failed
+
+    threads = [
+        threading.Thread(target=client_loop, args=(count,))
+        for count in _shares(requests, concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return load_summary(durations, time.perf_counter() - started, errors[0])
+
+
+def load_asgi(url: str, headers: dict, requests: int, concurrency: int) -> dict:
+    """
+    GETs url from concurrency tasks on one event loop through the ASGI
+    handler, like a single-process ASGI server
+    """
+    durations = []
+    errors = 0
+
+    async def client_loop(count):
+        nonlocal errors
+        client = AsyncClient()
+        for _ in range(count):
+            started = time.perf_counter()
+            response = await client.get(url, headers=headers)
+            durations.append(time.perf_counter() - started)
+            errors += response.status_code != 200
+
+    async def main():
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(
+                client_loop(count) for count in _shares(requests, concurrency)
+            ))
+            return time.perf_counter() - started
+        finally:
+            # The ORM ran on the sync_to_async thread; close its connection
+            await sync_to_async(connections.close_all)()
+
+    elapsed = asyncio.run(main())
+    return load_summary(durations, elapsed, errors)
@@ -0,0 +1,205 @@
+import numpy as np
+
+from authentication.models import User
+from ehr.models import RESOURCE_MODELS
+from .policy_evaluator import ROLE_MIN_CLEARANCE, DEPARTMENT_OVERRIDE_ROLES
+
+
+NO_DEPARTMENT = -1
+
+
+class BulkPolicyEvaluator:
+    """
+    Vectorised PolicyEvaluator for population-scale questions such as
+    "which records can this clinician see?" or "who can see this record?"
+
+    Users and resources are loaded into NumPy columns and the access
+    matrix (users x resources) is computed with broadcast comparisons.
+    """
+
+    def __init__(self):
+        # Department name -> integer code, shared by users and resources
+        # so that department equality becomes integer equality
+        self.departments = {}
+
+    def _department_code(self, department) -> int:
+        return self.departments.setdefault(department, len(self.departments))
+
+    # ── Column builders ──
+
+    def user_columns(self, users) -> dict:
+        """
+        Builds user columns from resolved user attribute dicts
+        """
+        ids, clearance, role_min, overridden, dept, authorized = (
+            [], [], [], [], [], []
+        )
+        for attrs in users:
+            role = attrs.get('role')
+            ids.append(attrs['user_id'])
+            clearance.append(attrs.get('clearance_level', 0))
+            role_min.append(ROLE_MIN_CLEARANCE.get(role, 1))
+            overridden.append(role in DEPARTMENT_OVERRIDE_ROLES)
+            dept.append(self._department_code(attrs.get('department')))
+            authorized.append(bool(attrs.get('is_emergency_authorized')))
+
+        return {
+            'id': np.array(ids, dtype=np.int64),
+            'clearance_level': np.array(clearance, dtype=np.int64),
+            'role_min_clearance': np.array(role_min, dtype=np.int64),
+            'department_override': np.array(overridden, dtype=bool),
+            'department': np.array(dept, dtype=np.int64),
+            'is_emergency_authorized': np.array(authorized, dtype=bool),
+        }
+
+    def resource_columns(self, resources) -> dict:
+        """
+        Builds resource columns from resolved resource attribute dicts
+        """
+        ids, sensitivity, required, dept, consent = [], [], [], [], []
+        for attrs in resources:
+            required_dept = attrs.get('required_department')
+            ids.append(attrs['resource_id'])
+            sensitivity.append(attrs.get('sensitivity_level', 1))
+            required.append(attrs.get('required_clearance_level', 1))
+            dept.append(
+                self._department_code(required_dept)
+                if required_dept else NO_DEPARTMENT
+            )
+            consent.append(bool(attrs.get('patient_consent', True)))
+
+        return {
+            'id': np.array(ids, dtype=np.int64),
+            'sensitivity_level': np.array(sensitivity, dtype=np.int64),
+            'required_clearance_level': np.array(required, dtype=np.int64),
+            'required_department': np.array(dept, dtype=np.int64),
+            'patient_consent': np.array(consent, dtype=bool),
+        }
+
+    # ── Database loaders ──
+
+    def load_users(self, queryset=None) -> dict:
+        if queryset is None:
+            queryset = User.objects.all()
+        rows = queryset.values_list(
+            'id', 'role', 'department',
+            'clearance_level', 'is_emergency_authorized'
+        )
+        return self.user_columns(
+            {
+                'user_id': user_id,
+                'role': role,
+                'department': department,
+                'clearance_level': clearance,
+                'is_emergency_authorized': authorized,
+            }
+            for user_id, role, department, clearance, authorized
+            in rows.iterator(chunk_size=10000)
+        )
+
+    def load_resources(self, resource_type: str, queryset=None) -> dict:
+        model = RESOURCE_MODELS[resource_type]
+        if queryset is None:
+            queryset = model.objects.all()
+
+        # Reports and lab results have no department or consent columns;
+        # the attribute resolver defaults them to None and True
+        model_fields = {f.name for f in model._meta.get_fields()}
+        fields = [
+            name for name in (
+                'sensitivity_level', 'required_clearance_level',
+                'required_department', 'patient_consent',
+            )
+            if name in model_fields
+        ]
+        rows = queryset.values('id', *fields)
+        return self.resource_columns(
+            dict(row, resource_id=row['id'])
+            for row in rows.iterator(chunk_size=10000)
+        )
+
+    # ── Evaluation ──
+
+    def access_matrix(
+        self,
+        users: dict,
+        resources: dict,
+        is_emergency: bool = False
+    ):
+        """
+        Returns a boolean array of shape (len(users), len(resources))
+        """
+        user_clearance = users['clearance_level'][:, None]
+
+        clearance_ok = user_clearance >= resources['required_clearance_level']
+
+        required_dept = resources['required_department']
+        dept_ok = (
+            (required_dept == NO_DEPARTMENT)
+            | (users['department'][:, None] == required_dept)
+            | users['department_override'][:, None]
+        )
+
+        if is_emergency:
+            # Emergency override waives clearance and department
+            authorized = users['is_emergency_authorized'][:, None]
+            clearance_ok = clearance_ok | authorized
+            dept_ok = dept_ok | authorized
+
+        sensitivity = resources['sensitivity_level']
+        role_ok = (
+            (sensitivity <= users['role_min_clearance'][:, None])
+            | (user_clearance >= sensitivity)
+        )
+
+        return clearance_ok & dept_ok & role_ok & resources['patient_consent']
+
+    def iter_access_matrix(
+        self,
+        users: dict,
+        resources: dict,
+        is_emergency: bool = False,
+        chunk_size: int = 100000
+    ):
+        """
+        Yields (resource_slice, matrix) blocks so very large resource
+        sets can be processed without materialising the full matrix
+        """
+        total = len(resources['id'])
+        for start in range(0, total, chunk_size):
+            block = slice(start, min(start + chunk_size, total))
+            chunk = {name: column[block] for name, column in resources.items()}
+            yield block, self.access_matrix(users, chunk, is_emergency)
+
+    def accessible_resource_ids(
+        self,
+        user,
+        resource_type: str,
+        queryset=None,
+        is_emergency: bool = False
+    ):
+        """
+        Ids of every resource of this type the user may access
+        """
+        users = self.load_users(User.objects.filter(pk=user.pk))
+        resources = self.load_resources(resource_type, queryset)
+        granted = self.access_matrix(users, resources, is_emergency)[0]
+        return resources['id'][granted]
+
+    def users_with_access(
+        self,
+        resource_type: str,
+        resource,
+        queryset=None,
+        is_emergency: bool = False
+    ):
+        """
+        Ids of every user who may access this resource
+        """
+        model = RESOURCE_MODELS[resource_type]
+        users = self.load_users(queryset)
+        resources = self.load_resources(
+            resource_type, model.objects.filter(pk=resource.pk)
+        )
+        granted = self.access_matrix(users, resources, is_emergency)[:, 0]
+        return users['id'][granted]
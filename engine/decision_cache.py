@@ -0,0 +1,173 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+# Attributes covered by decision_fingerprint. Evaluators that read
+# anything else list it in their fingerprint_extra attribute.
+FINGERPRINT_ATTRIBUTES = frozenset([
+    'user.role', 'user.department', 'user.clearance_level',
+    'user.is_emergency_authorized', 'user.within_working_hours',
+    'resource.resource_type', 'resource.sensitivity_level',
+    'resource.required_clearance_level', 'resource.required_department',
+    'resource.patient_consent',
+    'environment.is_emergency', 'environment.current_shift',
+])
+
+
+def decision_fingerprint(
+    user_attrs: dict,
+    resource_attrs: dict,
+    env_attrs: dict,
+    extra=()
+) -> tuple:
+    """
+    Canonical key made of every attribute the policy can look at.
+    Working hours and shift are included as coarse buckets so that
+    time-based rules can be added without changing the key.
+    extra is a sequence of (attrs index, key) pairs for attributes
+    outside FINGERPRINT_ATTRIBUTES.
+    """
+    key = (
+        user_attrs.get('role'),
+        user_attrs.get('department'),
+        user_attrs.get('clearance_level', 0),
+        bool(user_attrs.get('is_emergency_authorized')),
+        bool(user_attrs.get('within_working_hours', True)),
+        resource_attrs.get('resource_type'),
+        resource_attrs.get('sensitivity_level', 1),
+        resource_attrs.get('required_clearance_level', 1),
+        resource_attrs.get('required_department'),
+        bool(resource_attrs.get('patient_consent', True)),
+        env_attrs.get('is_emergency', False),
+        env_attrs.get('current_shift'),
+    )
+    if extra:
+        attrs = (user_attrs, resource_attrs, env_attrs)
+        key += tuple(attrs[index].get(name) for index, name in extra)
+    return key
+
+
+class DecisionCache:
+    """
+    Bounded LRU of policy decisions keyed on attribute fingerprints.
+    The whole cache is dropped when the policy version changes.
+    """
+
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0,
+        }
+
+    def get(self, key, version):
+        with self._lock:
+            if version != self.version:
+                self._reset(version)
+                self.counters['misses'] += 1
+                return None
+            decision = self._entries.get(key)
+            if decision is None:
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return decision
+
+    def put(self, key, version, decision):
+        with self._lock:
+            if version != self.version:
+                self._reset(version)
+            self._entries[key] = decision
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def _reset(self, version):
+        if self._entries:
+            self.counters['invalidations'] += 1
+        self._entries.clear()
+        self.version = version
+
+    def clear(self):
+        with self._lock:
+            self._reset(None)
+
+    def stats(self) -> dict:
+        lookups = self.counters['hits'] + self.counters['misses']
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'policy_version': self.version,
+            **self.counters,
+            'hit_rate': round(self.counters['hits'] / lookups, 4) if lookups else 0.0,
+        }
+
+
+class CachingPolicyEvaluator:
+    """
+    Wraps a policy evaluator and memoises its decisions
+    """
+
+    def __init__(self, evaluator, cache: DecisionCache):
+        self.evaluator = evaluator
+        self.cache = cache
+
+    @property
+    def version(self):
+        return getattr(self.evaluator, 'version', None)
+
+    @property
+    def builtin(self) -> bool:
+        return getattr(self.evaluator, 'builtin', True)
+
+    @property
+    def fingerprint_extra(self) -> tuple:
+        return getattr(self.evaluator, 'fingerprint_extra', ())
+
+    def evaluate(
+        self,
+        user_attrs: dict,
+        resource_attrs: dict,
+        env_attrs: dict
+    ) -> dict:
+
+        # One snapshot for the key, the version and the decision, so a
+        # publish in between cannot file a decision under the wrong set
+        snapshot = getattr(self.evaluator, 'snapshot', None)
+        evaluator = snapshot() if snapshot is not None else self.evaluator
+        try:
+            key = decision_fingerprint(
+                user_attrs, resource_attrs, env_attrs,
+                getattr(evaluator, 'fingerprint_extra', ())
+            )
+            hash(key)
+        except TypeError:
+            return evaluator.evaluate(user_attrs, resource_attrs, env_attrs)
+
+        version = getattr(evaluator, 'version', None)
+        decision = self.cache.get(key, version)
+        if decision is None:
+            decision = evaluator.evaluate(user_attrs, resource_attrs, env_attrs)
+            self.cache.put(key, version, decision)
+
+        # Callers own the lists they receive
+        return {
+            **decision,
+            'checks_passed': list(decision['checks_passed']),
+            'checks_failed': list(decision['checks_failed']),
+            'reasons': list(decision['reasons']),
+        }
+
+
+decision_cache = DecisionCache(
+    max_size=getattr(settings, 'POLICY_DECISION_CACHE_SIZE', 4096)
+)
@@ -1,6 +1,33 @@
+from django.conf import settings
+
 from .attribute_resolver import AttributeResolver
 from .policy_evaluator import PolicyEvaluator
+from .decision_table import CompiledPolicyEvaluator, failed_checks, is_granted
+from .decision_cache import CachingPolicyEvaluator, decision_cache
+from .query_compiler import compile_access_filter
+from .timing import phase
+from ehr.models import RESOURCE_MODELS
+from policies.store import StorePolicyEvaluator
 from audit.models import AuditLog
+from audit.sink import get_audit_sink
+
+
+def get_policy_evaluator():
+    """
+    Returns the evaluator selected by settings.POLICY_EVALUATOR_MODE,
+    wrapped in the shared decision cache unless it is disabled
+    """
+    mode = getattr(settings, 'POLICY_EVALUATOR_MODE', 'standard')
+    if mode == 'store':
+        evaluator = StorePolicyEvaluator(fallback=CompiledPolicyEvaluator())
+    elif mode == 'compiled':
+        evaluator = CompiledPolicyEvaluator()
+    else:
+        evaluator = PolicyEvaluator()
+
+    if getattr(settings, 'POLICY_DECISION_CACHE_SIZE', 0) > 0:
+        return CachingPolicyEvaluator(evaluator, decision_cache)
+    return evaluator
 
 
 class PolicyDecisionPoint:
@@ -10,7 +37,29 @@ class PolicyDecisionPoint:
 
     def __init__(self):
         self.resolver = AttributeResolver()
-        self.evaluator = PolicyEvaluator()
+        self.evaluator = get_policy_evaluator()
+
+    def access_filter(
+        self,
+        user,
+        resource_type: str,
+        is_emergency: bool = False,
+        location: str = None
+    ):
+        """
+        Q expression selecting the rows of resource_type this user would
+        be granted, so callers can split records in the database.
+        Returns None when the active policy is a stored rule set, which
+        has no query translation.
+        """
+        with phase('policy_filter'):
+            if not getattr(self.evaluator, 'builtin', True):
+                return None
+            return compile_access_filter(
+                RESOURCE_MODELS[resource_type],
+                self.resolver.resolve_user_attributes(user),
+                self.resolver.resolve_environment_attributes(is_emergency, location),
+            )
 
     def make_decision(
         self,
@@ -21,22 +70,158 @@ class PolicyDecisionPoint:
         location: str = None
     ) -> dict:
 
-        # Step 1: Resolve all attributes
+        return self.make_decisions(
+            user, resource_type, [resource], is_emergency, location
+        )[0]
+
+    def make_decisions(
+        self,
+        user,
+        resource_type: str,
+        resources,
+        is_emergency: bool = False,
+        location: str = None
+    ) -> list:
+        """
+        Evaluates many resources of one type for the same user.
+        User and environment attributes are resolved once, so every
+        decision in the batch shares the same snapshot, and the audit
+        trail is handed to the audit sink as one batch.
+        """
+        return self.make_grouped_decisions(
+            user, {resource_type: resources}, is_emergency, location
+        )[resource_type]
+
+    def make_grouped_decisions(
+        self,
+        user,
+        resources_by_type: dict,
+        is_emergency: bool = False,
+        location: str = None
+    ) -> dict:
+        """
+        Like make_decisions, for resources of several types at once:
+        one attribute snapshot and one audit batch for the whole group.
+        Returns {resource_type: [decision, ...]} in input order.
+        """
+        return self.make_batch_decisions(
+            user, [(resources_by_type, is_emergency)], location
+        )[0]
+
+    def make_batch_decisions(
+        self,
+        user,
+        batches: list,
+        location: str = None
+    ) -> list:
+        """
+        make_grouped_decisions for groups that differ in emergency state,
+        e.g. patients with and without an EAT: user attributes are
+        resolved once and all groups share one audit batch.
+        batches is a list of (resources_by_type, is_emergency); returns
+        one {resource_type: [decision, ...]} per batch.
+        """
+
+        # Step 1: Resolve user attributes once
+        user_attrs = self.resolver.resolve_user_attributes(user)
+
+        results = []
+        audit_entries = []
+        evaluate_phase = phase('evaluate')
+
+        for resources_by_type, is_emergency in batches:
+            env_attrs = self.resolver.resolve_environment_attributes(
+                is_emergency, location
+            )
+            grouped = {}
+            results.append(grouped)
+
+            for resource_type, resources in resources_by_type.items():
+                decisions = grouped[resource_type] = []
+
+                for resource in resources:
+                    # Step 2: Resolve resource attributes and evaluate policy
+                    resource_attrs = self.resolver.resolve_resource_attributes(
+                        resource_type, resource
+                    )
+                    with evaluate_phase:
+                        decision = self.evaluator.evaluate(
+                            user_attrs, resource_attrs, env_attrs
+                        )
+
+                    audit_entries.append(self._build_audit_entry(
+                        user, resource_type, resource, is_emergency,
+                        user_attrs, resource_attrs, decision
+                    ))
+
+                    decisions.append({
+                        'access_granted': decision['access_granted'],
+                        'user': user_attrs,
+                        'resource': resource_attrs,
+                        'environment': env_attrs,
+                        'checks_passed': decision['checks_passed'],
+                        'checks_failed': decision['checks_failed'],
+                        'reasons': decision['reasons'],
+                    })
+
+        # Step 3: Hand every decision to the audit sink in one batch
+        get_audit_sink().log_many(audit_entries)
+
+        return results
+
+    def check_access(
+        self,
+        user,
+        resource_type: str,
+        resources,
+        is_emergency: bool = False,
+        location: str = None
+    ) -> list:
+        """
+        Decisions without explanations or audit entries, for callers
+        that return no resource content. Returns one
+        {'access_granted', 'reason_codes'} per resource; the codes are
+        the failed check names of the built-in policy (one decision
+        table lookup each) or the failed rule names of a stored
+        policy set.
+        """
         user_attrs = self.resolver.resolve_user_attributes(user)
-        resource_attrs = self.resolver.resolve_resource_attributes(
-            resource_type, resource
-        )
         env_attrs = self.resolver.resolve_environment_attributes(
             is_emergency, location
         )
+        builtin = getattr(self.evaluator, 'builtin', True)
+        table = CompiledPolicyEvaluator()
 
-        # Step 2: Evaluate policy
-        decision = self.evaluator.evaluate(
-            user_attrs, resource_attrs, env_attrs
-        )
+        results = []
+        with phase('evaluate'):
+            for resource in resources:
+                resource_attrs = self.resolver.resolve_resource_attributes(
+                    resource_type, resource
+                )
+                if builtin:
+                    code = table.decide(user_attrs, resource_attrs, env_attrs)
+                    results.append({
+                        'access_granted': is_granted(code),
+                        'reason_codes': failed_checks(code),
+                    })
+                else:
+                    decision = self.evaluator.evaluate(
+                        user_attrs, resource_attrs, env_attrs
+                    )
+                    results.append({
+                        'access_granted': decision['access_granted'],
+                        'reason_codes': [
+                            check.removeprefix('❌ ')
+                            for check in decision['checks_failed']
+                        ],
+                    })
+        return results
 
-        # Step 3: Log the decision
-        AuditLog.objects.create(
+    def _build_audit_entry(
+        self, user, resource_type, resource, is_emergency,
+        user_attrs, resource_attrs, decision
+    ) -> AuditLog:
+        return AuditLog(
             user=user,
             action=f"ACCESS_{resource_type.upper()}",
             resource_type=resource_type,
@@ -53,13 +238,3 @@ class PolicyDecisionPoint:
                 'resource_sensitivity': resource_attrs['sensitivity_level'],
             }
         )
-
-        return {
-            'access_granted': decision['access_granted'],
-            'user': user_attrs,
-            'resource': resource_attrs,
-            'environment': env_attrs,
-            'checks_passed': decision['checks_passed'],
-            'checks_failed': decision['checks_failed'],
-            'reasons': decision['reasons'],
-        }
\ No newline at end of file
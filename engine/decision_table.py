@@ -0,0 +1,328 @@
+from array import array
+from functools import lru_cache
+
+from .policy_evaluator import (
+    ROLE_MIN_CLEARANCE,
+    DEPARTMENT_OVERRIDE_ROLES,
+)
+
+
+# ── Reason codes ──
+# A decision is a single integer: the low bits say which checks passed,
+# the high bits (shifted by FAILED_SHIFT) say which checks failed.
+# A check that appears in neither half was not applicable or was
+# waived by the emergency override.
+CLEARANCE = 1
+DEPARTMENT = 2
+CONSENT = 4
+EMERGENCY_OVERRIDE = 8
+ROLE = 16
+
+FAILED_SHIFT = 5
+
+# Order in which PolicyEvaluator lists its checks
+CHECK_ORDER = (CLEARANCE, DEPARTMENT, CONSENT, EMERGENCY_OVERRIDE, ROLE)
+
+CHECK_NAMES = {
+    CLEARANCE: 'clearance',
+    DEPARTMENT: 'department',
+    CONSENT: 'consent',
+    EMERGENCY_OVERRIDE: 'emergency_override',
+    ROLE: 'role',
+}
+
+# ── Table dimensions ──
+# Departments only matter through equality, so the department axis is
+# "not required / matches / does not match" rather than every pair.
+ROLES = tuple(ROLE_MIN_CLEARANCE) + (None,)     # None = any other role
+DEPT_NOT_REQUIRED, DEPT_MATCH, DEPT_MISMATCH = 0, 1, 2
+LEVELS = (1, 2, 3, 4, 5)
+
+_ROLE_INDEX = {role: i for i, role in enumerate(ROLES[:-1])}
+_UNKNOWN_ROLE = len(ROLES) - 1
+
+# Strides for the flattened index, innermost axis last
+_AUTH_STRIDE = 1
+_EMERGENCY_STRIDE = 2
+_CONSENT_STRIDE = 4
+_SENSITIVITY_STRIDE = 8
+_REQUIRED_STRIDE = _SENSITIVITY_STRIDE * len(LEVELS)
+_CLEARANCE_STRIDE = _REQUIRED_STRIDE * len(LEVELS)
+_DEPT_STRIDE = _CLEARANCE_STRIDE * len(LEVELS)
+_ROLE_STRIDE = _DEPT_STRIDE * 3
+TABLE_SIZE = _ROLE_STRIDE * len(ROLES)
+
+
+def is_granted(code: int) -> bool:
+    return code >> FAILED_SHIFT == 0
+
+
+def passed_checks(code: int) -> list:
+    return [CHECK_NAMES[c] for c in CHECK_ORDER if code & c]
+
+
+def failed_checks(code: int) -> list:
+    failed = code >> FAILED_SHIFT
+    return [CHECK_NAMES[c] for c in CHECK_ORDER if failed & c]
+
+
+def compute_code(
+    role_min, dept_overridden, dept_state, user_clearance,
+    required_clearance, sensitivity, consent, is_emergency, authorized
+) -> int:
+    """
+    Applies the PolicyEvaluator rules to one point of the decision space
+    """
+    passed = failed = 0
+
+    if user_clearance >= required_clearance:
+        passed |= CLEARANCE
+    else:
+        failed |= CLEARANCE
+
+    if dept_state != DEPT_NOT_REQUIRED:
+        if dept_state == DEPT_MATCH or dept_overridden:
+            passed |= DEPARTMENT
+        else:
+            failed |= DEPARTMENT
+
+    if consent:
+        passed |= CONSENT
+    else:
+        failed |= CONSENT
+
+    if is_emergency and authorized:
+        passed |= EMERGENCY_OVERRIDE
+        failed &= ~(CLEARANCE | DEPARTMENT)
+
+    if sensitivity <= role_min or user_clearance >= sensitivity:
+        passed |= ROLE
+    else:
+        failed |= ROLE
+
+    return passed | (failed << FAILED_SHIFT)
+
+
+def build_table() -> array:
+    table = array('H', bytes(2 * TABLE_SIZE))
+    for role_index, role in enumerate(ROLES):
+        role_min = ROLE_MIN_CLEARANCE.get(role, 1)
+        overridden = role in DEPARTMENT_OVERRIDE_ROLES
+        for dept_state in (DEPT_NOT_REQUIRED, DEPT_MATCH, DEPT_MISMATCH):
+            for uc in LEVELS:
+                for rc in LEVELS:
+                    for sens in LEVELS:
+                        base = (
+                            role_index * _ROLE_STRIDE
+                            + dept_state * _DEPT_STRIDE
+                            + (uc - 1) * _CLEARANCE_STRIDE
+                            + (rc - 1) * _REQUIRED_STRIDE
+                            + (sens - 1) * _SENSITIVITY_STRIDE
+                        )
+                        for offset in range(8):
+                            table[base + offset] = compute_code(
+                                role_min, overridden, dept_state,
+                                uc, rc, sens,
+                                offset & _CONSENT_STRIDE,
+                                offset & _EMERGENCY_STRIDE,
+                                offset & _AUTH_STRIDE,
+                            )
+    return table
+
+
+DECISION_TABLE = build_table()
+
+
+def _level_index(value):
+    # Only plain ints inside 1-5 are covered by the table
+    if type(value) is int and 1 <= value <= 5:
+        return value - 1
+    return None
+
+
+class CompiledPolicyEvaluator:
+    """
+    Table-driven equivalent of PolicyEvaluator.
+    Each decision is one index into DECISION_TABLE; explanation
+    strings are only rendered when explain=True.
+    """
+
+    table = DECISION_TABLE
+
+    def decide(
+        self,
+        user_attrs: dict,
+        resource_attrs: dict,
+        env_attrs: dict
+    ) -> int:
+        """
+        Returns the reason code for one access request
+        """
+        return self._lookup(
+            user_attrs.get('role'),
+            user_attrs.get('department'),
+            user_attrs.get('clearance_level', 0),
+            user_attrs.get('is_emergency_authorized'),
+            resource_attrs.get('required_department'),
+            resource_attrs.get('required_clearance_level', 1),
+            resource_attrs.get('sensitivity_level', 1),
+            resource_attrs.get('patient_consent', True),
+            env_attrs.get('is_emergency', False),
+        )
+
+    def _lookup(
+        self, role, user_dept, user_clearance, authorized, required_dept,
+        required_clearance, sensitivity, consent, is_emergency
+    ) -> int:
+        if not required_dept:
+            dept_state = DEPT_NOT_REQUIRED
+        elif user_dept == required_dept:
+            dept_state = DEPT_MATCH
+        else:
+            dept_state = DEPT_MISMATCH
+
+        uc = _level_index(user_clearance)
+        rc = _level_index(required_clearance)
+        sens = _level_index(sensitivity)
+
+        if uc is None or rc is None or sens is None:
+            # Outside the precomputed space: apply the rules directly
+            return compute_code(
+                ROLE_MIN_CLEARANCE.get(role, 1),
+                role in DEPARTMENT_OVERRIDE_ROLES,
+                dept_state, user_clearance, required_clearance,
+                sensitivity, consent, is_emergency, authorized,
+            )
+
+        index = (
+            _ROLE_INDEX.get(role, _UNKNOWN_ROLE) * _ROLE_STRIDE
+            + dept_state * _DEPT_STRIDE
+            + uc * _CLEARANCE_STRIDE
+            + rc * _REQUIRED_STRIDE
+            + sens * _SENSITIVITY_STRIDE
+        )
+        if consent:
+            index += _CONSENT_STRIDE
+        if is_emergency:
+            index += _EMERGENCY_STRIDE
+        if authorized:
+            index += _AUTH_STRIDE
+
+        return self.table[index]
+
+    def evaluate(
+        self,
+        user_attrs: dict,
+        resource_attrs: dict,
+        env_attrs: dict,
+        explain: bool = True
+    ) -> dict:
+
+        role = user_attrs.get('role')
+        user_dept = user_attrs.get('department')
+        user_clearance = user_attrs.get('clearance_level', 0)
+        required_dept = resource_attrs.get('required_department')
+        required_clearance = resource_attrs.get('required_clearance_level', 1)
+        sensitivity = resource_attrs.get('sensitivity_level', 1)
+        is_emergency = env_attrs.get('is_emergency', False)
+
+        code = self._lookup(
+            role, user_dept, user_clearance,
+            user_attrs.get('is_emergency_authorized'),
+            required_dept, required_clearance, sensitivity,
+            resource_attrs.get('patient_consent', True),
+            is_emergency,
+        )
+
+        if not explain:
+            return {
+                'access_granted': code >> FAILED_SHIFT == 0,
+                'is_emergency': is_emergency,
+                'reason_code': code,
+            }
+
+        checks_passed, checks_failed, reasons = render_explanation(
+            code, user_clearance, required_clearance,
+            user_dept, required_dept, role, sensitivity
+        )
+        return {
+            'access_granted': code >> FAILED_SHIFT == 0,
+            'checks_passed': list(checks_passed),
+            'checks_failed': list(checks_failed),
+            'reasons': list(reasons),
+            'is_emergency': is_emergency,
+            'reason_code': code,
+        }
+
+    def explain(self, code: int, user_attrs: dict, resource_attrs: dict) -> dict:
+        """
+        Renders the same check and reason strings PolicyEvaluator produces
+        """
+        checks_passed, checks_failed, reasons = render_explanation(
+            code,
+            user_attrs.get('clearance_level', 0),
+            resource_attrs.get('required_clearance_level', 1),
+            user_attrs.get('department'),
+            resource_attrs.get('required_department'),
+            user_attrs.get('role'),
+            resource_attrs.get('sensitivity_level', 1),
+        )
+        return {
+            'checks_passed': list(checks_passed),
+            'checks_failed': list(checks_failed),
+            'reasons': list(reasons),
+        }
+
+
+@lru_cache(maxsize=4096, typed=True)
+def render_explanation(
+    code, user_clearance, required_clearance, user_dept,
+    required_dept, role, sensitivity
+) -> tuple:
+    """
+    Builds the (passed, failed, reasons) strings for a reason code.
+    Cached because the same few value combinations repeat constantly.
+    """
+    checks_passed = []
+    checks_failed = []
+    reasons = []
+    failed = code >> FAILED_SHIFT
+
+    if code & CLEARANCE:
+        checks_passed.append(
+            f"✅ Clearance Level: {user_clearance} >= {required_clearance}"
+        )
+    elif failed & CLEARANCE:
+        checks_failed.append(
+            f"❌ Clearance Level: {user_clearance} < {required_clearance} required"
+        )
+        reasons.append("Insufficient clearance level")
+
+    if code & DEPARTMENT:
+        checks_passed.append(
+            f"✅ Department: {user_dept} matches {required_dept}"
+        )
+    elif failed & DEPARTMENT:
+        checks_failed.append(
+            f"❌ Department: {user_dept} != {required_dept} required"
+        )
+        reasons.append("Wrong department for this record")
+
+    if code & CONSENT:
+        checks_passed.append("✅ Patient Consent: Granted")
+    elif failed & CONSENT:
+        checks_failed.append("❌ Patient Consent: Not granted")
+        reasons.append("Patient has not given consent")
+
+    if code & EMERGENCY_OVERRIDE:
+        checks_passed.append("✅ Emergency Override: Authorized")
+
+    if code & ROLE:
+        checks_passed.append(f"✅ Role Access: {role} can access sensitivity {sensitivity}")
+    elif failed & ROLE:
+        checks_failed.append(
+            f"❌ Role Access: {role} cannot access sensitivity {sensitivity}"
+        )
+        reasons.append(f"Role {role} insufficient for sensitivity level {sensitivity}")
+
+    return tuple(checks_passed), tuple(checks_failed), tuple(reasons)
@@ -0,0 +1,91 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.models import User
+from ehr.models import RESOURCE_MODELS
+from engine.bulk_evaluator import BulkPolicyEvaluator
+
+
+class Command(BaseCommand):
+    help = (
+        "Evaluates the access policy for every user x record pair of a "
+        "resource type and reports who can see what"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--resource-type', choices=sorted(RESOURCE_MODELS), default='ehr'
+        )
+        parser.add_argument(
+            '--user', help="Username: list the records this user can access"
+        )
+        parser.add_argument(
+            '--record', type=int,
+            help="Record id: list the users who can access this record"
+        )
+        parser.add_argument('--emergency', action='store_true')
+        parser.add_argument(
+            '--chunk-size', type=int, default=100000,
+            help="Records evaluated per block when scanning everything"
+        )
+
+    def handle(self, *args, **options):
+        resource_type = options['resource_type']
+        is_emergency = options['emergency']
+        model = RESOURCE_MODELS[resource_type]
+        bulk = BulkPolicyEvaluator()
+
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} not found")
+            for record_id in bulk.accessible_resource_ids(
+                user, resource_type, is_emergency=is_emergency
+            ):
+                self.stdout.write(str(record_id))
+            return
+
+        if options['record'] is not None:
+            try:
+                record = model.objects.get(pk=options['record'])
+            except model.DoesNotExist:
+                raise CommandError(f"Record {options['record']} not found")
+            usernames = dict(User.objects.values_list('id', 'username'))
+            for user_id in bulk.users_with_access(
+                resource_type, record, is_emergency=is_emergency
+            ):
+                self.stdout.write(usernames[user_id])
+            return
+
+        # Full population scan: per-user counts of accessible records
+        started = time.perf_counter()
+        users = bulk.load_users()
+        resources = bulk.load_resources(resource_type)
+        loaded = time.perf_counter()
+
+        granted = 0
+        per_user = None
+        for _, block in bulk.iter_access_matrix(
+            users, resources, is_emergency, options['chunk_size']
+        ):
+            counts = block.sum(axis=1)
+            per_user = counts if per_user is None else per_user + counts
+            granted += int(counts.sum())
+        finished = time.perf_counter()
+
+        pairs = len(users['id']) * len(resources['id'])
+        elapsed = finished - loaded
+        self.stdout.write(
+            f"{len(users['id'])} users x {len(resources['id'])} {resource_type} "
+            f"records = {pairs} pairs, {granted} granted"
+        )
+        self.stdout.write(
+            f"Loaded in {loaded - started:.3f}s, evaluated in {elapsed:.3f}s"
+            + (f" ({pairs / elapsed:,.0f} pairs/sec)" if elapsed > 0 else "")
+        )
+        if per_user is not None and options['verbosity'] > 1:
+            usernames = dict(User.objects.values_list('id', 'username'))
+            for user_id, count in zip(users['id'], per_user):
+                self.stdout.write(f"{usernames[user_id]}: {count}")
@@ -0,0 +1,85 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from audit.sink import get_audit_sink
+from engine.benchmarks import benchmark_patient, benchmark_user, load_asgi, load_wsgi
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares throughput and tail latency of the sync (/api/ehr/) and "
+        "async (/api/async/ehr/) record views under concurrent load. "
+        "Writes audit rows to the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument(
+            '--requests', type=int, default=400,
+            help="Requests per endpoint and server type (default 400)"
+        )
+        parser.add_argument(
+            '--paths', nargs='*', default=['ehr', 'reports', 'lab'],
+            choices=['ehr', 'reports', 'lab'],
+        )
+        parser.add_argument('--user', help="Username to load test as")
+        parser.add_argument('--patient', help="patient_id to request")
+        parser.add_argument('--output', help="Write the results to this JSON file")
+
+    def handle(self, *args, **options):
+        user = benchmark_user(options['user'])
+        patient = benchmark_patient(options['patient'])
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+        concurrency, requests = options['concurrency'], options['requests']
+
+        self.stdout.write(
+            f"{requests} requests per case from {concurrency} concurrent "
+            f"clients as {user.username} on patient {patient.patient_id}"
+        )
+        self.stdout.write(
+            f"{'case':<16} {'req/sec':>10} {'p50 ms':>9} {'p95 ms':>9} "
+            f"{'p99 ms':>9} {'max ms':>9} {'errors':>7}"
+        )
+
+        results = {}
+        for path in options['paths']:
+            for server, prefix, load in (
+                ('wsgi', 'ehr', load_wsgi),
+                ('asgi', 'async/ehr', load_asgi),
+            ):
+                url = f'/api/{prefix}/patients/{patient.patient_id}/{path}/'
+                name = f'{server}.{path}'
+                results[name] = load(url, headers, requests, concurrency)
+                self.report(name, results[name])
+
+        get_audit_sink().flush()
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps({
+                'metadata': {
+                    'timestamp': timezone.now().isoformat(),
+                    'database': settings.DATABASES['default']['ENGINE'],
+                    'user': user.username,
+                    'patient': patient.patient_id,
+                    'concurrency': concurrency,
+                    'requests': requests,
+                    'settings': {
+                        name: getattr(settings, name, None)
+                        for name in ('AUDIT_SINK', 'SERVER_TIMING_ENABLED', 'DEBUG')
+                    },
+                },
+                'results': results,
+            }, indent=2))
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<16} {result['ops_per_sec']:>10,.0f} {result['p50_ms']:>9.3f} "
+            f"{result['p95_ms']:>9.3f} {result['p99_ms']:>9.3f} "
+            f"{result['max_ms']:>9.3f} {result['errors']:>7}"
+        )
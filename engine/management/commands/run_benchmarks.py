@@ -0,0 +1,230 @@
+import itertools
+import json
+import platform
+import sys
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from authentication.models import User
+from audit.sink import get_audit_sink
+from ehr.models import Patient, EHRRecord, MedicalReport, LabResult
+from ehr.fast_serializers import get_fast_serializer
+from ehr.serializers import EHRRecordSerializer
+from emergency.eat_handler import EATHandler
+from engine.attribute_resolver import AttributeResolver
+from engine.benchmarks import (
+    BenchmarkRunner, benchmark_patient, benchmark_user, compare_results
+)
+from engine.decision_point import PolicyDecisionPoint
+from engine.policy_evaluator import PolicyEvaluator
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the access-control hot path and optionally compares "
+        "the results with a saved baseline. Writes audit rows and "
+        "emergency tokens to the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=1000)
+        parser.add_argument('--warmup', type=int, default=50)
+        parser.add_argument(
+            '--user',
+            help="Username to benchmark as (default: first emergency-authorized doctor)"
+        )
+        parser.add_argument(
+            '--patient',
+            help="patient_id to benchmark (default: patient of the first EHR record)"
+        )
+        parser.add_argument(
+            '--cases', nargs='*',
+            help="Only run cases whose name starts with one of these prefixes"
+        )
+        parser.add_argument('--output', help="Write the results to this JSON file")
+        parser.add_argument('--baseline', help="Compare with this results file")
+        parser.add_argument(
+            '--threshold', type=float, default=0.10,
+            help="Relative change counted as a regression (default 0.10)"
+        )
+        parser.add_argument(
+            '--fail-on-regression', action='store_true',
+            help="Exit with an error if any case regressed"
+        )
+
+    def handle(self, *args, **options):
+        user = benchmark_user(options['user'])
+        patient = benchmark_patient(options['patient'])
+
+        cases = self.build_cases(user, patient)
+        if options['cases']:
+            cases = [
+                (name, func) for name, func in cases
+                if name.startswith(tuple(options['cases']))
+            ]
+
+        runner = BenchmarkRunner(
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            query_samples=min(20, options['iterations']),
+            memory_samples=min(20, options['iterations']),
+        )
+        self.stdout.write(
+            f"Benchmarking as {user.username} ({user.role}) on patient "
+            f"{patient.patient_id}, {options['iterations']} iterations per case"
+        )
+        self.stdout.write(
+            f"{'case':<28} {'ops/sec':>12} {'p50 ms':>9} {'p95 ms':>9} "
+            f"{'p99 ms':>9} {'queries':>8} {'peak KiB':>9}"
+        )
+        results = runner.run(cases, report=self.report)
+
+        # Buffered audit entries are part of the work being measured
+        get_audit_sink().flush()
+
+        document = {
+            'metadata': self.metadata(user, patient, options),
+            'results': results,
+        }
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(document, indent=2))
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            self.compare(results, options)
+
+    # ── Cases ──
+
+    def build_cases(self, user, patient) -> list:
+        resolver = AttributeResolver()
+        evaluator = PolicyEvaluator()
+        pdp = PolicyDecisionPoint()
+        handler = EATHandler()
+        client = APIClient()
+        client.force_authenticate(user)
+
+        records = list(EHRRecord.objects.filter(patient=patient)[:100])
+        if not records:
+            raise CommandError(f"Patient {patient.patient_id} has no EHR records")
+
+        user_attrs = resolver.resolve_user_attributes(user)
+        env_attrs = resolver.resolve_environment_attributes()
+        resource_attrs = [
+            resolver.resolve_resource_attributes('ehr', record)
+            for record in records
+        ]
+
+        def evaluate(i):
+            evaluator.evaluate(
+                user_attrs, resource_attrs[i % len(resource_attrs)], env_attrs
+            )
+
+        fast_serialize = get_fast_serializer(EHRRecordSerializer)
+
+        def serialize_drf(i):
+            EHRRecordSerializer(records[i % len(records)]).data
+
+        def serialize_fast(i):
+            fast_serialize(records[i % len(records)])
+
+        def make_decision(i):
+            pdp.make_decision(user, 'ehr', records[i % len(records)])
+
+        def view(path):
+            url = f'/api/ehr/patients/{patient.patient_id}/{path}/'
+
+            def get(i):
+                response = client.get(url)
+                if response.status_code != 200:
+                    raise CommandError(f"GET {url} returned {response.status_code}")
+            return get
+
+        # Unique patient ids so every call takes the token creation path
+        run_id = timezone.now().strftime('%H%M%S')
+        sequence = itertools.count()
+
+        def eat_generate(i):
+            handler.generate_token(user, f'B{run_id}-{next(sequence)}', 'Benchmark')
+
+        token = handler.generate_token(user, patient.patient_id, 'Benchmark')
+
+        def eat_validate(i):
+            handler.validate_token(token['token_id'], user)
+
+        return [
+            ('policy.evaluate', evaluate),
+            ('pdp.make_decision', make_decision),
+            ('serialize.ehr.drf', serialize_drf),
+            ('serialize.ehr.fast', serialize_fast),
+            ('view.ehr', view('ehr')),
+            ('view.reports', view('reports')),
+            ('view.lab', view('lab')),
+            ('view.chart', view('chart')),
+            ('eat.generate', eat_generate),
+            ('eat.validate', eat_validate),
+        ]
+
+    # ── Reporting ──
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<28} {result['ops_per_sec']:>12,.0f} {result['p50_ms']:>9.3f} "
+            f"{result['p95_ms']:>9.3f} {result['p99_ms']:>9.3f} "
+            f"{result['queries_per_call']:>8} {result['peak_memory_kib']:>9}"
+        )
+
+    def metadata(self, user, patient, options) -> dict:
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'python': sys.version.split()[0],
+            'django': django.get_version(),
+            'platform': platform.platform(),
+            'database': settings.DATABASES['default']['ENGINE'],
+            'user': user.username,
+            'patient': patient.patient_id,
+            'iterations': options['iterations'],
+            'rows': {
+                'users': User.objects.count(),
+                'patients': Patient.objects.count(),
+                'ehr_records': EHRRecord.objects.count(),
+                'medical_reports': MedicalReport.objects.count(),
+                'lab_results': LabResult.objects.count(),
+            },
+            'settings': {
+                name: getattr(settings, name, None)
+                for name in (
+                    'POLICY_EVALUATOR_MODE',
+                    'POLICY_DECISION_CACHE_SIZE',
+                    'USER_ATTRIBUTE_CACHE_SIZE',
+                    'AUDIT_SINK',
+                )
+            },
+        }
+
+    def compare(self, results, options):
+        try:
+            baseline = json.loads(Path(options['baseline']).read_text())['results']
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Cannot read baseline {options['baseline']}: {exc}")
+
+        def percent(value):
+            return f"{value:+.1%}" if value is not None else 'n/a'
+
+        self.stdout.write(f"\nCompared with {options['baseline']}:")
+        rows = compare_results(results, baseline, options['threshold'])
+        for row in rows:
+            self.stdout.write(
+                f"{row['case']:<28} ops/sec {percent(row['ops_per_sec_change']):>8} "
+                f"p95 {percent(row['p95_change']):>8} "
+                f"queries {row['queries_added']:+d}"
+                + ("  REGRESSION" if row['regressed'] else "")
+            )
+
+        regressed = [row['case'] for row in rows if row['regressed']]
+        if regressed and options['fail_on_regression']:
+            raise CommandError(f"Regressed: {', '.join(regressed)}")
@@ -0,0 +1,111 @@
+import json
+import logging
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from .attribute_cache import user_attribute_cache
+from .timing import collect_timings, record_query
+
+
+logger = logging.getLogger('engine.timing')
+
+
+class AttributeCacheMiddleware:
+    """
+    Scopes the per-request level of the user attribute cache.
+    Async-capable, so async views are not pushed through a thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with user_attribute_cache.request_scope():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with user_attribute_cache.request_scope():
+            return await self.get_response(request)
+
+
+def enter_query_hook():
+    """
+    Enters record_query on this thread's connection and returns the
+    context manager to exit it with
+    """
+    hook = connection.execute_wrapper(record_query)
+    hook.__enter__()
+    return hook
+
+
+class ServerTimingMiddleware:
+    """
+    Times the hot-path phases and SQL of a sample of requests and reports
+    them in a Server-Timing header and, optionally, a JSON log line.
+    Removes itself from the stack when SERVER_TIMING_ENABLED is off, and
+    unsampled requests never enable the timers. Async-capable, like
+    AttributeCacheMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SERVER_TIMING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'SERVER_TIMING_SAMPLE_RATE', 1.0)
+        self.log = getattr(settings, 'SERVER_TIMING_LOG', False)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        with collect_timings() as timings, connection.execute_wrapper(record_query):
+            response = self.get_response(request)
+        return self.report(request, response, timings)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        with collect_timings() as timings:
+            # On the thread the view's sync_to_async calls run on, and
+            # only for this request
+            hook = await sync_to_async(enter_query_hook)()
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(hook.__exit__)(None, None, None)
+        return self.report(request, response, timings)
+
+    def report(self, request, response, timings):
+        total = timings.elapsed()
+        response['Server-Timing'] = timings.server_timing(total)
+        if self.log:
+            logger.info(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                **timings.as_dict(total),
+            }))
+        return response
@@ -1,3 +1,17 @@
+# Minimum sensitivity each role may read regardless of clearance
+ROLE_MIN_CLEARANCE = {
+    'doctor': 3,
+    'nurse': 1,
+    'admin': 5,
+    'emergency_staff': 4,
+    'lab_technician': 2,
+    'receptionist': 1,
+}
+
+# Roles that are not bound to the record's department
+DEPARTMENT_OVERRIDE_ROLES = ('admin', 'emergency_staff')
+
+
 class PolicyEvaluator:
     """
     Evaluates whether access should be granted
@@ -35,7 +49,7 @@ class PolicyEvaluator:
             user_dept = user_attrs.get('department')
             user_role = user_attrs.get('role')
 
-            if user_dept == required_dept or user_role in ['admin', 'emergency_staff']:
+            if user_dept == required_dept or user_role in DEPARTMENT_OVERRIDE_ROLES:
                 checks_passed.append(
                     f"✅ Department: {user_dept} matches {required_dept}"
                 )
@@ -71,16 +85,7 @@ class PolicyEvaluator:
         role = user_attrs.get('role')
         sensitivity = resource_attrs.get('sensitivity_level', 1)
 
-        role_min_clearance = {
-            'doctor': 3,
-            'nurse': 1,
-            'admin': 5,
-            'emergency_staff': 4,
-            'lab_technician': 2,
-            'receptionist': 1,
-        }
-
-        role_clearance = role_min_clearance.get(role, 1)
+        role_clearance = ROLE_MIN_CLEARANCE.get(role, 1)
         if sensitivity <= role_clearance or user_clearance >= sensitivity:
             checks_passed.append(f"✅ Role Access: {role} can access sensitivity {sensitivity}")
         else:
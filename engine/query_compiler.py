@@ -0,0 +1,63 @@
+from django.db.models import Q
+
+from .policy_evaluator import ROLE_MIN_CLEARANCE, DEPARTMENT_OVERRIDE_ROLES
+
+
+# Columns the policy reads, in the order PolicyEvaluator checks them
+ACCESS_CONTROL_FIELDS = (
+    'required_clearance_level',
+    'required_department',
+    'patient_consent',
+    'sensitivity_level',
+)
+
+
+def model_access_fields(model) -> tuple:
+    """
+    Access-control columns that exist on model. Models without a
+    column get the attribute resolver's default for it.
+    """
+    names = {f.name for f in model._meta.concrete_fields}
+    return tuple(name for name in ACCESS_CONTROL_FIELDS if name in names)
+
+
+def compile_access_filter(model, user_attrs: dict, env_attrs: dict) -> Q:
+    """
+    Translates the policy for one resolved user and environment into a
+    Q expression matching exactly the rows PolicyEvaluator would grant
+    """
+    fields = model_access_fields(model)
+    role = user_attrs.get('role')
+    user_clearance = user_attrs.get('clearance_level', 0)
+    overridden = (
+        env_attrs.get('is_emergency', False)
+        and user_attrs.get('is_emergency_authorized')
+    )
+
+    # ── Role-based access: sensitivity <= role minimum or <= clearance ──
+    access = Q(sensitivity_level__lte=max(
+        ROLE_MIN_CLEARANCE.get(role, 1), user_clearance
+    ))
+
+    # ── Patient consent ──
+    if 'patient_consent' in fields:
+        access &= Q(patient_consent=True)
+
+    # Emergency override waives clearance and department
+    if overridden:
+        return access
+
+    # ── Clearance level ──
+    access &= Q(required_clearance_level__lte=user_clearance)
+
+    # ── Department ──
+    if 'required_department' in fields and role not in DEPARTMENT_OVERRIDE_ROLES:
+        department_ok = (
+            Q(required_department__isnull=True) | Q(required_department='')
+        )
+        user_dept = user_attrs.get('department')
+        if user_dept:
+            department_ok |= Q(required_department=user_dept)
+        access &= department_ok
+
+    return access
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from authentication.models import User
+from .attribute_cache import user_attribute_cache
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_attributes(sender, instance, **kwargs):
+    user_attribute_cache.invalidate(instance.pk)
@@ -1,3 +1,817 @@
-from django.test import TestCase
+import json
+import os
+import random
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from itertools import product
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.core.management import call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from authentication.models import User
+from ehr.models import Patient, EHRRecord, MedicalReport, LabResult
+from emergency.models import EmergencyAccessToken
+from policies.store import PolicyStore
+from .attribute_resolver import AttributeResolver
+from .attribute_cache import user_attribute_cache
+from .policy_evaluator import PolicyEvaluator
+from .decision_table import CompiledPolicyEvaluator, is_granted
+from .bulk_evaluator import BulkPolicyEvaluator
+from .decision_cache import CachingPolicyEvaluator, DecisionCache
+from .decision_point import PolicyDecisionPoint
+from .middleware import ServerTimingMiddleware
+from .query_compiler import compile_access_filter
+from .benchmarks import compare_results
+from .management.commands.run_benchmarks import Command as BenchmarkCommand
+from .timing import phase, record_query
+
+
+ROLES = [r for r, _ in User.ROLE_CHOICES] + ['visitor', None]
+DEPARTMENTS = [d for d, _ in User.DEPARTMENT_CHOICES]
+LEVELS = [1, 2, 3, 4, 5]
+
+
+def strip_code(decision):
+    return {k: v for k, v in decision.items() if k != 'reason_code'}
+
+
+class CompiledPolicyEvaluatorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.standard = PolicyEvaluator()
+        self.compiled = CompiledPolicyEvaluator()
+
+    def test_matches_standard_evaluator_exhaustively(self):
+        for role, user_dept, clearance, authorized, is_emergency in product(
+            ROLES, DEPARTMENTS, LEVELS, [True, False], [True, False]
+        ):
+            user_attrs = {
+                'role': role,
+                'department': user_dept,
+                'clearance_level': clearance,
+                'is_emergency_authorized': authorized,
+            }
+            env_attrs = {'is_emergency': is_emergency}
+
+            for required_dept, required, sensitivity, consent in product(
+                DEPARTMENTS + [None, ''], LEVELS, LEVELS, [True, False]
+            ):
+                resource_attrs = {
+                    'required_department': required_dept,
+                    'required_clearance_level': required,
+                    'sensitivity_level': sensitivity,
+                    'patient_consent': consent,
+                }
+                expected = self.standard.evaluate(
+                    user_attrs, resource_attrs, env_attrs
+                )
+                actual = self.compiled.evaluate(
+                    user_attrs, resource_attrs, env_attrs
+                )
+                self.assertEqual(strip_code(actual), expected)
+                self.assertEqual(
+                    is_granted(actual['reason_code']),
+                    expected['access_granted']
+                )
+
+    def test_values_outside_table_match_standard_evaluator(self):
+        cases = [
+            ({}, {}, {}),
+            ({'role': 'doctor', 'clearance_level': 0}, {'sensitivity_level': 6}, {}),
+            ({'role': 'admin', 'clearance_level': 7}, {'required_clearance_level': 0}, {}),
+            ({'role': 'nurse', 'clearance_level': 2.5}, {'sensitivity_level': 3}, {}),
+        ]
+        for user_attrs, resource_attrs, env_attrs in cases:
+            self.assertEqual(
+                strip_code(self.compiled.evaluate(user_attrs, resource_attrs, env_attrs)),
+                self.standard.evaluate(user_attrs, resource_attrs, env_attrs)
+            )
+
+    def test_explain_false_skips_strings(self):
+        decision = self.compiled.evaluate(
+            {'role': 'nurse', 'clearance_level': 1},
+            {'sensitivity_level': 4},
+            {},
+            explain=False
+        )
+        self.assertFalse(decision['access_granted'])
+        self.assertNotIn('checks_failed', decision)
+
+
+class BulkPolicyEvaluatorTests(SimpleTestCase):
+
+    def test_access_matrix_matches_standard_evaluator(self):
+        users = [
+            {
+                'user_id': i,
+                'role': role,
+                'department': dept,
+                'clearance_level': clearance,
+                'is_emergency_authorized': authorized,
+            }
+            for i, (role, dept, clearance, authorized) in enumerate(product(
+                ROLES, DEPARTMENTS[:3], LEVELS, [True, False]
+            ))
+        ]
+        resources = [
+            {
+                'resource_id': i,
+                'required_department': dept,
+                'required_clearance_level': required,
+                'sensitivity_level': sensitivity,
+                'patient_consent': consent,
+            }
+            for i, (dept, required, sensitivity, consent) in enumerate(product(
+                DEPARTMENTS[:4] + [None, ''], LEVELS, LEVELS, [True, False]
+            ))
+        ]
+        bulk = BulkPolicyEvaluator()
+        user_columns = bulk.user_columns(users)
+        resource_columns = bulk.resource_columns(resources)
+        evaluator = PolicyEvaluator()
+
+        for is_emergency in (False, True):
+            matrix = bulk.access_matrix(
+                user_columns, resource_columns, is_emergency
+            )
+            env_attrs = {'is_emergency': is_emergency}
+            for u, user_attrs in enumerate(users):
+                expected = [
+                    evaluator.evaluate(
+                        user_attrs, resource_attrs, env_attrs
+                    )['access_granted']
+                    for resource_attrs in resources
+                ]
+                self.assertEqual(matrix[u].tolist(), expected)
+
+
+class BulkPolicyEvaluatorDatabaseTests(TestCase):
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                f'user{i}', role=role, department=dept, clearance_level=level
+            )
+            for i, (role, dept, level) in enumerate([
+                ('doctor', 'cardiology', 3),
+                ('nurse', 'icu', 1),
+                ('admin', 'general', 5),
+                ('lab_technician', 'laboratory', 2),
+            ])
+        ]
+        patient = Patient.objects.create(
+            patient_id='P-BULK', first_name='A', last_name='B',
+            date_of_birth=date(1980, 1, 1), blood_group='O+',
+            contact_number='000'
+        )
+        for i in range(30):
+            EHRRecord.objects.create(
+                patient=patient, diagnosis='-',
+                sensitivity_level=i % 5 + 1,
+                required_clearance_level=(i * 3) % 5 + 1,
+                required_department=['cardiology', None, 'icu'][i % 3],
+                patient_consent=i % 4 != 0,
+            )
+            LabResult.objects.create(
+                patient=patient, test_name='CBC', test_date=date(2024, 1, 1),
+                result_value='-', sensitivity_level=i % 5 + 1,
+                required_clearance_level=i % 3 + 1,
+            )
+
+    def test_loaded_columns_match_decision_point_attributes(self):
+        resolver = AttributeResolver()
+        evaluator = PolicyEvaluator()
+        bulk = BulkPolicyEvaluator()
+        env_attrs = resolver.resolve_environment_attributes()
+
+        for resource_type, model in (('ehr', EHRRecord), ('lab', LabResult)):
+            for user in self.users:
+                user_attrs = resolver.resolve_user_attributes(user)
+                expected = [
+                    record.id for record in model.objects.order_by('id')
+                    if evaluator.evaluate(
+                        user_attrs,
+                        resolver.resolve_resource_attributes(resource_type, record),
+                        env_attrs
+                    )['access_granted']
+                ]
+                self.assertEqual(
+                    sorted(bulk.accessible_resource_ids(user, resource_type)),
+                    expected
+                )
+
+
+class UserAttributeCacheTests(TestCase):
+
+    def setUp(self):
+        user_attribute_cache.clear()
+        self.resolver = AttributeResolver()
+        self.user = User.objects.create_user(
+            'cached', role='doctor', certifications='ACLS, BLS'
+        )
+
+    def test_repeat_lookups_hit_cache(self):
+        before = user_attribute_cache.stats()
+        first = self.resolver.resolve_user_attributes(self.user)
+        with user_attribute_cache.request_scope():
+            self.resolver.resolve_user_attributes(self.user)
+            second = self.resolver.resolve_user_attributes(self.user)
+        after = user_attribute_cache.stats()
+
+        self.assertEqual(first['certifications'], ['ACLS', 'BLS'])
+        self.assertEqual(
+            {k: v for k, v in first.items() if k != 'current_time'},
+            {k: v for k, v in second.items() if k != 'current_time'}
+        )
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertEqual(after['request_hits'] - before['request_hits'], 1)
+
+    def test_saving_user_invalidates_entry(self):
+        self.resolver.resolve_user_attributes(self.user)
+        self.user.clearance_level = 4
+        self.user.save()
+
+        attrs = self.resolver.resolve_user_attributes(self.user)
+        self.assertEqual(attrs['clearance_level'], 4)
+
+
+def random_attributes(rng):
+    """
+    One random (user, resource, environment) triple, including values
+    outside the usual domains
+    """
+    levels = LEVELS + [0, 6]
+    user_attrs = {
+        'role': rng.choice(ROLES),
+        'department': rng.choice(DEPARTMENTS + [None]),
+        'clearance_level': rng.choice(levels),
+        'is_emergency_authorized': rng.choice([True, False]),
+        'within_working_hours': rng.choice([True, False]),
+    }
+    resource_attrs = {
+        'resource_type': rng.choice(['ehr', 'report', 'lab']),
+        'sensitivity_level': rng.choice(levels),
+        'required_clearance_level': rng.choice(levels),
+        'required_department': rng.choice(DEPARTMENTS + [None, '']),
+        'patient_consent': rng.choice([True, False]),
+    }
+    env_attrs = {
+        'is_emergency': rng.choice([True, False]),
+        'current_shift': rng.choice(['morning', 'evening', 'night']),
+    }
+    return user_attrs, resource_attrs, env_attrs
+
+
+class CachingPolicyEvaluatorTests(SimpleTestCase):
+
+    def test_cache_never_changes_a_decision(self):
+        rng = random.Random(20240219)
+        reference = PolicyEvaluator()
+        for wrapped in (PolicyEvaluator(), CompiledPolicyEvaluator()):
+            # Small cache so that hits, misses and evictions all happen
+            cached = CachingPolicyEvaluator(wrapped, DecisionCache(max_size=64))
+            pool = [random_attributes(rng) for _ in range(200)]
+
+            for _ in range(5000):
+                user_attrs, resource_attrs, env_attrs = rng.choice(pool)
+                actual = cached.evaluate(user_attrs, resource_attrs, env_attrs)
+                self.assertEqual(
+                    strip_code(actual),
+                    reference.evaluate(user_attrs, resource_attrs, env_attrs)
+                )
+
+            stats = cached.cache.stats()
+            self.assertGreater(stats['hits'], 0)
+            self.assertGreater(stats['evictions'], 0)
+
+    def test_returned_lists_are_not_shared(self):
+        cached = CachingPolicyEvaluator(PolicyEvaluator(), DecisionCache())
+        attrs = ({'role': 'nurse', 'clearance_level': 1}, {'sensitivity_level': 5}, {})
+        cached.evaluate(*attrs)['reasons'].append('mutated')
+        self.assertNotIn('mutated', cached.evaluate(*attrs)['reasons'])
+
+    def test_policy_version_change_clears_cache(self):
+        evaluator = PolicyEvaluator()
+        cached = CachingPolicyEvaluator(evaluator, DecisionCache())
+        attrs = ({'role': 'doctor', 'clearance_level': 3}, {}, {})
+        cached.evaluate(*attrs)
+        evaluator.version = 2
+        cached.evaluate(*attrs)
+
+        stats = cached.cache.stats()
+        self.assertEqual(stats['hits'], 0)
+        self.assertEqual(stats['invalidations'], 1)
+        self.assertEqual(stats['policy_version'], 2)
+
+
+class PolicyDecisionPointTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            'batch', role='doctor', department='cardiology', clearance_level=3
+        )
+        patient = Patient.objects.create(
+            patient_id='P-DP', first_name='A', last_name='B',
+            date_of_birth=date(1980, 1, 1), blood_group='O+',
+            contact_number='000'
+        )
+        cls.records = [
+            EHRRecord.objects.create(
+                patient=patient, diagnosis='-', sensitivity_level=level,
+                required_clearance_level=level,
+            )
+            for level in LEVELS
+        ]
+        cls.labs = [
+            LabResult.objects.create(
+                patient=patient, test_name='CBC', test_date=date(2024, 1, 1),
+                result_value='-', sensitivity_level=level,
+            )
+            for level in LEVELS[:3]
+        ]
+
+    def decide(self, call):
+        """
+        Runs call(pdp) and returns (result, resolve_user_attributes
+        mock, log_many mock)
+        """
+        pdp = PolicyDecisionPoint()
+        with patch.object(
+            pdp.resolver, 'resolve_user_attributes',
+            wraps=pdp.resolver.resolve_user_attributes
+        ) as resolve, patch('engine.decision_point.get_audit_sink') as sink:
+            result = call(pdp)
+        return result, resolve, sink.return_value.log_many
+
+    def test_make_decisions(self):
+        decisions, resolve, log_many = self.decide(
+            lambda pdp: pdp.make_decisions(self.user, 'ehr', self.records)
+        )
+        self.assertEqual(len(decisions), len(self.records))
+        resolve.assert_called_once_with(self.user)
+        self.assertEqual(len({id(d['environment']) for d in decisions}), 1)
+        self.assertEqual(len({id(d['user']) for d in decisions}), 1)
+        log_many.assert_called_once()
+        entries = log_many.call_args.args[0]
+        self.assertEqual(
+            [entry.resource_id for entry in entries],
+            [str(record.id) for record in self.records]
+        )
+        self.assertEqual(
+            [entry.access_granted for entry in entries],
+            [d['access_granted'] for d in decisions]
+        )
+
+    def test_grouped_and_batch_decisions(self):
+        grouped, resolve, log_many = self.decide(
+            lambda pdp: pdp.make_grouped_decisions(
+                self.user, {'ehr': self.records, 'lab': self.labs}
+            )
+        )
+        self.assertEqual(
+            {name: len(decisions) for name, decisions in grouped.items()},
+            {'ehr': len(self.records), 'lab': len(self.labs)}
+        )
+        resolve.assert_called_once_with(self.user)
+        environments = {
+            id(d['environment']) for decisions in grouped.values() for d in decisions
+        }
+        self.assertEqual(len(environments), 1)
+        log_many.assert_called_once()
+        self.assertEqual(
+            len(log_many.call_args.args[0]), len(self.records) + len(self.labs)
+        )
+
+        # One environment per emergency state, still one user and audit batch
+        batches, resolve, log_many = self.decide(
+            lambda pdp: pdp.make_batch_decisions(self.user, [
+                ({'ehr': self.records}, False), ({'lab': self.labs}, True),
+            ])
+        )
+        resolve.assert_called_once_with(self.user)
+        self.assertFalse(batches[0]['ehr'][0]['environment']['is_emergency'])
+        self.assertTrue(batches[1]['lab'][0]['environment']['is_emergency'])
+        log_many.assert_called_once()
+        entries = log_many.call_args.args[0]
+        self.assertEqual(len(entries), len(self.records) + len(self.labs))
+        self.assertEqual(
+            [entry.is_emergency for entry in entries],
+            [False] * len(self.records) + [True] * len(self.labs)
+        )
+
+
+class QueryCompilerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        patient = Patient.objects.create(
+            patient_id='P-Q', first_name='A', last_name='B',
+            date_of_birth=date(1980, 1, 1), blood_group='O+',
+            contact_number='000'
+        )
+        depts = ['cardiology', 'icu', None, '']
+        EHRRecord.objects.bulk_create(
+            EHRRecord(
+                patient=patient, diagnosis='-', required_department=dept,
+                required_clearance_level=required, sensitivity_level=sensitivity,
+                patient_consent=consent,
+            )
+            for dept, required, sensitivity, consent
+            in product(depts, LEVELS, LEVELS, [True, False])
+        )
+        MedicalReport.objects.bulk_create(
+            MedicalReport(
+                patient=patient, report_type='mri', title='-', description='-',
+                required_clearance_level=required, sensitivity_level=sensitivity,
+            )
+            for required, sensitivity in product(LEVELS, LEVELS)
+        )
+
+    def test_filter_matches_python_evaluator(self):
+        resolver = AttributeResolver()
+        evaluator = PolicyEvaluator()
+        models = (('ehr', EHRRecord), ('report', MedicalReport))
+
+        for role, dept, clearance, authorized, is_emergency in product(
+            ROLES[:6], ['cardiology', 'neurology'], LEVELS,
+            [True, False], [True, False]
+        ):
+            user_attrs = {
+                'role': role,
+                'department': dept,
+                'clearance_level': clearance,
+                'is_emergency_authorized': authorized,
+            }
+            env_attrs = {'is_emergency': is_emergency}
+            for resource_type, model in models:
+                records = model.objects.all()
+                expected = {
+                    record.id for record in records
+                    if evaluator.evaluate(
+                        user_attrs,
+                        resolver.resolve_resource_attributes(resource_type, record),
+                        env_attrs
+                    )['access_granted']
+                }
+                access = compile_access_filter(model, user_attrs, env_attrs)
+                self.assertEqual(
+                    set(records.filter(access).values_list('id', flat=True)),
+                    expected
+                )
+                self.assertEqual(
+                    set(records.exclude(access).values_list('id', flat=True)),
+                    {record.id for record in records} - expected
+                )
+
+
+@override_settings(AUDIT_SINK='direct')
+class BenchmarkCommandTests(TestCase):
+    """
+    Runs the data generator and benchmark runner at toy scale
+    """
+
+    def test_generate_and_benchmark(self):
+        call_command(
+            'generate_data', users=20, patients=10, ehr_records=50,
+            reports=20, lab_results=30, chunk_size=7, stdout=StringIO()
+        )
+        self.assertEqual(Patient.objects.count(), 10)
+        self.assertEqual(EHRRecord.objects.count(), 50)
+        self.assertEqual(MedicalReport.objects.count(), 20)
+        self.assertEqual(LabResult.objects.count(), 30)
+        if not User.objects.filter(role='doctor', is_emergency_authorized=True).exists():
+            User.objects.filter(role='doctor').update(is_emergency_authorized=True)
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'run_benchmarks', iterations=5, warmup=1, output=output,
+                stdout=StringIO()
+            )
+            with open(output) as f:
+                results = json.load(f)['results']
+            self.assertEqual(set(results), {
+                'policy.evaluate', 'pdp.make_decision',
+                'serialize.ehr.drf', 'serialize.ehr.fast', 'view.ehr',
+                'view.reports', 'view.lab', 'view.chart',
+                'eat.generate', 'eat.validate',
+            })
+            self.assertEqual(results['policy.evaluate']['queries_per_call'], 0)
+
+            stdout = StringIO()
+            call_command(
+                'run_benchmarks', iterations=5, warmup=1, baseline=output,
+                cases=['policy.'], stdout=stdout
+            )
+            self.assertIn('Compared with', stdout.getvalue())
+
+    def test_policy_cases_use_record_attributes(self):
+        call_command(
+            'generate_data', users=20, patients=2, ehr_records=60,
+            reports=0, lab_results=0, stdout=StringIO()
+        )
+        user = User.objects.filter(role='doctor').first()
+        patient = Patient.objects.filter(ehr_records__isnull=False).first()
+        evaluate = dict(BenchmarkCommand().build_cases(user, patient))['policy.evaluate']
+
+        seen = []
+        original = PolicyEvaluator.evaluate
+
+        def capture(evaluator, user_attrs, resource_attrs, env_attrs):
+            seen.append(resource_attrs)
+            return original(evaluator, user_attrs, resource_attrs, env_attrs)
+
+        with patch.object(PolicyEvaluator, 'evaluate', capture):
+            for i in range(EHRRecord.objects.filter(patient=patient).count()):
+                evaluate(i)
+        self.assertEqual({attrs['resource_type'] for attrs in seen}, {'ehr'})
+        self.assertGreater(len({attrs['sensitivity_level'] for attrs in seen}), 1)
+        self.assertGreater(
+            len({attrs['required_clearance_level'] for attrs in seen}), 1
+        )
+
+    def test_compare_results(self):
+        baseline = {'a': {'ops_per_sec': 100, 'p95_ms': 1.0, 'max_queries_per_call': 2}}
+        rows = compare_results(
+            {'a': {'ops_per_sec': 80, 'p95_ms': 1.0, 'max_queries_per_call': 2}},
+            baseline
+        )
+        self.assertTrue(rows[0]['regressed'])
+        rows = compare_results(
+            {'a': {'ops_per_sec': 99, 'p95_ms': 1.05, 'max_queries_per_call': 2}},
+            baseline
+        )
+        self.assertFalse(rows[0]['regressed'])
+        rows = compare_results(
+            {'a': {'ops_per_sec': 150, 'p95_ms': 0.5, 'max_queries_per_call': 3}},
+            baseline
+        )
+        self.assertTrue(rows[0]['regressed'])
+
+
+
+@override_settings(AUDIT_SINK='buffered')
+class LoadTestCommandTests(TransactionTestCase):
+    """
+    Drives both server types from several threads and tasks, so the
+    data has to be committed. The audit rows are written by the
+    buffered sink's thread, as in a load test of a production setup.
+    """
+
+    def test_wsgi_and_asgi_cases(self):
+        call_command(
+            'generate_data', users=10, patients=3, ehr_records=12,
+            reports=6, lab_results=6, stdout=StringIO()
+        )
+        User.objects.filter(role='doctor').update(is_emergency_authorized=True)
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'load.json')
+            call_command(
+                'load_test', concurrency=2, requests=6, paths=['ehr', 'lab'],
+                output=output, stdout=StringIO()
+            )
+            with open(output) as f:
+                results = json.load(f)['results']
+        self.assertEqual(set(results), {'wsgi.ehr', 'asgi.ehr', 'wsgi.lab', 'asgi.lab'})
+        for result in results.values():
+            self.assertEqual(result['requests'], 6)
+            self.assertEqual(result['errors'], 0)
+
+@override_settings(AUDIT_SINK='direct')
+class ServerTimingMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='timed', password='x', role='doctor', clearance_level=3
+        )
+        patient = Patient.objects.create(
+            patient_id='P-T', first_name='A', last_name='B',
+            date_of_birth=date(1980, 1, 1), blood_group='O+',
+            contact_number='000'
+        )
+        EHRRecord.objects.bulk_create(
+            EHRRecord(patient=patient, diagnosis='-', sensitivity_level=level)
+            for level in LEVELS
+        )
+
+    def get(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client.get('/api/ehr/patients/P-T/ehr/')
+
+    @override_settings(SERVER_TIMING_ENABLED=True, SERVER_TIMING_SAMPLE_RATE=1.0)
+    def test_header_reports_phases_and_queries(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        metrics = {
+            metric.split(';')[0]: metric
+            for metric in response['Server-Timing'].split(', ')
+        }
+        for name in ('resolve', 'evaluate', 'load', 'audit', 'serialize', 'db', 'total'):
+            self.assertIn(name, metrics)
+        self.assertIn(f'"{len(LEVELS)} calls', metrics['evaluate'])
+        self.assertNotIn('"0 queries"', metrics['db'])
+        # Only the timed request paid for the hook
+        self.assertNotIn(record_query, connection.execute_wrappers)
+
+    @override_settings(SERVER_TIMING_ENABLED=True, SERVER_TIMING_SAMPLE_RATE=0.0)
+    def test_unsampled_request_has_no_header(self):
+        self.assertFalse(self.get().has_header('Server-Timing'))
+
+    @override_settings(SERVER_TIMING_ENABLED=False)
+    def test_disabled(self):
+        self.assertFalse(self.get().has_header('Server-Timing'))
+        self.assertIs(phase('evaluate'), phase('resolve'))
+
+    @override_settings(SERVER_TIMING_ENABLED=True, SERVER_TIMING_SAMPLE_RATE=1.0)
+    async def test_async_views_stay_async(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        async def view(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(ServerTimingMiddleware(view)))
+        response = await AsyncClient().get(
+            '/api/async/ehr/patients/P-T/ehr/',
+            headers={'Authorization': f'Bearer {AccessToken.for_user(self.user)}'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('"0 queries"', response['Server-Timing'])
+        self.assertNotIn(record_query, connection.execute_wrappers)
+
+    def test_off_by_default(self):
+        self.assertFalse(self.get().has_header('Server-Timing'))
+
+    @override_settings(SERVER_TIMING_ENABLED=True, SERVER_TIMING_LOG=True)
+    def test_log_line(self):
+        with self.assertLogs('engine.timing', 'INFO') as logs:
+            self.get()
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+        self.assertIn('evaluate', record['phases'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite syntax')
+@override_settings(AUDIT_SINK='direct')
+class QueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN QUERY PLAN on every SELECT the hot paths issue against
+    seeded data. No table statistics are collected, so SQLite plans as
+    for large tables. A query fails when it reads a whole table (a SCAN
+    that is not an ordered walk of an index) or sorts in a temp B-tree.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'generate_data', users=20, patients=10, ehr_records=200,
+            reports=50, lab_results=50, stdout=StringIO()
+        )
+        cls.user = User.objects.create_user(
+            username='planner', password='x', role='doctor',
+            department='cardiology', clearance_level=3,
+            is_emergency_authorized=True
+        )
+        cls.patient_ids = list(
+            Patient.objects.order_by('id').values_list('patient_id', flat=True)[:3]
+        )
+        now = timezone.now()
+        EmergencyAccessToken.objects.bulk_create(
+            EmergencyAccessToken(
+                requested_by=cls.user, patient_id=patient_id, reason='-',
+                status=token_status, expires_at=now + timedelta(minutes=minutes)
+            )
+            for patient_id in cls.patient_ids
+            for token_status, minutes in (('active', 10), ('active', -5), ('revoked', 10))
+        )
+        cls.token = EmergencyAccessToken.objects.filter(
+            requested_by=cls.user, patient_id=cls.patient_ids[0],
+            status='active', expires_at__gt=now
+        ).first()
+        call_command('load_default_policy', '--activate', stdout=StringIO())
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def plan(self, sql: str) -> list:
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertIndexed(self, captured):
+        selects = {
+            query['sql'] for query in captured.captured_queries
+            if query['sql'].startswith('SELECT')
+        }
+        self.assertTrue(selects)
+        for sql in selects:
+            for step in self.plan(sql):
+                full_scan = step.startswith('SCAN ') and ' INDEX ' not in step
+                self.assertFalse(
+                    full_scan or 'TEMP B-TREE' in step,
+                    f'{step}\n  in {sql}'
+                )
+
+    def test_record_views(self):
+        patient_id = self.patient_ids[0]
+        token_id = self.token.token_id
+        for path in ('ehr', 'reports', 'lab', 'chart', 'access'):
+            for params in ('', f'?token_id={token_id}', '?ordering=-id&count=true&limit=5'):
+                with self.subTest(path=path, params=params):
+                    with CaptureQueriesContext(connection) as captured:
+                        response = self.client.get(
+                            f'/api/ehr/patients/{patient_id}/{path}/{params}'
+                        )
+                    self.assertEqual(response.status_code, 200)
+                    self.assertIndexed(captured)
+
+    def test_record_page_cursor(self):
+        url = f'/api/ehr/patients/{self.patient_ids[0]}/ehr/?limit=2'
+        cursor = self.client.get(url).data['page']['next_cursor']
+        for ordering in ('id', '-id'):
+            with CaptureQueriesContext(connection) as captured:
+                self.client.get(f'{url}&cursor={cursor}&ordering={ordering}')
+            self.assertIndexed(captured)
+
+    def test_patient_batch(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post('/api/ehr/patients/batch/', {
+                'patient_ids': self.patient_ids,
+                'token_ids': {self.patient_ids[0]: str(self.token.token_id)},
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIndexed(captured)
+
+    def test_emergency_tokens(self):
+        requests = [
+            # Existing active token, then a new one
+            ('post', '/api/emergency/request/', {
+                'patient_id': self.patient_ids[0], 'reason': 'Cardiac arrest'
+            }, 201),
+            ('post', '/api/emergency/request/', {
+                'patient_id': 'P-NEW', 'reason': 'Cardiac arrest'
+            }, 201),
+            ('post', '/api/emergency/validate/', {
+                'token_id': str(self.token.token_id)
+            }, 200),
+            ('get', '/api/emergency/my-tokens/', None, 200),
+        ]
+        for method, url, data, expected in requests:
+            with self.subTest(url=url, data=data):
+                with CaptureQueriesContext(connection) as captured:
+                    response = getattr(self.client, method)(url, data, format='json')
+                self.assertEqual(response.status_code, expected)
+                self.assertIndexed(captured)
+
+    def test_lapsed_active_tokens(self):
+        with CaptureQueriesContext(connection) as captured:
+            list(EmergencyAccessToken.objects.filter(
+                status='active', expires_at__lte=timezone.now()
+            ).order_by().values_list('id', flat=True))
+        self.assertIndexed(captured)
+
+    def test_record_search(self):
+        # Patient search is left out: it sorts its capped candidates by rank
+        Patient.objects.filter(patient_id=self.patient_ids[0]).update(
+            assigned_doctor=self.user
+        )
+        for url in (
+            f'/api/ehr/search/?q=synthetic&patient_id={self.patient_ids[0]}',
+            '/api/ehr/search/?q=synthetic&scope=caseload',
+        ):
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as captured:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIndexed(captured)
+
+    def test_audit_log(self):
+        self.client.get(f'/api/ehr/patients/{self.patient_ids[0]}/ehr/')
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/audit/logs/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(captured), 1)
+        self.assertIndexed(captured)
+
+    def test_policy_store_poll(self):
+        store = PolicyStore(reload_interval=0)
+        with CaptureQueriesContext(connection) as captured:
+            store.refresh()
+            store.refresh()
+        self.assertIsNotNone(store.compiled)
+        self.assertIndexed(captured)
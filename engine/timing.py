@@ -0,0 +1,162 @@
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter
+
+
+# Timings of the request being handled; None when it is not sampled
+_current = ContextVar('request_timings', default=None)
+
+_NULL_PHASE = nullcontext()
+
+
+class Phase:
+    """
+    Reusable context manager adding its duration, and the SQL queries
+    issued meanwhile, to one named phase
+    """
+
+    __slots__ = ('timings', 'name', '_started', '_queries')
+
+    def __init__(self, timings, name: str):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self._queries = self.timings.query_count
+        self._started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timings.add(
+            self.name,
+            perf_counter() - self._started,
+            self.timings.query_count - self._queries
+        )
+        return False
+
+
+class RequestTimings:
+    """
+    Per-phase durations and SQL statistics of one request.
+    Phases may overlap (e.g. 'audit' runs inside 'eat'), so they are
+    not expected to add up to the total.
+    """
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.phases = {}
+        self.query_count = 0
+        self.query_time = 0.0
+
+    def phase(self, name: str) -> Phase:
+        return Phase(self, name)
+
+    def add(self, name: str, duration: float, queries: int = 0):
+        entry = self.phases.get(name)
+        if entry is None:
+            self.phases[name] = [duration, 1, queries]
+        else:
+            entry[0] += duration
+            entry[1] += 1
+            entry[2] += queries
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """
+        Hook for connection.execute_wrapper()
+        """
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_time += perf_counter() - started
+            self.query_count += 1
+
+    def elapsed(self) -> float:
+        return perf_counter() - self.started
+
+    def server_timing(self, total: float) -> str:
+        """
+        Value of the Server-Timing response header
+        """
+        metrics = [
+            f'{name};dur={duration * 1000:.3f};desc="{calls} calls, {queries} queries"'
+            for name, (duration, calls, queries) in self.phases.items()
+        ]
+        metrics.append(
+            f'db;dur={self.query_time * 1000:.3f};desc="{self.query_count} queries"'
+        )
+        metrics.append(f'total;dur={total * 1000:.3f}')
+        return ', '.join(metrics)
+
+    def as_dict(self, total: float) -> dict:
+        return {
+            'total_ms': round(total * 1000, 3),
+            'db_ms': round(self.query_time * 1000, 3),
+            'queries': self.query_count,
+            'phases': {
+                name: {
+                    'ms': round(duration * 1000, 3),
+                    'calls': calls,
+                    'queries': queries,
+                }
+                for name, (duration, calls, queries) in self.phases.items()
+            },
+        }
+
+
+@contextmanager
+def collect_timings():
+    """
+    Enables the timers for the enclosed code and yields the
+    RequestTimings they record into
+    """
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Connection execute wrapper adding each query to the timings of the
+    request that issued it, if that request is being timed
+    """
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings.execute_wrapper(execute, sql, params, many, context)
+
+
+def current_timings():
+    return _current.get()
+
+
+def phase(name: str):
+    """
+    Context manager timing a block as phase name. Returns a shared no-op
+    context manager when the request is not being timed, so it can be
+    created once outside a loop and entered on every iteration.
+    """
+    timings = _current.get()
+    if timings is None:
+        return _NULL_PHASE
+    return Phase(timings, name)
+
+
+def timed(name: str):
+    """
+    Decorator timing every call of a function as phase name
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            timings = _current.get()
+            if timings is None:
+                return func(*args, **kwargs)
+            with Phase(timings, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
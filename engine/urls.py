@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import EngineCacheStatsView
+
+urlpatterns = [
+    path('cache/', EngineCacheStatsView.as_view(), name='engine_cache_stats'),
+]
@@ -1,3 +1,25 @@
-from django.shortcuts import render
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
 
-# Create your views here.
+from .attribute_cache import user_attribute_cache
+from .decision_cache import decision_cache
+from policies.store import policy_store
+from emergency.signed_tokens import revocation_list
+from emergency.token_cache import token_cache
+
+
+class EngineCacheStatsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        """
+        Hit/miss counters for the engine caches
+        """
+        return Response({
+            'user_attributes': user_attribute_cache.stats(),
+            'decisions': decision_cache.stats(),
+            'policy_store': policy_store.stats(),
+            'emergency_tokens': token_cache.stats(),
+            'revoked_tokens': revocation_list.stats(),
+        })
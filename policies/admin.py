@@ -1,3 +1,41 @@
 from django.contrib import admin
+from .models import PolicySet, PolicyRule, PolicyCondition
 
-# Register your models here.
+
+class PolicyRuleInline(admin.TabularInline):
+    model = PolicyRule
+    extra = 0
+    fields = ['order', 'name', 'effect', 'description']
+
+
+class PolicyConditionInline(admin.TabularInline):
+    model = PolicyCondition
+    extra = 0
+
+
+@admin.register(PolicySet)
+class PolicySetAdmin(admin.ModelAdmin):
+    list_display = [
+        'name', 'combining_algorithm', 'is_active',
+        'version', 'activated_at', 'created_at'
+    ]
+    list_filter = ['is_active', 'combining_algorithm']
+    readonly_fields = ['is_active', 'version', 'activated_at']
+    inlines = [PolicyRuleInline]
+    actions = ['activate_policy_set']
+
+    @admin.action(description="Activate selected policy set")
+    def activate_policy_set(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, "Select exactly one policy set to activate")
+            return
+        policy_set = queryset.get()
+        policy_set.activate()
+        self.message_user(request, f"Activated {policy_set}")
+
+
+@admin.register(PolicyRule)
+class PolicyRuleAdmin(admin.ModelAdmin):
+    list_display = ['policy_set', 'order', 'name', 'effect']
+    list_filter = ['policy_set', 'effect']
+    inlines = [PolicyConditionInline]
@@ -0,0 +1,199 @@
+from engine.decision_cache import FINGERPRINT_ATTRIBUTES
+
+
+SOURCES = {
+    'user': 0,
+    'resource': 1,
+    'environment': 2,
+    'env': 2,
+}
+SOURCE_NAMES = ('user', 'resource', 'environment')
+
+# Python operator each condition operator compiles to
+OPERATORS = {
+    'eq': '==',
+    'ne': '!=',
+    'lt': '<',
+    'lte': '<=',
+    'gt': '>',
+    'gte': '>=',
+    'in': 'in',
+    'not_in': 'not in',
+}
+UNARY_OPERATORS = {
+    'truthy': 'bool({})',
+    'falsy': 'not {}',
+}
+
+
+class PolicyCompileError(ValueError):
+    pass
+
+
+def _attribute_path(path: str) -> tuple:
+    source, _, key = path.partition('.')
+    if source not in SOURCES or not key:
+        raise PolicyCompileError(f"Unknown attribute '{path}'")
+    return SOURCES[source], key
+
+
+def generate_matcher(rules: list, first_only: bool):
+    """
+    Generates one Python function that returns the indexes of the rules
+    whose conditions all hold. Each attribute is read once into a local
+    and every condition becomes an inline comparison, so evaluation
+    costs about the same as a hand-written if/else chain.
+    """
+    namespace = {}
+    variables = {}
+    body = []
+
+    def variable(path):
+        if path not in variables:
+            index, key = _attribute_path(path)
+            variables[path] = f"a{len(variables)}"
+            body.insert(
+                len(variables) - 1,
+                f"    {variables[path]} = attrs[{index}].get({key!r})"
+            )
+        return variables[path]
+
+    for index, rule in enumerate(rules):
+        clauses = []
+        for condition in rule.get('conditions', []):
+            left = variable(condition['attribute'])
+            op = condition['operator']
+            if op in UNARY_OPERATORS:
+                clauses.append(UNARY_OPERATORS[op].format(left))
+                continue
+            if op not in OPERATORS:
+                raise PolicyCompileError(f"Unknown operator '{op}'")
+
+            if condition.get('value_attribute'):
+                right = variable(condition['value_attribute'])
+            else:
+                value = condition.get('value')
+                if op in ('in', 'not_in'):
+                    try:
+                        value = frozenset(value)
+                    except TypeError:
+                        value = tuple(value)
+                right = f"c{len(namespace)}"
+                namespace[right] = value
+            clauses.append(f"({left} {OPERATORS[op]} {right})")
+
+        test = ' and '.join(clauses) or 'True'
+        apply = [
+            f"        matched.append({index})",
+            *(["        return matched"] if first_only else []),
+        ]
+        body += [
+            "    try:",
+            f"        if {test}:",
+            *(f"    {line}" for line in apply),
+            "    except TypeError:",
+        ]
+        if rule['effect'] == 'deny':
+            # Incomparable values (e.g. a missing attribute) make the rule
+            # indeterminate: a deny rule then applies, so it fails closed
+            body += apply
+        else:
+            body.append("        pass")
+
+    source = '\n'.join(
+        ["def match(attrs):"]
+        + body[:len(variables)]
+        + ["    matched = []"]
+        + body[len(variables):]
+        + ["    return matched"]
+    )
+    exec(compile(source, '<policy rule set>', 'exec'), namespace)
+    return namespace['match'], source
+
+
+class CompiledRuleSet:
+    """
+    In-memory form of a PolicySet: a generated matcher function plus,
+    per rule, (is_deny, passed_text, failed_text, reason).
+    """
+
+    def __init__(self, spec: dict):
+        self.name = spec.get('name')
+        self.version = spec.get('version')
+        self.combining_algorithm = spec.get('combining_algorithm', 'deny_overrides')
+        if self.combining_algorithm not in (
+            'deny_overrides', 'permit_overrides', 'first_applicable'
+        ):
+            raise PolicyCompileError(
+                f"Unknown combining algorithm '{self.combining_algorithm}'"
+            )
+
+        # Every (source index, attribute) the rules read
+        self.attributes = {
+            _attribute_path(condition[field])
+            for rule in spec['rules']
+            for condition in rule.get('conditions', [])
+            for field in ('attribute', 'value_attribute')
+            if condition.get(field)
+        }
+
+        # Attributes the decision cache must add to its key for this set
+        self.fingerprint_extra = tuple(sorted(
+            (index, key) for index, key in self.attributes
+            if f"{SOURCE_NAMES[index]}.{key}" not in FINGERPRINT_ATTRIBUTES
+        ))
+
+        self.rules = []
+        for rule in spec['rules']:
+            if rule['effect'] not in ('permit', 'deny'):
+                raise PolicyCompileError(f"Unknown effect '{rule['effect']}'")
+            self.rules.append((
+                rule['effect'] == 'deny',
+                f"✅ {rule['name']}",
+                f"❌ {rule['name']}",
+                rule.get('description') or rule['name'],
+            ))
+
+        self.match, self.source = generate_matcher(
+            spec['rules'],
+            first_only=self.combining_algorithm == 'first_applicable'
+        )
+
+    def evaluate(
+        self,
+        user_attrs: dict,
+        resource_attrs: dict,
+        env_attrs: dict
+    ) -> dict:
+
+        checks_passed = []
+        checks_failed = []
+        reasons = []
+
+        for index in self.match((user_attrs, resource_attrs, env_attrs)):
+            is_deny, passed_text, failed_text, reason = self.rules[index]
+            if is_deny:
+                if failed_text not in checks_failed:
+                    checks_failed.append(failed_text)
+                    reasons.append(reason)
+            elif passed_text not in checks_passed:
+                checks_passed.append(passed_text)
+
+        if self.combining_algorithm == 'permit_overrides':
+            access_granted = bool(checks_passed)
+            if access_granted:
+                checks_failed, reasons = [], []
+        else:
+            access_granted = bool(checks_passed) and not checks_failed
+
+        if not checks_passed and not checks_failed:
+            checks_failed.append("❌ No applicable policy rule")
+            reasons.append("No policy rule permits this access")
+
+        return {
+            'access_granted': access_granted,
+            'checks_passed': checks_passed,
+            'checks_failed': checks_failed,
+            'reasons': reasons,
+            'is_emergency': env_attrs.get('is_emergency', False),
+        }
@@ -0,0 +1,107 @@
+from engine.policy_evaluator import ROLE_MIN_CLEARANCE, DEPARTMENT_OVERRIDE_ROLES
+
+
+def _not_overridden():
+    """
+    The emergency override needs both flags, so "not overridden" is two
+    alternatives; each deny rule below is emitted once per alternative
+    """
+    return [
+        [{'attribute': 'environment.is_emergency', 'operator': 'falsy'}],
+        [{'attribute': 'user.is_emergency_authorized', 'operator': 'falsy'}],
+    ]
+
+
+def builtin_rule_set() -> dict:
+    """
+    The hard-coded PolicyEvaluator rules expressed as a deny-overrides
+    rule set. Used to seed the policy store and as the benchmark's
+    realistic rule set.
+    """
+    rules = []
+
+    for alternative in _not_overridden():
+        rules.append({
+            'name': 'Clearance Level',
+            'description': 'Insufficient clearance level',
+            'effect': 'deny',
+            'conditions': [{
+                'attribute': 'user.clearance_level',
+                'operator': 'lt',
+                'value_attribute': 'resource.required_clearance_level',
+            }] + alternative,
+        })
+
+    for alternative in _not_overridden():
+        rules.append({
+            'name': 'Department',
+            'description': 'Wrong department for this record',
+            'effect': 'deny',
+            'conditions': [
+                {'attribute': 'resource.required_department', 'operator': 'truthy'},
+                {
+                    'attribute': 'user.department',
+                    'operator': 'ne',
+                    'value_attribute': 'resource.required_department',
+                },
+                {
+                    'attribute': 'user.role',
+                    'operator': 'not_in',
+                    'value': list(DEPARTMENT_OVERRIDE_ROLES),
+                },
+            ] + alternative,
+        })
+
+    rules.append({
+        'name': 'Patient Consent',
+        'description': 'Patient has not given consent',
+        'effect': 'deny',
+        'conditions': [
+            {'attribute': 'resource.patient_consent', 'operator': 'falsy'},
+        ],
+    })
+
+    # Role access: one rule per role minimum, plus one for any other role
+    role_scopes = [
+        {'operator': 'eq', 'value': role, 'minimum': minimum}
+        for role, minimum in ROLE_MIN_CLEARANCE.items()
+    ] + [
+        {'operator': 'not_in', 'value': list(ROLE_MIN_CLEARANCE), 'minimum': 1},
+    ]
+    for scope in role_scopes:
+        rules.append({
+            'name': 'Role Access',
+            'description': 'Role insufficient for sensitivity level',
+            'effect': 'deny',
+            'conditions': [
+                {
+                    'attribute': 'user.role',
+                    'operator': scope['operator'],
+                    'value': scope['value'],
+                },
+                {
+                    'attribute': 'resource.sensitivity_level',
+                    'operator': 'gt',
+                    'value': scope['minimum'],
+                },
+                {
+                    'attribute': 'user.clearance_level',
+                    'operator': 'lt',
+                    'value_attribute': 'resource.sensitivity_level',
+                },
+            ],
+        })
+
+    rules.append({
+        'name': 'Default Permit',
+        'description': '',
+        'effect': 'permit',
+        'conditions': [],
+    })
+
+    return {
+        'name': 'Built-in ABAC policy',
+        'version': None,
+        'combining_algorithm': 'deny_overrides',
+        'rules': rules,
+    }
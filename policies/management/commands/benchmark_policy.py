@@ -0,0 +1,84 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from authentication.models import User
+from engine.policy_evaluator import PolicyEvaluator
+from engine.decision_table import CompiledPolicyEvaluator
+from policies.compiler import CompiledRuleSet
+from policies.defaults import builtin_rule_set
+from policies.models import PolicySet
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares evaluation throughput of a stored rule set with the "
+        "hard-coded evaluators"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200000)
+        parser.add_argument(
+            '--policy-set', type=int,
+            help="PolicySet id to benchmark (default: built-in rule set)"
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        roles = [r for r, _ in User.ROLE_CHOICES]
+        departments = [d for d, _ in User.DEPARTMENT_CHOICES]
+        cases = [
+            (
+                {
+                    'role': rng.choice(roles),
+                    'department': rng.choice(departments),
+                    'clearance_level': rng.randint(1, 5),
+                    'is_emergency_authorized': rng.random() < 0.2,
+                },
+                {
+                    'sensitivity_level': rng.randint(1, 5),
+                    'required_clearance_level': rng.randint(1, 5),
+                    'required_department': rng.choice(departments + [None] * 4),
+                    'patient_consent': rng.random() < 0.9,
+                },
+                {'is_emergency': rng.random() < 0.05},
+            )
+            for _ in range(1000)
+        ]
+
+        if options['policy_set']:
+            spec = PolicySet.objects.get(pk=options['policy_set']).to_spec()
+        else:
+            spec = builtin_rule_set()
+        rule_set = CompiledRuleSet(spec)
+
+        evaluators = [
+            ('hard-coded PolicyEvaluator', PolicyEvaluator()),
+            ('compiled decision table', CompiledPolicyEvaluator()),
+            (f"rule set '{rule_set.name}' ({len(rule_set.rules)} rules)", rule_set),
+        ]
+
+        iterations = options['iterations']
+        baseline = None
+        for label, evaluator in evaluators:
+            started = time.perf_counter()
+            for i in range(iterations):
+                evaluator.evaluate(*cases[i % len(cases)])
+            elapsed = time.perf_counter() - started
+            rate = iterations / elapsed
+            baseline = baseline or rate
+            self.stdout.write(
+                f"{label:<50} {rate:>12,.0f} ops/sec "
+                f"{elapsed / iterations * 1e6:>7.2f} us/op "
+                f"x{rate / baseline:.2f}"
+            )
+
+        reference = PolicyEvaluator()
+        mismatches = sum(
+            rule_set.evaluate(*case)['access_granted']
+            != reference.evaluate(*case)['access_granted']
+            for case in cases
+        )
+        self.stdout.write(f"Decisions differing from PolicyEvaluator: {mismatches}")
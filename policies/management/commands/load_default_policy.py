@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from policies.defaults import builtin_rule_set
+from policies.models import PolicySet, PolicyRule, PolicyCondition
+
+
+class Command(BaseCommand):
+    help = "Stores the built-in access rules as a PolicySet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--activate', action='store_true',
+            help="Activate the new policy set immediately"
+        )
+
+    def handle(self, *args, **options):
+        spec = builtin_rule_set()
+
+        with transaction.atomic():
+            policy_set = PolicySet.objects.create(
+                name=spec['name'],
+                combining_algorithm=spec['combining_algorithm'],
+            )
+            for order, rule_spec in enumerate(spec['rules']):
+                rule = PolicyRule.objects.create(
+                    policy_set=policy_set,
+                    name=rule_spec['name'],
+                    description=rule_spec['description'],
+                    effect=rule_spec['effect'],
+                    order=order,
+                )
+                PolicyCondition.objects.bulk_create(
+                    PolicyCondition(
+                        rule=rule,
+                        attribute=condition['attribute'],
+                        operator=condition['operator'],
+                        value=condition.get('value'),
+                        value_attribute=condition.get('value_attribute', ''),
+                    )
+                    for condition in rule_spec['conditions']
+                )
+
+        if options['activate']:
+            policy_set.activate()
+
+        self.stdout.write(
+            f"Created {policy_set} with {len(spec['rules'])} rules"
+        )
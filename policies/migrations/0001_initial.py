@@ -0,0 +1,63 @@
+# Generated by Django 6.0.2 on 2026-10-18 11:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PolicyRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('description', models.CharField(blank=True, help_text='Reason reported when this rule denies access', max_length=200)),
+                ('effect', models.CharField(choices=[('permit', 'Permit'), ('deny', 'Deny')], max_length=10)),
+                ('order', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['order', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PolicyCondition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attribute', models.CharField(max_length=100)),
+                ('operator', models.CharField(choices=[('eq', 'Equals'), ('ne', 'Not Equals'), ('lt', 'Less Than'), ('lte', 'Less Than or Equal'), ('gt', 'Greater Than'), ('gte', 'Greater Than or Equal'), ('in', 'In'), ('not_in', 'Not In'), ('truthy', 'Is Set / True'), ('falsy', 'Is Empty / False')], max_length=10)),
+                ('value', models.JSONField(blank=True, null=True)),
+                ('value_attribute', models.CharField(blank=True, max_length=100)),
+                ('rule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conditions', to='policies.policyrule')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PolicySet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('combining_algorithm', models.CharField(choices=[('deny_overrides', 'Deny Overrides'), ('permit_overrides', 'Permit Overrides'), ('first_applicable', 'First Applicable')], default='deny_overrides', max_length=20)),
+                ('is_active', models.BooleanField(db_index=True, default=False)),
+                ('version', models.PositiveIntegerField(blank=True, db_index=True, help_text='Assigned on activation; workers reload when it changes', null=True)),
+                ('activated_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='policy_sets', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='policyrule',
+            name='policy_set',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rules', to='policies.policyset'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('policies', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='policyrule',
+            index=models.Index(fields=['policy_set', 'order'], name='policyrule_set_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='policyset',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at'], name='policyset_active_idx'),
+        ),
+    ]
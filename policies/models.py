@@ -1,3 +1,190 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from authentication.models import User
 
-# Create your models here.
+
+class PolicySet(models.Model):
+
+    COMBINING_CHOICES = [
+        ('deny_overrides', 'Deny Overrides'),
+        ('permit_overrides', 'Permit Overrides'),
+        ('first_applicable', 'First Applicable'),
+    ]
+
+    name = models.CharField(max_length=100)
+    description = models.TextField(blank=True, null=True)
+    combining_algorithm = models.CharField(
+        max_length=20,
+        choices=COMBINING_CHOICES,
+        default='deny_overrides'
+    )
+
+    # Activation
+    is_active = models.BooleanField(default=False, db_index=True)
+    version = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text="Assigned on activation; workers reload when it changes"
+    )
+    activated_at = models.DateTimeField(null=True, blank=True)
+
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='policy_sets'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # The policy store polls for the active version
+            models.Index(
+                fields=['-created_at'],
+                name='policyset_active_idx',
+                condition=Q(is_active=True),
+            ),
+        ]
+
+    def __str__(self):
+        state = f"v{self.version} ACTIVE" if self.is_active else "inactive"
+        return f"{self.name} ({state})"
+
+    def activate(self):
+        """
+        Makes this the only active policy set under a new version number
+        """
+        with transaction.atomic():
+            PolicySet.lock_versions()
+            PolicySet.objects.filter(is_active=True).exclude(pk=self.pk).update(
+                is_active=False
+            )
+            self.is_active = True
+            self.version = PolicySet.next_version()
+            self.activated_at = timezone.now()
+            self.save(update_fields=['is_active', 'version', 'activated_at'])
+
+    def republish(self):
+        """
+        Gives the active set a new version number after its rules or
+        conditions changed, so that every worker recompiles it
+        """
+        with transaction.atomic():
+            PolicySet.lock_versions()
+            self.version = PolicySet.next_version()
+            self.save(update_fields=['version'])
+
+    @staticmethod
+    def lock_versions():
+        """
+        Serializes version changes until the end of the transaction by
+        locking the versioned rows (a no-op on SQLite, whose writers
+        are serialized anyway)
+        """
+        list(
+            PolicySet.objects.select_for_update()
+            .filter(version__isnull=False).values_list('pk', flat=True)
+        )
+
+    @staticmethod
+    def next_version() -> int:
+        latest = PolicySet.objects.aggregate(latest=Max('version'))['latest']
+        return (latest or 0) + 1
+
+    def to_spec(self) -> dict:
+        """
+        Plain-dict form of the rule set, as consumed by the compiler
+        """
+        rules = self.rules.prefetch_related('conditions').order_by('order', 'id')
+        return {
+            'name': self.name,
+            'version': self.version,
+            'combining_algorithm': self.combining_algorithm,
+            'rules': [rule.to_spec() for rule in rules],
+        }
+
+
+class PolicyRule(models.Model):
+
+    EFFECT_CHOICES = [
+        ('permit', 'Permit'),
+        ('deny', 'Deny'),
+    ]
+
+    policy_set = models.ForeignKey(
+        PolicySet,
+        on_delete=models.CASCADE,
+        related_name='rules'
+    )
+    name = models.CharField(max_length=200)
+    description = models.CharField(
+        max_length=200,
+        blank=True,
+        help_text="Reason reported when this rule denies access"
+    )
+    effect = models.CharField(max_length=10, choices=EFFECT_CHOICES)
+    order = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['order', 'id']
+        indexes = [
+            models.Index(fields=['policy_set', 'order'], name='policyrule_set_order_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.policy_set.name} #{self.order} {self.effect}: {self.name}"
+
+    def to_spec(self) -> dict:
+        return {
+            'name': self.name,
+            'description': self.description,
+            'effect': self.effect,
+            'conditions': [c.to_spec() for c in self.conditions.all()],
+        }
+
+
+class PolicyCondition(models.Model):
+
+    OPERATOR_CHOICES = [
+        ('eq', 'Equals'),
+        ('ne', 'Not Equals'),
+        ('lt', 'Less Than'),
+        ('lte', 'Less Than or Equal'),
+        ('gt', 'Greater Than'),
+        ('gte', 'Greater Than or Equal'),
+        ('in', 'In'),
+        ('not_in', 'Not In'),
+        ('truthy', 'Is Set / True'),
+        ('falsy', 'Is Empty / False'),
+    ]
+
+    rule = models.ForeignKey(
+        PolicyRule,
+        on_delete=models.CASCADE,
+        related_name='conditions'
+    )
+
+    # e.g. "user.clearance_level", "resource.sensitivity_level",
+    # "environment.is_emergency"
+    attribute = models.CharField(max_length=100)
+    operator = models.CharField(max_length=10, choices=OPERATOR_CHOICES)
+
+    # Compare against either a literal or another attribute
+    value = models.JSONField(null=True, blank=True)
+    value_attribute = models.CharField(max_length=100, blank=True)
+
+    def __str__(self):
+        right = self.value_attribute or self.value
+        return f"{self.attribute} {self.operator} {right}"
+
+    def to_spec(self) -> dict:
+        return {
+            'attribute': self.attribute,
+            'operator': self.operator,
+            'value': self.value,
+            'value_attribute': self.value_attribute,
+        }
@@ -0,0 +1,64 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import PolicySet, PolicyRule, PolicyCondition
+from .store import policy_store
+
+
+@receiver(post_save, sender=PolicySet)
+@receiver(post_delete, sender=PolicySet)
+def reload_policy_store(sender, instance, **kwargs):
+    # Other workers pick the change up on their next poll
+    policy_store.invalidate()
+
+
+class Republish:
+    """
+    on_commit callback giving a policy set a new version if it is active
+    """
+
+    def __init__(self, policy_set_id):
+        self.policy_set_id = policy_set_id
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        active = PolicySet.objects.filter(
+            pk=self.policy_set_id, is_active=True
+        ).first()
+        if active is not None:
+            active.republish()
+
+
+def republish_on_commit(policy_set_id):
+    """
+    Republishes the set once when the transaction commits, however many
+    of its rules and conditions it saved (a rule and its inline
+    conditions in the admin are one transaction). Callbacks of a rolled
+    back transaction are dropped from run_on_commit, so they never
+    suppress a later one.
+    """
+    scheduled = any(
+        isinstance(callback, Republish)
+        and callback.policy_set_id == policy_set_id and not callback.done
+        for _, callback, *_ in transaction.get_connection().run_on_commit
+    )
+    if not scheduled:
+        transaction.on_commit(Republish(policy_set_id))
+
+
+@receiver(post_save, sender=PolicyRule)
+@receiver(post_delete, sender=PolicyRule)
+def republish_rule(sender, instance, **kwargs):
+    republish_on_commit(instance.policy_set_id)
+
+
+@receiver(post_save, sender=PolicyCondition)
+@receiver(post_delete, sender=PolicyCondition)
+def republish_condition(sender, instance, **kwargs):
+    policy_set_id = PolicyRule.objects.filter(pk=instance.rule_id).values_list(
+        'policy_set_id', flat=True
+    ).first()
+    if policy_set_id is not None:
+        republish_on_commit(policy_set_id)
@@ -1,3 +1,213 @@
-from django.test import TestCase
+from io import StringIO
+from itertools import product
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from authentication.models import User
+from engine.decision_cache import CachingPolicyEvaluator, DecisionCache
+from engine.policy_evaluator import PolicyEvaluator
+from .compiler import CompiledRuleSet
+from .defaults import builtin_rule_set
+from .models import PolicySet
+from .store import PolicyStore, StorePolicyEvaluator
+
+
+ROLES = [r for r, _ in User.ROLE_CHOICES] + ['visitor']
+LEVELS = [1, 2, 3, 4, 5]
+
+
+class BuiltinRuleSetTests(SimpleTestCase):
+
+    def test_matches_hard_coded_evaluator(self):
+        rule_set = CompiledRuleSet(builtin_rule_set())
+        evaluator = PolicyEvaluator()
+
+        for role, dept, clearance, authorized, is_emergency in product(
+            ROLES, ['cardiology', 'icu'], LEVELS, [True, False], [True, False]
+        ):
+            user_attrs = {
+                'role': role,
+                'department': dept,
+                'clearance_level': clearance,
+                'is_emergency_authorized': authorized,
+            }
+            env_attrs = {'is_emergency': is_emergency}
+            for required_dept, required, sensitivity, consent in product(
+                ['cardiology', None, ''], LEVELS, LEVELS, [True, False]
+            ):
+                resource_attrs = {
+                    'required_department': required_dept,
+                    'required_clearance_level': required,
+                    'sensitivity_level': sensitivity,
+                    'patient_consent': consent,
+                }
+                self.assertEqual(
+                    rule_set.evaluate(user_attrs, resource_attrs, env_attrs)['access_granted'],
+                    evaluator.evaluate(user_attrs, resource_attrs, env_attrs)['access_granted'],
+                )
+
+    def test_combining_algorithms(self):
+        rules = [
+            {'name': 'Deny nurses', 'effect': 'deny', 'conditions': [
+                {'attribute': 'user.role', 'operator': 'eq', 'value': 'nurse'},
+            ]},
+            {'name': 'Permit all', 'effect': 'permit', 'conditions': []},
+        ]
+        nurse = ({'role': 'nurse'}, {}, {})
+        expected = {
+            'deny_overrides': False,
+            'permit_overrides': True,
+            'first_applicable': False,
+        }
+        for algorithm, granted in expected.items():
+            rule_set = CompiledRuleSet({
+                'combining_algorithm': algorithm, 'rules': rules,
+            })
+            self.assertEqual(rule_set.evaluate(*nurse)['access_granted'], granted)
+
+        no_rules = CompiledRuleSet({'rules': []})
+        self.assertFalse(no_rules.evaluate(*nurse)['access_granted'])
+
+    def test_incomparable_attributes_fail_closed(self):
+        rules = [
+            {'name': 'Clearance too low', 'effect': 'deny', 'conditions': [
+                {'attribute': 'user.clearance_level', 'operator': 'lt',
+                 'value_attribute': 'resource.sensitivity_level'},
+            ]},
+            {'name': 'Senior staff', 'effect': 'permit', 'conditions': [
+                {'attribute': 'user.clearance_level', 'operator': 'gte', 'value': 4},
+            ]},
+            {'name': 'Permit all', 'effect': 'permit', 'conditions': []},
+        ]
+        # Missing clearance: the deny rule cannot be evaluated and applies,
+        # the permit rule that cannot be evaluated does not
+        missing = ({'role': 'doctor'}, {'sensitivity_level': 3}, {})
+        for algorithm in ('deny_overrides', 'first_applicable'):
+            rule_set = CompiledRuleSet({
+                'combining_algorithm': algorithm, 'rules': rules,
+            })
+            decision = rule_set.evaluate(*missing)
+            self.assertFalse(decision['access_granted'])
+            self.assertEqual(decision['reasons'], ['Clearance too low'])
+            self.assertNotIn('✅ Senior staff', decision['checks_passed'])
+
+
+class PolicyStoreTests(TestCase):
+
+    def setUp(self):
+        self.store = PolicyStore(reload_interval=0)
+        self.evaluator = StorePolicyEvaluator(store=self.store)
+
+    def test_activation_swaps_compiled_rule_set(self):
+        self.assertTrue(self.evaluator.builtin)
+
+        call_command('load_default_policy', '--activate', stdout=StringIO())
+        first = self.store.current()
+        self.assertEqual(self.store.version, 1)
+        self.assertFalse(self.evaluator.builtin)
+
+        # Nothing changed: the store keeps the compiled set
+        self.assertIs(self.store.current(), first)
+
+        restrictive = PolicySet.objects.create(name='Lockdown')
+        restrictive.activate()
+        self.assertEqual(self.evaluator.version, 2)
+        self.assertIsNot(self.store.current(), first)
+        self.assertFalse(self.evaluator.evaluate(
+            {'role': 'admin', 'clearance_level': 5}, {}, {}
+        )['access_granted'])
+        self.assertEqual(PolicySet.objects.filter(is_active=True).count(), 1)
+
+    def test_decision_cache_keys_on_extra_rule_attributes(self):
+        policy_set = PolicySet.objects.create(name='Cardiologists only')
+        rule = policy_set.rules.create(name='Specialists', effect='permit')
+        rule.conditions.create(
+            attribute='user.specialization', operator='eq', value='cardiology'
+        )
+        policy_set.activate()
+
+        cached = CachingPolicyEvaluator(self.evaluator, DecisionCache())
+        user_attrs = {'role': 'doctor', 'specialization': 'cardiology'}
+        self.assertTrue(cached.evaluate(user_attrs, {}, {})['access_granted'])
+        user_attrs = {'role': 'doctor', 'specialization': 'oncology'}
+        self.assertFalse(cached.evaluate(user_attrs, {}, {})['access_granted'])
+
+    def test_decision_cache_reads_one_snapshot(self):
+        specialists = PolicySet.objects.create(name='Cardiologists only')
+        specialists.rules.create(name='Specialists', effect='permit').conditions.create(
+            attribute='user.specialization', operator='eq', value='cardiology'
+        )
+        specialists.activate()
+        old = self.store.current()
+        PolicySet.objects.create(name='Lockdown').activate()
+        new = self.store.current()
+
+        cache = DecisionCache()
+        cached = CachingPolicyEvaluator(self.evaluator, cache)
+        # A publish lands right after the first read
+        with mock.patch.object(self.store, 'current', side_effect=[old, new, new, new]):
+            decision = cached.evaluate(
+                {'role': 'doctor', 'specialization': 'cardiology'}, {}, {}
+            )
+        self.assertTrue(decision['access_granted'])
+        self.assertEqual(cache.version, old.version)
+
+    def test_rule_edits_of_the_active_set_are_republished(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            policy_set = PolicySet.objects.create(name='Doctors')
+            rule = policy_set.rules.create(name='Doctors', effect='permit')
+            condition = rule.conditions.create(
+                attribute='user.role', operator='eq', value='doctor'
+            )
+        policy_set.activate()
+        self.assertTrue(self.evaluator.evaluate({'role': 'doctor'}, {}, {})['access_granted'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            condition.value = 'nurse'
+            condition.save()
+        self.assertEqual(self.evaluator.version, 2)
+        self.assertFalse(self.evaluator.evaluate({'role': 'doctor'}, {}, {})['access_granted'])
+        self.assertTrue(self.evaluator.evaluate({'role': 'nurse'}, {}, {})['access_granted'])
+
+        # One version for everything saved in one transaction
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            deny = policy_set.rules.create(name='Block nurses', effect='deny', order=1)
+            for value in ('nurse', 'Nurse'):
+                deny.conditions.create(attribute='user.role', operator='eq', value=value)
+            rule.delete()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.evaluator.version, 3)
+        self.assertFalse(self.evaluator.evaluate({'role': 'nurse'}, {}, {})['access_granted'])
+
+        # Rules of an inactive set do not touch versions
+        with self.captureOnCommitCallbacks(execute=True):
+            PolicySet.objects.create(name='Draft').rules.create(name='x', effect='permit')
+        self.assertEqual(PolicySet.objects.get(pk=policy_set.pk).version, 3)
+
+    def test_activation_between_poll_and_load(self):
+        first = PolicySet.objects.create(name='First')
+        first.activate()
+        second = PolicySet.objects.create(name='Second')
+
+        def poll_then_activate():
+            version = PolicySet.objects.filter(is_active=True).values_list(
+                'version', flat=True
+            ).first()
+            second.activate()
+            return version
+
+        with mock.patch.object(self.store, 'active_version', poll_then_activate):
+            self.store.refresh()
+        self.assertEqual(self.store.version, second.version)
+        self.assertEqual(self.store.current().name, 'Second')
+
+        def poll_then_deactivate():
+            PolicySet.objects.update(is_active=False)
+            return second.version + 1
+
+        with mock.patch.object(self.store, 'active_version', poll_then_deactivate):
+            self.store.refresh()
+        self.assertIsNone(self.store.version)
+        self.assertIsNone(self.store.compiled)